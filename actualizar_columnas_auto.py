@@ -2,6 +2,9 @@
 Script para actualizar la estructura de la base de datos automáticamente.
 Este script añade columnas de pagos mensuales para el año actual y el anterior a la tabla inquilinos.
 Está diseñado para ser ejecutado durante la inicialización de la aplicación.
+
+Obsoleto: los pagos se guardan ahora en la tabla pagos (ver migrar_pagos.py).
+Se mantiene solo para bases de datos que aún usan las columnas pago_MM_YYYY.
 """
 import logging
 from datetime import datetime
@@ -38,6 +41,7 @@ def actualizar_columnas_pagos(db):
         
         # Obtener las columnas existentes
         columnas_existentes = [col['name'] for col in inspector.get_columns('inquilinos')]
+        columnas_añadidas = False
         
         # Añadir columnas para el año actual
         for mes in range(1, 13):
@@ -48,6 +52,7 @@ def actualizar_columnas_pagos(db):
                 logger.info(f"Añadiendo columna {columna}...")
                 query = text(f"ALTER TABLE inquilinos ADD COLUMN {columna} VARCHAR(20) NOT NULL DEFAULT 'No pagado'")
                 db.session.execute(query)
+                columnas_añadidas = True
             else:
                 logger.info(f"La columna {columna} ya existe.")
         
@@ -60,11 +65,18 @@ def actualizar_columnas_pagos(db):
                 logger.info(f"Añadiendo columna {columna}...")
                 query = text(f"ALTER TABLE inquilinos ADD COLUMN {columna} VARCHAR(20) NOT NULL DEFAULT 'No pagado'")
                 db.session.execute(query)
+                columnas_añadidas = True
             else:
                 logger.info(f"La columna {columna} ya existe.")
         
+        # Las columnas pago_* cambiaron: los servidores en ejecución vuelven a reflejar el esquema
+        if columnas_añadidas:
+            from src.models.inquilino import marcar_cambio_columnas_pago
+            marcar_cambio_columnas_pago()
+        
         # Guardar cambios
         db.session.commit()
+        
         logger.info("Estructura de la base de datos actualizada correctamente.")
         return True
     
@@ -0,0 +1,15 @@
+"""
+Configuración de gunicorn (se carga automáticamente desde el directorio de trabajo).
+"""
+
+def post_worker_init(worker):
+    # Los hilos de fondo del servidor se inician en cada worker, no al importar src.main,
+    # para que los scripts que importan la aplicación no los pongan en marcha
+    from src.main import app
+    from src.services import auto_sync, renovacion_tokens
+
+    # Sincronización automática periódica de las cuentas (AUTO_SYNC=1)
+    auto_sync.iniciar(app)
+
+    # Renovación anticipada de los tokens OAuth guardados (TOKEN_REFRESH=0 para desactivarla)
+    renovacion_tokens.iniciar(app)
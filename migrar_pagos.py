@@ -0,0 +1,112 @@
+"""
+Script de migración única de las columnas pago_MM_YYYY de la tabla inquilinos a la tabla pagos.
+Copia cada celda con un estado distinto de 'No pagado' como una fila (inquilino_id, año, mes, estado).
+Es idempotente: los períodos que ya existen en la tabla pagos no se sobrescriben.
+
+Uso:
+    python migrar_pagos.py             # copia los datos
+    python migrar_pagos.py --eliminar  # copia los datos y elimina las columnas pago_* de inquilinos
+"""
+import re
+import sys
+import logging
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import SQLAlchemyError
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+PATRON_COLUMNA_PAGO = re.compile(r'^pago_(\d{2})_(\d{4})$')
+
+def migrar_columnas_pagos(db, eliminar_columnas=False):
+    """
+    Mueve los valores de las columnas pago_MM_YYYY a la tabla pagos.
+
+    Args:
+        db: Instancia de SQLAlchemy para la base de datos
+        eliminar_columnas (bool): Si es True, elimina las columnas legadas tras copiar los datos
+
+    Returns:
+        int: Número de pagos insertados, o -1 si la migración falló
+    """
+    from src.models.pago import Pago
+
+    try:
+        inspector = inspect(db.engine)
+
+        if 'inquilinos' not in inspector.get_table_names():
+            logger.warning("La tabla 'inquilinos' no existe. Nada que migrar.")
+            return 0
+
+        # Asegurar que la tabla pagos existe
+        Pago.__table__.create(bind=db.engine, checkfirst=True)
+
+        columnas = [col['name'] for col in inspector.get_columns('inquilinos') if PATRON_COLUMNA_PAGO.match(col['name'])]
+        if not columnas:
+            logger.info("No hay columnas pago_* en la tabla inquilinos. Nada que migrar.")
+            return 0
+
+        logger.info(f"Migrando {len(columnas)} columnas de pago a la tabla pagos")
+
+        # Períodos que ya están en la tabla pagos (no se sobrescriben)
+        existentes = {
+            (fila[0], fila[1], fila[2])
+            for fila in db.session.execute(text("SELECT inquilino_id, anio, mes FROM pagos"))
+        }
+
+        columns_str = ', '.join([f'"{col}"' for col in columnas])
+        filas = db.session.execute(text(f"SELECT id, {columns_str} FROM inquilinos")).fetchall()
+
+        nuevos = []
+        for fila in filas:
+            inquilino_id = fila[0]
+            for i, col in enumerate(columnas):
+                estado = fila[i + 1]
+                if not estado or estado == 'No pagado':
+                    continue
+
+                match = PATRON_COLUMNA_PAGO.match(col)
+                mes, año = int(match.group(1)), int(match.group(2))
+                if (inquilino_id, año, mes) in existentes:
+                    continue
+
+                nuevos.append({'inquilino_id': inquilino_id, 'anio': año, 'mes': mes, 'estado': estado})
+
+        if nuevos:
+            db.session.execute(Pago.__table__.insert(), nuevos)
+        logger.info(f"Se copiaron {len(nuevos)} pagos a la tabla pagos")
+
+        if eliminar_columnas:
+            for col in columnas:
+                logger.info(f"Eliminando columna {col}...")
+                db.session.execute(text(f'ALTER TABLE inquilinos DROP COLUMN "{col}"'))
+
+            # Las columnas pago_* cambiaron: los servidores en ejecución vuelven a reflejar el esquema
+            from src.models.inquilino import marcar_cambio_columnas_pago
+            marcar_cambio_columnas_pago()
+
+        # Guardar cambios
+        db.session.commit()
+
+        logger.info("Migración de pagos completada correctamente.")
+        return len(nuevos)
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Error al migrar las columnas de pago: {str(e)}")
+        return -1
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error inesperado al migrar las columnas de pago: {str(e)}")
+        return -1
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    from src.models.database import db
+    from src.main import app
+
+    with app.app_context():
+        resultado = migrar_columnas_pagos(db, eliminar_columnas='--eliminar' in sys.argv)
+
+    sys.exit(0 if resultado >= 0 else 1)
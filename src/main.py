@@ -34,6 +34,11 @@ logger.info(f"Usando base de datos: {database_url[:20]}...")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'clave-secreta-por-defecto')
 
+# Las credenciales de Gmail se guardan cifradas: sin una clave segura se arranca igual,
+# pero sin guardar credenciales en el servidor
+from src.services import credenciales_cuentas
+credenciales_cuentas.validar_clave()
+
 # Inicializar la base de datos
 db.init_app(app)
 
@@ -137,9 +142,23 @@ def diagnostico_db():
 with app.app_context():
     try:
         db.create_all()
+        
+        # create_all no añade índices a tablas que ya existían
+        from src.models.inquilino import Inquilino
+        for indice in Inquilino.__table__.indexes:
+            indice.create(bind=db.engine, checkfirst=True)
+        
         logger.info("Base de datos inicializada correctamente")
     except Exception as e:
         logger.error(f"Error al inicializar la base de datos: {str(e)}")
 
+# Validar client_secret.json al arrancar (queda en memoria para las rutas de autorización)
+from src.services import config_oauth
+config_oauth.validar()
+
 if __name__ == '__main__':
+    # Hilos de fondo del servidor (con gunicorn los inicia gunicorn.conf.py en cada worker)
+    from src.services import auto_sync, renovacion_tokens
+    auto_sync.iniciar(app)
+    renovacion_tokens.iniciar(app)
     app.run(debug=True)
@@ -1,3 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
 db = SQLAlchemy()
+
+def insert_con_conflicto(tabla):
+    """
+    INSERT de la tabla con soporte de ON CONFLICT (on_conflict_do_update) para el motor
+    en uso, o None si el motor no lo admite (solo PostgreSQL y SQLite lo tienen).
+    """
+    dialecto = db.session.get_bind().dialect.name
+    if dialecto == 'postgresql':
+        return postgresql.insert(tabla)
+    if dialecto == 'sqlite':
+        return sqlite.insert(tabla)
+    return None
@@ -1,10 +1,87 @@
-from sqlalchemy import text, inspect
+import os
+import uuid
+import time
+import threading
+from sqlalchemy import inspect
 from src.models.database import db
+from src.models.pago import Pago
+from src.models.configuracion import Configuracion
 from datetime import datetime
 
+# Clave en Configuracion de la versión del conjunto de columnas pago_*. Los scripts que
+# añaden o eliminan columnas la cambian (marcar_cambio_columnas_pago) y cada proceso
+# compara su caché con ella, así que ningún servidor sigue usando columnas eliminadas.
+CLAVE_VERSION_COLUMNAS = "version_columnas_pago"
+
+# Segundos durante los que se confía en la caché sin volver a consultar la versión. Una consulta
+# que falle antes por columnas eliminadas se reintenta tras invalidar la caché (ver listado_inquilinos).
+SEGUNDOS_VERSION_COLUMNAS = int(os.getenv('PAYMENT_COLUMNS_CHECK_SECONDS', '30'))
+
+# Caché (por proceso) de las columnas pago_* legadas de la tabla inquilinos:
+# (versión, columnas, instante de la última comprobación de la versión)
+_columnas_pago_cache = None
+_columnas_pago_lock = threading.Lock()
+
+def _version_columnas_pago():
+    return db.session.query(Configuracion.valor).filter_by(clave=CLAVE_VERSION_COLUMNAS).scalar()
+
+def obtener_columnas_pago():
+    """
+    Devuelve las columnas pago_* legadas de la tabla inquilinos.
+    La reflexión se hace una sola vez por proceso y se repite solo si cambió la versión
+    guardada en Configuracion, que se consulta como mucho cada SEGUNDOS_VERSION_COLUMNAS.
+    """
+    global _columnas_pago_cache
+
+    ahora = time.monotonic()
+    cache = _columnas_pago_cache
+    if cache is not None and ahora - cache[2] < SEGUNDOS_VERSION_COLUMNAS:
+        return cache[1]
+
+    version = _version_columnas_pago()
+    with _columnas_pago_lock:
+        if _columnas_pago_cache is not None and _columnas_pago_cache[0] == version:
+            _columnas_pago_cache = (version, _columnas_pago_cache[1], ahora)
+        else:
+            inspector = inspect(db.engine)
+            _columnas_pago_cache = (version, tuple(
+                col['name'] for col in inspector.get_columns('inquilinos') if col['name'].startswith('pago_')
+            ), ahora)
+        return _columnas_pago_cache[1]
+
+def invalidar_columnas_pago():
+    """Descarta la caché de columnas pago_* de este proceso para que se vuelva a reflejar el esquema."""
+    global _columnas_pago_cache
+    with _columnas_pago_lock:
+        _columnas_pago_cache = None
+
+def marcar_cambio_columnas_pago():
+    """
+    Cambia la versión de las columnas pago_* para que todos los procesos vuelvan a
+    reflejar el esquema. Debe llamarse en la misma transacción que el ALTER TABLE.
+    No hace commit.
+    """
+    version = uuid.uuid4().hex
+    config = Configuracion.query.filter_by(clave=CLAVE_VERSION_COLUMNAS).first()
+    if not config:
+        config = Configuracion(
+            clave=CLAVE_VERSION_COLUMNAS, valor=version,
+            descripcion="Versión de las columnas pago_* de inquilinos (cambia con cada ALTER TABLE)"
+        )
+        db.session.add(config)
+    else:
+        config.valor = version
+    invalidar_columnas_pago()
+
 class Inquilino(db.Model):
     __tablename__ = 'inquilinos'
-    
+    __table_args__ = (
+        # text_pattern_ops permite usar el índice en búsquedas por prefijo (LIKE 'abc%') en PostgreSQL
+        db.Index('ix_inquilinos_propietario', 'propietario', postgresql_ops={'propietario': 'text_pattern_ops'}),
+        db.Index('ix_inquilinos_propiedad', 'propiedad'),
+        db.Index('ix_inquilinos_monto', 'monto'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     propietario = db.Column(db.String(100), nullable=False)
     propiedad = db.Column(db.String(100), nullable=False)
@@ -12,9 +89,14 @@ class Inquilino(db.Model):
     monto = db.Column(db.Float, nullable=False)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     ultima_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
+
+    # Pagos mensuales normalizados (tabla pagos)
+    pagos = db.relationship('Pago', backref='inquilino', lazy='select', cascade='all, delete-orphan', passive_deletes=True)
+
     def to_dict(self):
-        # Versión base con campos estándar
+        # Solo la tabla pagos: las respuestas de la API usan listado_inquilinos, que además
+        # lee las columnas pago_* legadas en la misma consulta
+
         result = {
             'id': self.id,
             'propietario': self.propietario,
@@ -24,33 +106,10 @@ class Inquilino(db.Model):
             'fecha_creacion': self.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S'),
             'ultima_actualizacion': self.ultima_actualizacion.strftime('%Y-%m-%d %H:%M:%S')
         }
-        
-        # Método 1: Usar __dict__ (enfoque actual)
-        for key, value in self.__dict__.items():
-            # Solo incluir columnas de pagos y evitar atributos internos de SQLAlchemy
-            if isinstance(key, str) and key.startswith('pago_') and not key.startswith('_'):
-                result[key] = value
-        
-        # Método 2: Consulta directa a la base de datos para asegurar que se incluyan todas las columnas de pago
-        try:
-            # Obtener todas las columnas de la tabla que empiezan con 'pago_'
-            inspector = inspect(db.engine)
-            columnas = [col['name'] for col in inspector.get_columns('inquilinos') if col['name'].startswith('pago_')]
-            
-            if columnas:
-                # Consultar los valores de las columnas de pago para este inquilino
-                columns_str = ', '.join([f'"{col}"' for col in columnas])
-                query = text(f"SELECT {columns_str} FROM inquilinos WHERE id = :id")
-                row = db.session.execute(query, {'id': self.id}).fetchone()
-                
-                if row:
-                    # Añadir las columnas de pago al resultado
-                    for i, col in enumerate(columnas):
-                        # Solo sobrescribir si no existe o es None
-                        if col not in result or result[col] is None:
-                            result[col] = row[i]
-        except Exception as e:
-            # Si hay algún error, registrarlo pero continuar con el método 1
-            print(f"Error al obtener columnas dinámicas: {e}")
-        
+
+        # Pagos de la tabla pagos, expuestos con el nombre de columna legado
+        # (pago_MM_YYYY) para mantener el formato que espera el frontend
+        for pago in self.pagos:
+            result[pago.columna] = pago.estado
+
         return result
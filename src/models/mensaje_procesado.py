@@ -0,0 +1,150 @@
+"""
+Modelo para registrar los correos de Gmail que ya fueron procesados por la sincronización.
+"""
+from sqlalchemy import bindparam
+from src.models.database import db, insert_con_conflicto
+from datetime import datetime
+
+# Máximo de valores por cláusula IN en las consultas por lotes
+TAMANO_CONSULTA = 500
+
+# Columnas que se escriben al registrar (o volver a registrar) un correo
+CAMPOS_RESULTADO = ('resultado', 'inquilino_id', 'anio', 'mes', 'motivo', 'fecha_procesado')
+
+class MensajeProcesado(db.Model):
+    """
+    Resultado del procesamiento de un correo de Gmail, identificado por su id de mensaje.
+    La sincronización consulta esta tabla antes de descargar un correo para no repetir
+    el trabajo con correos ya procesados.
+    """
+    __tablename__ = 'mensajes_procesados'
+
+    # Resultados posibles
+    PAGADO = 'pagado'
+    SIN_MATCH = 'sin_match'
+    SIN_DATOS = 'sin_datos'
+
+    id = db.Column(db.String(64), primary_key=True)  # Id del mensaje en Gmail
+    resultado = db.Column(db.String(20), nullable=False)
+    inquilino_id = db.Column(db.Integer, db.ForeignKey('inquilinos.id', ondelete='SET NULL'), nullable=True)
+    año = db.Column('anio', db.Integer, nullable=True)
+    mes = db.Column(db.Integer, nullable=True)
+    motivo = db.Column(db.String(255), nullable=True)
+    fecha_procesado = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<MensajeProcesado {self.id} {self.resultado}>"
+
+    @classmethod
+    def ids_procesados(cls, ids):
+        """
+        Devuelve cuáles de los ids indicados ya están registrados, en una sola consulta.
+
+        Args:
+            ids (list): Ids de mensajes de Gmail
+
+        Returns:
+            set: Ids ya procesados
+        """
+        if not ids:
+            return set()
+        return {fila[0] for fila in db.session.query(cls.id).filter(cls.id.in_(ids))}
+
+    @classmethod
+    def registrar(cls, message_id, resultado, inquilino_id=None, año=None, mes=None, motivo=None):
+        """
+        Registra (o actualiza, si se reprocesa) el resultado de un correo.
+        No hace commit: la transacción la controla quien llama.
+        """
+        registro = db.session.get(cls, message_id)
+        if not registro:
+            registro = cls(id=message_id)
+            db.session.add(registro)
+
+        registro.resultado = resultado
+        registro.inquilino_id = inquilino_id
+        registro.año = año
+        registro.mes = mes
+        registro.motivo = motivo[:255] if motivo else None
+        return registro
+
+    @classmethod
+    def registrar_lote(cls, registros):
+        """
+        Registra varios resultados con un único INSERT ... ON CONFLICT DO UPDATE
+        (executemany), de modo que dos sincronizaciones simultáneas que registran el mismo
+        correo no chocan con la clave primaria. En motores sin ON CONFLICT se usa un UPDATE
+        para los ids ya registrados y un INSERT para los nuevos.
+        No hace commit: la transacción la controla quien llama.
+
+        Args:
+            registros (list): Diccionarios con id y resultado, y opcionalmente
+                inquilino_id, año, mes y motivo
+
+        Returns:
+            int: Número de registros escritos
+        """
+        # Si un id aparece varias veces, vale el último resultado
+        por_id = {registro['id']: registro for registro in registros}
+        if not por_id:
+            return 0
+
+        ahora = datetime.utcnow()
+        filas = {
+            message_id: {
+                'resultado': registro['resultado'],
+                'inquilino_id': registro.get('inquilino_id'),
+                'anio': registro.get('año'),
+                'mes': registro.get('mes'),
+                'motivo': registro['motivo'][:255] if registro.get('motivo') else None,
+                'fecha_procesado': ahora
+            }
+            for message_id, registro in por_id.items()
+        }
+
+        tabla = cls.__table__
+        insercion = insert_con_conflicto(tabla)
+        if insercion is not None:
+            db.session.execute(
+                insercion.on_conflict_do_update(
+                    index_elements=[tabla.c.id],
+                    set_={campo: insercion.excluded[campo] for campo in CAMPOS_RESULTADO}
+                ),
+                [dict(fila, id=message_id) for message_id, fila in filas.items()]
+            )
+            return len(filas)
+
+        ids = list(filas)
+        existentes = set()
+        for i in range(0, len(ids), TAMANO_CONSULTA):
+            existentes |= cls.ids_procesados(ids[i:i + TAMANO_CONSULTA])
+
+        actualizaciones = []
+        inserciones = []
+        for message_id, fila in filas.items():
+            if message_id in existentes:
+                actualizaciones.append(dict({f'b_{campo}': valor for campo, valor in fila.items()}, b_id=message_id))
+            else:
+                inserciones.append(dict(fila, id=message_id))
+
+        if actualizaciones:
+            db.session.execute(
+                tabla.update().where(tabla.c.id == bindparam('b_id')).values(
+                    {campo: bindparam(f'b_{campo}') for campo in CAMPOS_RESULTADO}
+                ),
+                actualizaciones
+            )
+        if inserciones:
+            db.session.execute(tabla.insert(), inserciones)
+        return len(por_id)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'resultado': self.resultado,
+            'inquilino_id': self.inquilino_id,
+            'año': self.año,
+            'mes': self.mes,
+            'motivo': self.motivo,
+            'fecha_procesado': self.fecha_procesado.strftime('%Y-%m-%d %H:%M:%S') if self.fecha_procesado else None
+        }
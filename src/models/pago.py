@@ -0,0 +1,166 @@
+"""
+Modelo para almacenar el estado de pago mensual de cada inquilino.
+"""
+from sqlalchemy import select, bindparam, func
+from src.models.database import db, insert_con_conflicto
+from datetime import datetime
+
+# Máximo de valores por cláusula IN en las consultas por lotes
+TAMANO_CONSULTA = 500
+
+class Pago(db.Model):
+    """
+    Estado de pago de un inquilino para un período (año, mes).
+
+    Reemplaza las columnas dinámicas pago_MM_YYYY de la tabla inquilinos:
+    cada período es una fila, por lo que un mes nuevo no requiere ALTER TABLE.
+    La ausencia de fila equivale a 'No pagado'.
+    """
+    __tablename__ = 'pagos'
+    __table_args__ = (
+        db.UniqueConstraint('inquilino_id', 'anio', 'mes', name='uq_pagos_inquilino_periodo'),
+        db.Index('ix_pagos_periodo_estado', 'anio', 'mes', 'estado'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    inquilino_id = db.Column(db.Integer, db.ForeignKey('inquilinos.id', ondelete='CASCADE'), nullable=False)
+    año = db.Column('anio', db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='Pagado')
+    monto = db.Column(db.Float, nullable=True)
+    comprobante = db.Column(db.String(50), nullable=True)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Pago {self.inquilino_id} {self.mes:02d}/{self.año} {self.estado}>"
+
+    @property
+    def columna(self):
+        """Nombre de la columna legada equivalente (pago_MM_YYYY)."""
+        return f"pago_{self.mes:02d}_{self.año}"
+
+    @classmethod
+    def registrar(cls, inquilino_id, año, mes, estado='Pagado', monto=None, comprobante=None):
+        """
+        Crea o actualiza el pago de un inquilino para un período.
+        No hace commit: la transacción la controla quien llama.
+
+        Returns:
+            Pago: Registro creado o actualizado
+        """
+        pago = cls.query.filter_by(inquilino_id=inquilino_id, año=año, mes=mes).first()
+        if not pago:
+            pago = cls(inquilino_id=inquilino_id, año=año, mes=mes)
+            db.session.add(pago)
+
+        pago.estado = estado
+        if monto is not None:
+            pago.monto = monto
+        if comprobante is not None:
+            pago.comprobante = comprobante
+        return pago
+
+    @classmethod
+    def registrar_lote(cls, pagos, estado='Pagado'):
+        """
+        Crea o actualiza varios pagos con sentencias por lotes: una consulta para saber
+        qué períodos ya existen y un INSERT ... ON CONFLICT DO UPDATE (executemany) sobre
+        la restricción única del período, de modo que dos sincronizaciones simultáneas
+        que registran el mismo pago no chocan entre sí. En motores sin ON CONFLICT se usa
+        un UPDATE para los períodos existentes y un INSERT para el resto. Equivale a
+        llamar a registrar() para cada pago en orden. No hace commit: la transacción la
+        controla quien llama.
+
+        Args:
+            pagos (list): Diccionarios con inquilino_id, año, mes y opcionalmente monto y comprobante
+            estado (str): Estado a registrar
+
+        Returns:
+            tuple: (pagos insertados, pagos actualizados)
+        """
+        # Un mismo período puede aparecer varias veces: se combinan en orden,
+        # sin que un valor None borre uno anterior (igual que registrar())
+        combinados = {}
+        for pago in pagos:
+            valores = combinados.setdefault((pago['inquilino_id'], pago['año'], pago['mes']), {'monto': None, 'comprobante': None})
+            for campo in ('monto', 'comprobante'):
+                if pago.get(campo) is not None:
+                    valores[campo] = pago[campo]
+        if not combinados:
+            return 0, 0
+
+        tabla = cls.__table__
+        años = {año for _, año, _ in combinados}
+        ids = sorted({inquilino_id for inquilino_id, _, _ in combinados})
+        existentes = {}
+        for i in range(0, len(ids), TAMANO_CONSULTA):
+            consulta = select(tabla.c.id, tabla.c.inquilino_id, tabla.c.anio, tabla.c.mes).where(
+                tabla.c.inquilino_id.in_(ids[i:i + TAMANO_CONSULTA]), tabla.c.anio.in_(años)
+            )
+            for fila in db.session.execute(consulta):
+                existentes[(fila.inquilino_id, fila.anio, fila.mes)] = fila.id
+
+        ahora = datetime.utcnow()
+        insercion = insert_con_conflicto(tabla)
+        if insercion is not None:
+            db.session.execute(
+                insercion.on_conflict_do_update(
+                    index_elements=[tabla.c.inquilino_id, tabla.c.anio, tabla.c.mes],
+                    set_={
+                        'estado': insercion.excluded.estado,
+                        'monto': func.coalesce(insercion.excluded.monto, tabla.c.monto),
+                        'comprobante': func.coalesce(insercion.excluded.comprobante, tabla.c.comprobante),
+                        'fecha_actualizacion': insercion.excluded.fecha_actualizacion
+                    }
+                ),
+                [
+                    {
+                        'inquilino_id': inquilino_id, 'anio': año, 'mes': mes, 'estado': estado,
+                        'monto': valores['monto'], 'comprobante': valores['comprobante'], 'fecha_actualizacion': ahora
+                    }
+                    for (inquilino_id, año, mes), valores in combinados.items()
+                ]
+            )
+            actualizados = sum(1 for periodo in combinados if periodo in existentes)
+            return len(combinados) - actualizados, actualizados
+
+        actualizaciones = []
+        inserciones = []
+        for (inquilino_id, año, mes), valores in combinados.items():
+            if (inquilino_id, año, mes) in existentes:
+                actualizaciones.append({
+                    'b_id': existentes[(inquilino_id, año, mes)],
+                    'b_monto': valores['monto'],
+                    'b_comprobante': valores['comprobante']
+                })
+            else:
+                inserciones.append({
+                    'inquilino_id': inquilino_id, 'anio': año, 'mes': mes, 'estado': estado,
+                    'monto': valores['monto'], 'comprobante': valores['comprobante'], 'fecha_actualizacion': ahora
+                })
+
+        if actualizaciones:
+            db.session.execute(
+                tabla.update().where(tabla.c.id == bindparam('b_id')).values(
+                    estado=estado,
+                    monto=func.coalesce(bindparam('b_monto', type_=db.Float), tabla.c.monto),
+                    comprobante=func.coalesce(bindparam('b_comprobante', type_=db.String), tabla.c.comprobante),
+                    fecha_actualizacion=ahora
+                ),
+                actualizaciones
+            )
+        if inserciones:
+            db.session.execute(tabla.insert(), inserciones)
+        return len(inserciones), len(actualizaciones)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'inquilino_id': self.inquilino_id,
+            'año': self.año,
+            'mes': self.mes,
+            'estado': self.estado,
+            'monto': self.monto,
+            'comprobante': self.comprobante,
+            'fecha_actualizacion': self.fecha_actualizacion.strftime('%Y-%m-%d %H:%M:%S') if self.fecha_actualizacion else None
+        }
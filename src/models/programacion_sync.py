@@ -0,0 +1,43 @@
+"""
+Modelo para la sincronización automática periódica de cada cuenta.
+"""
+from src.models.database import db
+from datetime import datetime
+
+class ProgramacionSync(db.Model):
+    """
+    Programación de la sincronización automática de una cuenta (tabla users).
+    en_curso se marca con un UPDATE condicional al reclamar la ejecución, de modo que
+    una cuenta no se sincroniza dos veces a la vez aunque haya varios workers.
+    """
+    __tablename__ = 'programaciones_sync'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, unique=True)
+    activa = db.Column(db.Boolean, nullable=False, default=True)
+    intervalo_minutos = db.Column(db.Integer, nullable=False, default=60)
+    proxima_ejecucion = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    en_curso = db.Column(db.Boolean, nullable=False, default=False)
+    inicio_ejecucion = db.Column(db.DateTime, nullable=True)
+    ultima_ejecucion = db.Column(db.DateTime, nullable=True)
+    ultimo_resultado = db.Column(db.Text, nullable=True)
+
+    user = db.relationship('User', backref=db.backref('programacion_sync', uselist=False))
+
+    def __repr__(self):
+        return f"<ProgramacionSync user={self.user_id} cada {self.intervalo_minutos} min>"
+
+    def to_dict(self):
+        formato = '%Y-%m-%d %H:%M:%S'
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'email': self.user.email if self.user else None,
+            'activa': self.activa,
+            'intervalo_minutos': self.intervalo_minutos,
+            'proxima_ejecucion': self.proxima_ejecucion.strftime(formato) if self.proxima_ejecucion else None,
+            'en_curso': self.en_curso,
+            'ultima_ejecucion': self.ultima_ejecucion.strftime(formato) if self.ultima_ejecucion else None,
+            'last_sync': self.user.last_sync.strftime(formato) if self.user and self.user.last_sync else None,
+            'ultimo_resultado': self.ultimo_resultado
+        }
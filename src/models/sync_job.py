@@ -0,0 +1,62 @@
+"""
+Modelo para las sincronizaciones de correos que se ejecutan en segundo plano.
+"""
+import json
+import uuid
+from src.models.database import db
+from datetime import datetime
+
+class SyncJob(db.Model):
+    """
+    Estado y progreso de una sincronización en segundo plano.
+    Se guarda en la base de datos para que cualquier worker pueda informar su estado.
+    """
+    __tablename__ = 'sync_jobs'
+
+    # Estados posibles
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    COMPLETADO = 'completado'
+    ERROR = 'error'
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    estado = db.Column(db.String(20), nullable=False, default=PENDIENTE, index=True)
+    cuenta = db.Column(db.String(100), nullable=True, index=True)  # None: todas las cuentas
+    parametros = db.Column(db.Text, nullable=True)  # JSON, sin credenciales
+    modo = db.Column(db.String(20), nullable=True)
+    emails_procesados = db.Column(db.Integer, nullable=False, default=0)
+    pagos_actualizados = db.Column(db.Integer, nullable=False, default=0)
+    emails_omitidos = db.Column(db.Integer, nullable=False, default=0)
+    mensaje = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    fecha_sincronizacion = db.Column(db.String(40), nullable=True)  # Valor devuelto por sync_emails
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_inicio = db.Column(db.DateTime, nullable=True)
+    fecha_fin = db.Column(db.DateTime, nullable=True)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SyncJob {self.id} {self.estado}>"
+
+    @property
+    def terminado(self):
+        return self.estado in (self.COMPLETADO, self.ERROR)
+
+    def to_dict(self):
+        formato = '%Y-%m-%d %H:%M:%S'
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'cuenta': self.cuenta,
+            'parametros': json.loads(self.parametros) if self.parametros else {},
+            'modo': self.modo,
+            'emails_procesados': self.emails_procesados,
+            'pagos_actualizados': self.pagos_actualizados,
+            'emails_omitidos': self.emails_omitidos,
+            'mensaje': self.mensaje,
+            'error': self.error,
+            'fecha_sincronizacion': self.fecha_sincronizacion,
+            'fecha_creacion': self.fecha_creacion.strftime(formato) if self.fecha_creacion else None,
+            'fecha_inicio': self.fecha_inicio.strftime(formato) if self.fecha_inicio else None,
+            'fecha_fin': self.fecha_fin.strftime(formato) if self.fecha_fin else None
+        }
@@ -0,0 +1,25 @@
+"""
+Modelo para guardar en el servidor los tokens OAuth de Gmail de cada cuenta.
+"""
+from src.models.database import db
+from datetime import datetime
+
+class TokenOAuth(db.Model):
+    """
+    Credenciales OAuth de Gmail de una cuenta (tabla users), cifradas con Fernet.
+    La expiración se guarda sin cifrar para que la renovación anticipada pueda
+    buscar los tokens próximos a vencer con una consulta.
+    """
+    __tablename__ = 'tokens_oauth'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, unique=True)
+    token_cifrado = db.Column(db.Text, nullable=False)
+    expiracion = db.Column(db.DateTime, nullable=True, index=True)  # UTC
+    inicio_renovacion = db.Column(db.DateTime, nullable=True)  # Renovación reclamada por un worker (UTC)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('token_oauth', uselist=False))
+
+    def __repr__(self):
+        return f"<TokenOAuth user={self.user_id}>"
@@ -9,6 +9,19 @@ class User(db.Model):
     name = db.Column(db.String(100), nullable=True)
     last_sync = db.Column(db.DateTime, nullable=True)
     
+    @classmethod
+    def registrar_sync(cls, email, fecha=None):
+        """
+        Registra la fecha de sincronización de una cuenta, creando el usuario si no existe.
+        No hace commit: la transacción la controla quien llama.
+        """
+        user = cls.query.filter_by(email=email).first()
+        if not user:
+            user = cls(email=email)
+            db.session.add(user)
+        user.last_sync = fecha or datetime.utcnow()
+        return user
+    
     def to_dict(self):
         return {
             'id': self.id,
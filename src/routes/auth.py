@@ -4,6 +4,7 @@ Rutas para la autenticación con Google OAuth2.
 
 from flask import Blueprint, redirect, request, url_for, session, jsonify
 from src.services.gmail_service_real import GmailServiceReal
+from src.services.sync_service import SyncService
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -31,9 +32,10 @@ def callback():
     if not auth_code:
         return jsonify({"error": "No se recibió código de autorización"}), 400
     
-    gmail_service = GmailServiceReal()
-    credentials = gmail_service.get_token(auth_code)
-    session['credentials'] = credentials
+    # Las credenciales se guardan cifradas en el servidor; la sesión solo guarda la cuenta
+    cuenta = SyncService().process_auth_callback(auth_code)
+    session['cuenta'] = cuenta
+    session.permanent = True
     success = True
     
     if success:
@@ -50,7 +52,7 @@ def status():
         JSON con el estado de autenticación.
     """
     is_authenticated = False
-    if 'credentials' in session:
+    if 'cuenta' in session:
         is_authenticated = True
     
     return jsonify({
@@ -65,7 +67,7 @@ def logout():
     Returns:
         Redirección a la página principal.
     """
-    if 'credentials' in session:
-        del session['credentials']
+    if 'cuenta' in session:
+        del session['cuenta']
     
     return redirect('/')
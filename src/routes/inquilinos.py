@@ -1,17 +1,82 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, abort
 from src.models.inquilino import Inquilino, db
+from src.models.pago import Pago
+from src.services.listado_inquilinos import iterar_inquilinos, obtener_inquilino, generar_json, generar_json_pagina, ESTADOS_PAGO
+from src.services.version_datos import calcular_etag, respuesta_no_modificada
 
 inquilinos_bp = Blueprint('inquilinos', __name__)
 
+# Máximo de inquilinos por página en el listado paginado
+LIMITE_MAXIMO = 500
+
+def _parametros_listado(args):
+    """
+    Lee los filtros y la paginación del listado desde los parámetros de la URL.
+    
+    Returns:
+        tuple: (filtros, cursor, limite)
+        
+    Raises:
+        ValueError: Si algún parámetro tiene un formato inválido
+    """
+    filtros = {
+        'propietario': args.get('propietario'),
+        'propiedad': args.get('propiedad'),
+        'monto_min': args.get('monto_min', type=float),
+        'monto_max': args.get('monto_max', type=float),
+        'estado': args.get('estado')
+    }
+    
+    if filtros['estado']:
+        if filtros['estado'] not in ESTADOS_PAGO:
+            raise ValueError(f"Estado inválido, debe ser uno de: {', '.join(ESTADOS_PAGO)}")
+        mes = args.get('mes', type=int)
+        año = args.get('año', type=int) or args.get('anio', type=int)
+        if not mes or not año or mes < 1 or mes > 12:
+            raise ValueError("El filtro por estado requiere mes (1-12) y año")
+        filtros['mes'] = mes
+        filtros['año'] = año
+    
+    cursor = args.get('cursor', type=int)
+    limite = args.get('limit', type=int)
+    if limite is not None and (limite < 1 or limite > LIMITE_MAXIMO):
+        raise ValueError(f"limit debe estar entre 1 y {LIMITE_MAXIMO}")
+    
+    return filtros, cursor, limite
+
 @inquilinos_bp.route('/', methods=['GET'])
 def get_inquilinos():
-    inquilinos = Inquilino.query.all()
-    return jsonify([inquilino.to_dict() for inquilino in inquilinos])
+    try:
+        filtros, cursor, limite = _parametros_listado(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # ETag según la versión de los datos y los parámetros de la consulta
+    # (se ignora el parámetro 't' que el frontend usaba para evitar la caché)
+    parametros = sorted((k, v) for k, v in request.args.items(multi=True) if k != 't')
+    etag = calcular_etag(request.path, parametros)
+    no_modificada = respuesta_no_modificada(etag)
+    if no_modificada is not None:
+        return no_modificada
+    
+    # Listado masivo: una consulta, filas serializadas directamente a JSON por fragmentos
+    filas = iterar_inquilinos(filtros, cursor=cursor, limite=limite)
+    if limite is None:
+        # Sin paginación se mantiene el formato original (array de inquilinos)
+        cuerpo = generar_json(filas)
+    else:
+        cuerpo = generar_json_pagina(filas, limite)
+    
+    respuesta = Response(stream_with_context(cuerpo), mimetype='application/json')
+    respuesta.set_etag(etag)
+    return respuesta
 
 @inquilinos_bp.route('/<int:id>', methods=['GET'])
 def get_inquilino(id):
-    inquilino = Inquilino.query.get_or_404(id)
-    return jsonify(inquilino.to_dict())
+    inquilino = obtener_inquilino(id)
+    if inquilino is None:
+        abort(404)
+    return jsonify(inquilino)
 
 @inquilinos_bp.route('/', methods=['POST'])
 def create_inquilino():
@@ -27,7 +92,7 @@ def create_inquilino():
     db.session.add(nuevo_inquilino)
     db.session.commit()
     
-    return jsonify(nuevo_inquilino.to_dict()), 201
+    return jsonify(obtener_inquilino(nuevo_inquilino.id)), 201
 
 @inquilinos_bp.route('/<int:id>', methods=['PUT'])
 def update_inquilino(id):
@@ -41,13 +106,46 @@ def update_inquilino(id):
     
     db.session.commit()
     
-    return jsonify(inquilino.to_dict())
+    return jsonify(obtener_inquilino(id))
 
 @inquilinos_bp.route('/<int:id>', methods=['DELETE'])
 def delete_inquilino(id):
     inquilino = Inquilino.query.get_or_404(id)
     
+    # Borrar los pagos explícitamente: la relación usa passive_deletes y SQLite no aplica
+    # el ON DELETE CASCADE si no se activan las claves foráneas
+    Pago.query.filter_by(inquilino_id=id).delete(synchronize_session=False)
     db.session.delete(inquilino)
     db.session.commit()
     
     return jsonify({"message": "Inquilino eliminado correctamente"}), 200
+
+@inquilinos_bp.route('/<int:id>/pagos', methods=['GET'])
+def get_pagos_inquilino(id):
+    Inquilino.query.get_or_404(id)
+    pagos = Pago.query.filter_by(inquilino_id=id).order_by(Pago.año, Pago.mes).all()
+    return jsonify([pago.to_dict() for pago in pagos])
+
+@inquilinos_bp.route('/<int:id>/pagos/<int:anio>/<int:mes>', methods=['PUT'])
+def update_pago_inquilino(id, anio, mes):
+    Inquilino.query.get_or_404(id)
+    data = request.json or {}
+    
+    if mes < 1 or mes > 12:
+        return jsonify({"error": "Mes inválido"}), 400
+    
+    estado = data.get('estado', 'Pagado')
+    if estado not in ESTADOS_PAGO:
+        return jsonify({"error": f"Estado inválido, debe ser uno de: {', '.join(ESTADOS_PAGO)}"}), 400
+    
+    pago = Pago.registrar(
+        id,
+        anio,
+        mes,
+        estado=estado,
+        monto=data.get('monto'),
+        comprobante=data.get('comprobante')
+    )
+    db.session.commit()
+    
+    return jsonify(pago.to_dict())
@@ -1,13 +1,19 @@
 """
 Modificación de la ruta de sincronización para soportar el parámetro de año.
 """
-from flask import Blueprint, request, jsonify, session, redirect, url_for
+from flask import Blueprint, request, jsonify, session, redirect, current_app
 import logging
-import os
-import json
+from datetime import timedelta
+from functools import wraps
+from urllib.parse import quote
 from src.services.sync_service import SyncService
-from src.models.configuracion import Configuracion
+from src.services import sync_jobs
+from src.models.sync_job import SyncJob
+from src.models.user import User
+from src.models.programacion_sync import ProgramacionSync
+from src.services import credenciales_cuentas, config_oauth
 from src.models.database import db
+from src.services.version_datos import calcular_etag, respuesta_no_modificada
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -17,10 +23,40 @@ logger = logging.getLogger(__name__)
 sync_bp = Blueprint('sync', __name__)
 sync_service = SyncService()
 
+def _respuesta_sin_sesion():
+    return jsonify({
+        'error': 'No hay una sesión autorizada',
+        'mensaje': 'Es necesario autorizar el acceso a Gmail',
+        'requiere_autorizacion': True
+    }), 401
+
+def _respuesta_en_curso(job_id):
+    # job_id es None si la cuenta la está sincronizando la sincronización automática
+    return jsonify({
+        'error': 'Ya hay una sincronización en curso',
+        'mensaje': 'Espera a que termine la sincronización en curso',
+        'job_id': job_id
+    }), 409
+
+def requiere_sesion(vista):
+    """
+    Restringe la ruta a sesiones en las que se autorizó una cuenta de Gmail
+    (session['cuenta'], guardada en el callback de OAuth).
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if not session.get('cuenta'):
+            return _respuesta_sin_sesion()
+        return vista(*args, **kwargs)
+    return envoltura
+
 @sync_bp.route('/api/sync/emails', methods=['POST'])
+@requiere_sesion
 def sync_emails():
     """
-    Sincroniza los correos electrónicos con Gmail y actualiza el estado de pago.
+    Encola la sincronización de los correos con Gmail y responde de inmediato (202)
+    con el id del trabajo; el progreso se consulta en /api/sync/jobs/<id>.
+    Todos los modos escriben pagos (también desde_cache), así que todos requieren sesión.
     """
     try:
         data = request.json
@@ -28,28 +64,185 @@ def sync_emails():
             return jsonify({'error': 'No se proporcionaron datos', 'mensaje': 'Datos de solicitud vacíos'}), 400
         
         credentials = data.get('credentials')
+        cuenta = data.get('cuenta')  # Cuenta con credenciales guardadas en el servidor
         mes = data.get('mes')
         año = data.get('año')  # Nuevo parámetro para el año
+        completo = bool(data.get('completo'))  # Ignorar el historyId y recorrer todo el buzón
+        reprocesar = bool(data.get('reprocesar'))  # Volver a procesar correos ya procesados
+        desde_cache = bool(data.get('desde_cache'))  # Procesar solo la caché local, sin Gmail
+        muestreo_traza = data.get('muestreo_traza')  # Fracción de correos con traza detallada (0 a 1)
         
-        if not credentials:
-            return jsonify({'error': 'No se proporcionaron credenciales', 'mensaje': 'Credenciales no encontradas en la solicitud'}), 400
+        if muestreo_traza is not None:
+            try:
+                muestreo_traza = float(muestreo_traza)
+            except (TypeError, ValueError):
+                muestreo_traza = -1
+            if not 0 <= muestreo_traza <= 1:
+                return jsonify({'error': 'muestreo_traza inválido', 'mensaje': 'El muestreo de la traza debe estar entre 0 y 1'}), 400
         
-        logger.info(f"Iniciando sincronización de correos para el mes: {mes}, año: {año}")
-        result = sync_service.sync_emails(credentials, mes, año)
-        return jsonify(result)
+        if not credentials and not desde_cache:
+            # Las credenciales guardadas solo se usan para la cuenta autorizada en esta sesión
+            cuenta_sesion = session['cuenta']
+            if cuenta and cuenta.lower() != cuenta_sesion.lower():
+                return jsonify({
+                    'error': 'La cuenta no corresponde a la sesión',
+                    'mensaje': 'Solo se puede sincronizar la cuenta autorizada en esta sesión',
+                    'requiere_autorizacion': True
+                }), 403
+            if not credenciales_cuentas.disponible():
+                return jsonify({
+                    'error': 'Credenciales guardadas desactivadas',
+                    'mensaje': 'El servidor no tiene una clave de cifrado (TOKEN_ENCRYPTION_KEY) para guardar credenciales'
+                }), 503
+            credentials = credenciales_cuentas.obtener(cuenta_sesion)
+            if not credentials:
+                return jsonify({
+                    'error': 'No hay credenciales guardadas para la cuenta',
+                    'mensaje': 'Es necesario autorizar el acceso a Gmail',
+                    'requiere_autorizacion': True
+                }), 401
+        
+        logger.info(f"Encolando sincronización de correos para el mes: {mes}, año: {año}")
+        parametros = {'mes': mes, 'año': año, 'completo': completo, 'reprocesar': reprocesar, 'desde_cache': desde_cache}
+        if muestreo_traza is not None:
+            parametros['muestreo_traza'] = muestreo_traza
+        try:
+            job = sync_jobs.encolar(current_app._get_current_object(), session['cuenta'], credentials, parametros)
+        except sync_jobs.TrabajoEnCursoError as e:
+            # Dos sincronizaciones a la vez procesarían los mismos correos
+            return _respuesta_en_curso(e.job_id)
+        
+        respuesta = jsonify({'job_id': job.id, 'estado': job.estado, 'mensaje': 'Sincronización iniciada'})
+        respuesta.headers['Location'] = f"/api/sync/jobs/{job.id}"
+        return respuesta, 202
     except Exception as e:
         # Asegurar que siempre devolvemos JSON, incluso en caso de error
         logger.error(f"Error en sincronización de correos: {str(e)}")
         return jsonify({'error': str(e), 'mensaje': 'Error en sincronización de correos'}), 500
 
+@sync_bp.route('/api/sync/cuentas', methods=['GET'])
+@requiere_sesion
+def listar_cuentas():
+    """
+    Lista las cuentas (buzones) registradas, con su última sincronización y si hay
+    credenciales disponibles para sincronizarlas desde el servidor.
+    """
+    try:
+        registradas = credenciales_cuentas.cuentas_registradas()
+        cuentas = []
+        for user in User.query.order_by(User.email).all():
+            cuenta = user.to_dict()
+            cuenta['credenciales'] = user.email.lower() in registradas
+            cuentas.append(cuenta)
+        return jsonify({'cuentas': cuentas})
+    except Exception as e:
+        # Asegurar que siempre devolvemos JSON, incluso en caso de error
+        logger.error(f"Error al listar cuentas: {str(e)}")
+        return jsonify({'error': str(e), 'mensaje': 'Error al listar las cuentas'}), 500
+
+@sync_bp.route('/api/sync/cuentas', methods=['POST'])
+@requiere_sesion
+def sincronizar_cuentas():
+    """
+    Encola la sincronización incremental de todas las cuentas registradas y responde
+    de inmediato (202) con el id del trabajo.
+    """
+    try:
+        try:
+            job = sync_jobs.encolar_cuentas(current_app._get_current_object())
+        except sync_jobs.TrabajoEnCursoError as e:
+            return _respuesta_en_curso(e.job_id)
+        respuesta = jsonify({'job_id': job.id, 'estado': job.estado, 'mensaje': 'Sincronización de cuentas iniciada'})
+        respuesta.headers['Location'] = f"/api/sync/jobs/{job.id}"
+        return respuesta, 202
+    except Exception as e:
+        # Asegurar que siempre devolvemos JSON, incluso en caso de error
+        logger.error(f"Error al sincronizar cuentas: {str(e)}")
+        return jsonify({'error': str(e), 'mensaje': 'Error al sincronizar las cuentas'}), 500
+
+@sync_bp.route('/api/sync/programaciones', methods=['GET'])
+@requiere_sesion
+def listar_programaciones():
+    """
+    Lista las programaciones de sincronización automática de las cuentas.
+    """
+    try:
+        programaciones = ProgramacionSync.query.order_by(ProgramacionSync.proxima_ejecucion).all()
+        return jsonify({'programaciones': [p.to_dict() for p in programaciones]})
+    except Exception as e:
+        # Asegurar que siempre devolvemos JSON, incluso en caso de error
+        logger.error(f"Error al listar programaciones: {str(e)}")
+        return jsonify({'error': str(e), 'mensaje': 'Error al listar las programaciones'}), 500
+
+@sync_bp.route('/api/sync/programaciones/<int:user_id>', methods=['PUT'])
+@requiere_sesion
+def actualizar_programacion(user_id):
+    """
+    Crea o modifica la programación de una cuenta (intervalo_minutos, activa).
+    """
+    try:
+        data = request.json or {}
+        user = db.session.get(User, user_id)
+        if not user:
+            return jsonify({'error': 'Cuenta no encontrada', 'mensaje': f'No existe la cuenta {user_id}'}), 404
+        
+        programacion = user.programacion_sync
+        if not programacion:
+            programacion = ProgramacionSync(user_id=user.id)
+            db.session.add(programacion)
+        
+        if 'intervalo_minutos' in data:
+            try:
+                intervalo = int(data['intervalo_minutos'])
+            except (TypeError, ValueError):
+                intervalo = 0
+            if intervalo < 5:
+                return jsonify({'error': 'Intervalo inválido', 'mensaje': 'El intervalo debe ser de al menos 5 minutos'}), 400
+            programacion.intervalo_minutos = intervalo
+            if programacion.ultima_ejecucion:
+                programacion.proxima_ejecucion = programacion.ultima_ejecucion + timedelta(minutes=intervalo)
+        if 'activa' in data:
+            programacion.activa = bool(data['activa'])
+        
+        db.session.commit()
+        return jsonify(programacion.to_dict())
+    except Exception as e:
+        # Asegurar que siempre devolvemos JSON, incluso en caso de error
+        db.session.rollback()
+        logger.error(f"Error al actualizar programación: {str(e)}")
+        return jsonify({'error': str(e), 'mensaje': 'Error al actualizar la programación'}), 500
+
+@sync_bp.route('/api/sync/jobs/<job_id>', methods=['GET'])
+@requiere_sesion
+def get_sync_job(job_id):
+    """
+    Obtiene el estado y el progreso de una sincronización en segundo plano.
+    """
+    try:
+        job = db.session.get(SyncJob, job_id)
+        if not job:
+            return jsonify({'error': 'Trabajo no encontrado', 'mensaje': f'No existe la sincronización {job_id}'}), 404
+        return jsonify(job.to_dict())
+    except Exception as e:
+        # Asegurar que siempre devolvemos JSON, incluso en caso de error
+        logger.error(f"Error al obtener trabajo de sincronización: {str(e)}")
+        return jsonify({'error': str(e), 'mensaje': 'Error al obtener el estado de la sincronización'}), 500
+
 @sync_bp.route('/api/sync/last', methods=['GET'])
 def get_last_sync():
     """
     Obtiene la fecha de la última sincronización.
     """
     try:
+        etag = calcular_etag(request.path)
+        no_modificada = respuesta_no_modificada(etag)
+        if no_modificada is not None:
+            return no_modificada
+        
         last_sync = sync_service.get_last_sync()
-        return jsonify({'last_sync': last_sync})
+        respuesta = jsonify({'last_sync': last_sync})
+        respuesta.set_etag(etag)
+        return respuesta
     except Exception as e:
         # Asegurar que siempre devolvemos JSON, incluso en caso de error
         logger.error(f"Error al obtener última sincronización: {str(e)}")
@@ -62,48 +255,16 @@ def get_auth_url():
     """
     logger.info("Endpoint /api/auth/url llamado")
     try:
-        # Verificar que el archivo client_secret.json existe
-        client_secrets_file = os.path.join(os.getcwd(), "client_secret.json")
-        logger.info(f"Verificando existencia de client_secret.json en: {client_secrets_file}")
-        
-        if not os.path.exists(client_secrets_file):
-            error_msg = f"El archivo client_secret.json no existe en: {client_secrets_file}"
-            logger.error(error_msg)
-            return jsonify({
-                'error': 'El archivo client_secret.json no existe',
-                'mensaje': 'Archivo de credenciales no encontrado'
-            }), 500
-        
-        # Cargar client_id directamente desde el archivo para asegurar consistencia
+        # La configuración de client_secret.json se lee una vez por proceso (y de nuevo
+        # solo si el archivo cambia); la URL se genera a partir de ella
         try:
-            with open(client_secrets_file, 'r') as f:
-                json_content = json.load(f)
-                
-            if 'web' in json_content and 'client_id' in json_content['web']:
-                client_id = json_content['web']['client_id']
-                redirect_uri = "https://gestion-pagos-alquileres.onrender.com/callback"
-                scope = "https://www.googleapis.com/auth/gmail.readonly"
-                
-                # Generar URL usando el client_id cargado del archivo
-                auth_url = f"https://accounts.google.com/o/oauth2/auth?client_id={client_id}&redirect_uri={redirect_uri}&scope={scope}&response_type=code&access_type=offline&prompt=consent"
-                
-                logger.info(f"URL de autorización generada con client_id desde archivo: {auth_url[:50]}...")
-                return jsonify({'auth_url': auth_url})
-            else:
-                error_msg = "Formato incorrecto en client_secret.json"
-                logger.error(error_msg)
-                return jsonify({
-                    'error': error_msg,
-                    'mensaje': 'El archivo de credenciales no tiene el formato esperado'
-                }), 500
-                
-        except json.JSONDecodeError as e:
-            error_msg = f"Error al parsear client_secret.json: {str(e)}"
-            logger.error(error_msg)
-            return jsonify({
-                'error': str(e),
-                'mensaje': 'Error al leer el archivo de credenciales'
-            }), 500
+            config = config_oauth.obtener_config()
+        except config_oauth.ConfiguracionOAuthError as e:
+            logger.error(str(e))
+            return jsonify({'error': str(e), 'mensaje': e.mensaje}), 500
+        
+        logger.info(f"URL de autorización generada con client_id desde archivo: {config.url_autorizacion[:50]}...")
+        return jsonify({'auth_url': config.url_autorizacion})
             
     except Exception as e:
         # Asegurar que siempre devolvemos JSON, incluso en caso de error
@@ -127,12 +288,13 @@ def auth_callback():
             return redirect('/?error=No se proporcionó código de autorización')
         
         logger.info("Procesando callback de autorización")
-        credentials = sync_service.process_auth_callback(code)
+        cuenta = sync_service.process_auth_callback(code)
         
-        # Redirigir a la página principal con las credenciales como parámetro
-        credentials_str = str(credentials).replace("'", '"')
+        # Las credenciales quedan en el servidor: la sesión y el frontend solo reciben la cuenta
+        session['cuenta'] = cuenta
+        session.permanent = True
         logger.info("Callback procesado correctamente, redirigiendo a la página principal")
-        return redirect(f'/?credentials={credentials_str}')
+        return redirect(f'/?cuenta={quote(cuenta)}')
     except Exception as e:
         # Registrar el error
         logger.error(f"Error en el callback de autenticación: {str(e)}")
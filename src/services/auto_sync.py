@@ -0,0 +1,123 @@
+"""
+Sincronización automática periódica de las cuentas registradas.
+Un hilo por proceso revisa cada cierto tiempo las programaciones vencidas (tabla
+programaciones_sync), reclama cada una con un UPDATE condicional y ejecuta una
+sincronización incremental de la cuenta; así el panel siempre lee datos ya conciliados
+sin que nadie tenga que pulsar el botón. Se activa con AUTO_SYNC=1.
+
+El hilo no se inicia al importar la aplicación: lo inicia gunicorn.conf.py en cada worker
+(después del fork, también con --preload), o src/main.py al ejecutarse directamente.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.models.database import db
+from src.models.user import User
+from src.models.programacion_sync import ProgramacionSync
+from src.services import sync_cuentas
+from src.services.sync_cuentas import sincronizador_cuentas, CONCURRENCIA_CUENTAS
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+ACTIVADA = os.getenv('AUTO_SYNC', '').lower() in ('1', 'true', 'si', 'sí', 'yes')
+
+# Intervalo de las programaciones nuevas
+INTERVALO_POR_DEFECTO = int(os.getenv('AUTO_SYNC_INTERVAL_MINUTES', '60'))
+
+# Cada cuánto se buscan programaciones vencidas
+SEGUNDOS_REVISION = int(os.getenv('AUTO_SYNC_TICK_SECONDS', '60'))
+
+_executor = ThreadPoolExecutor(max_workers=CONCURRENCIA_CUENTAS, thread_name_prefix='auto-sync')
+_hilo = None
+_hilo_lock = threading.Lock()
+
+def crear_programaciones():
+    """
+    Crea la programación por defecto de las cuentas que aún no tienen una.
+    """
+    sin_programacion = User.query.filter(~User.programacion_sync.has()).all()
+    for user in sin_programacion:
+        db.session.add(ProgramacionSync(user_id=user.id, intervalo_minutos=INTERVALO_POR_DEFECTO))
+    if sin_programacion:
+        db.session.commit()
+        logger.info(f"Programaciones de sincronización creadas para {len(sin_programacion)} cuentas")
+
+def reclamar(programacion_id, ahora):
+    """
+    Marca la programación como en curso si sigue vencida y no hay otra sincronización de
+    la cuenta en marcha, manual o automática (o la anterior quedó abandonada). Es la misma
+    reclamación que usan los trabajos manuales (ver sync_cuentas.reclamar).
+
+    Returns:
+        bool: True si esta llamada reclamó la ejecución
+    """
+    return sync_cuentas.reclamar(programacion_id, ahora, solo_vencida=True)
+
+def _ejecutar(app, programacion_id, cuenta):
+    try:
+        resultado = sincronizador_cuentas.sincronizar_cuenta(app, cuenta, programacion_id=programacion_id)
+    except Exception as e:
+        logger.error(f"Error en la sincronización automática de {cuenta}: {str(e)}")
+        resultado = {"success": False, "mensaje": f"Error en sincronización: {str(e)}"}
+
+    with app.app_context():
+        try:
+            sync_cuentas.liberar(programacion_id, resultado)
+            logger.info(f"Sincronización automática de {cuenta}: {resultado.get('mensaje')}")
+        except Exception as e:
+            logger.error(f"No se pudo actualizar la programación de {cuenta}: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+def ejecutar_pendientes(app):
+    """
+    Reclama las programaciones vencidas y envía sus sincronizaciones al pool.
+
+    Returns:
+        int: Número de sincronizaciones iniciadas
+    """
+    with app.app_context():
+        try:
+            crear_programaciones()
+            ahora = datetime.utcnow()
+            vencidas = db.session.query(ProgramacionSync.id, User.email).join(User, User.id == ProgramacionSync.user_id).filter(
+                ProgramacionSync.activa.is_(True),
+                ProgramacionSync.proxima_ejecucion <= ahora
+            ).order_by(ProgramacionSync.proxima_ejecucion).all()
+            reclamadas = [fila for fila in vencidas if reclamar(fila[0], ahora)]
+        finally:
+            db.session.remove()
+
+    for programacion_id, cuenta in reclamadas:
+        _executor.submit(_ejecutar, app, programacion_id, cuenta)
+    return len(reclamadas)
+
+def _bucle(app):
+    while True:
+        time.sleep(SEGUNDOS_REVISION)
+        try:
+            iniciadas = ejecutar_pendientes(app)
+            if iniciadas:
+                logger.info(f"Sincronización automática: {iniciadas} cuentas en curso")
+        except Exception as e:
+            logger.error(f"Error en la revisión de sincronizaciones automáticas: {str(e)}")
+
+def iniciar(app):
+    """
+    Inicia (una vez por proceso) el hilo de sincronización automática si AUTO_SYNC está activada.
+    """
+    global _hilo
+
+    if not ACTIVADA:
+        return False
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, args=(app,), name='auto-sync', daemon=True)
+            _hilo.start()
+            logger.info(f"Sincronización automática activada (revisión cada {SEGUNDOS_REVISION} s)")
+    return True
@@ -0,0 +1,116 @@
+"""
+Configuración del cliente OAuth de Google (client_secret.json), cargada una sola vez por
+proceso. El archivo se valida al arrancar y solo se vuelve a leer si cambia su fecha de
+modificación; las rutas de autorización trabajan con la copia en memoria.
+"""
+import os
+import json
+import logging
+import threading
+from urllib.parse import urlencode
+from google_auth_oauthlib.flow import Flow
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Ruta al archivo de credenciales del cliente (relativa al directorio de trabajo)
+RUTA_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRETS_FILE', 'client_secret.json')
+
+REDIRECT_URI = "https://gestion-pagos-alquileres.onrender.com/callback"
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+
+# Campos obligatorios de la sección 'web' (o 'installed') del archivo
+CAMPOS_OBLIGATORIOS = ('client_id', 'client_secret', 'auth_uri', 'token_uri')
+
+class ConfiguracionOAuthError(Exception):
+    """El archivo client_secret.json no existe o no tiene el formato esperado."""
+    def __init__(self, error, mensaje):
+        super().__init__(error)
+        self.mensaje = mensaje
+
+class ConfiguracionOAuth:
+    """Contenido validado de client_secret.json y la URL de autorización derivada de él."""
+    def __init__(self, client_config, firma):
+        self.client_config = client_config
+        self.firma = firma
+        self.tipo = 'web' if 'web' in client_config else 'installed'
+        self.client_id = client_config[self.tipo]['client_id']
+        self.url_autorizacion = "https://accounts.google.com/o/oauth2/auth?" + urlencode({
+            'client_id': self.client_id,
+            'redirect_uri': REDIRECT_URI,
+            'scope': ' '.join(SCOPES),
+            'response_type': 'code',
+            'access_type': 'offline',
+            'prompt': 'consent'
+        })
+
+    def crear_flow(self):
+        """
+        Flow de OAuth construido desde la configuración en memoria (sin leer el archivo).
+        """
+        return Flow.from_client_config(self.client_config, scopes=SCOPES, redirect_uri=REDIRECT_URI)
+
+def _firma_archivo(ruta):
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        raise ConfiguracionOAuthError(
+            f"El archivo client_secret.json no existe en: {os.path.abspath(ruta)}",
+            'Archivo de credenciales no encontrado'
+        )
+    return (estado.st_mtime_ns, estado.st_size)
+
+def _cargar(ruta, firma):
+    try:
+        with open(ruta, 'r') as f:
+            client_config = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ConfiguracionOAuthError(
+            f"Error al parsear client_secret.json: {str(e)}", 'Error al leer el archivo de credenciales'
+        )
+
+    seccion = (client_config.get('web') or client_config.get('installed')) if isinstance(client_config, dict) else None
+    faltantes = [campo for campo in CAMPOS_OBLIGATORIOS if not (seccion or {}).get(campo)]
+    if faltantes:
+        raise ConfiguracionOAuthError(
+            f"Formato incorrecto en client_secret.json (faltan: {', '.join(faltantes)})",
+            'El archivo de credenciales no tiene el formato esperado'
+        )
+    return ConfiguracionOAuth(client_config, firma)
+
+# Caché (por proceso) de la configuración
+_config_cache = None
+_config_lock = threading.Lock()
+
+def obtener_config():
+    """
+    Devuelve la configuración del cliente OAuth, leyendo el archivo solo la primera vez
+    y cuando cambia su fecha de modificación (o su tamaño). Cuesta un stat() si no cambió.
+
+    Raises:
+        ConfiguracionOAuthError: Si el archivo no existe o no es válido
+    """
+    global _config_cache
+
+    firma = _firma_archivo(RUTA_CLIENT_SECRET)
+    config = _config_cache
+    if config is not None and config.firma == firma:
+        return config
+
+    with _config_lock:
+        if _config_cache is None or _config_cache.firma != firma:
+            _config_cache = _cargar(RUTA_CLIENT_SECRET, firma)
+            logger.info(f"Configuración OAuth cargada desde {RUTA_CLIENT_SECRET}")
+        return _config_cache
+
+def validar():
+    """
+    Valida la configuración al arrancar. Un archivo ausente o inválido no impide iniciar
+    la aplicación (solo la autorización con Gmail), por lo que se registra y se devuelve False.
+    """
+    try:
+        obtener_config()
+        return True
+    except ConfiguracionOAuthError as e:
+        logger.warning(f"Configuración OAuth no válida: {str(e)}. Asegúrate de que client_secret.json esté en la raíz del proyecto.")
+        return False
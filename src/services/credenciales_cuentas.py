@@ -0,0 +1,145 @@
+"""
+Almacén en el servidor de las credenciales OAuth de Gmail de cada cuenta (por dirección
+de correo). Las credenciales se guardan cifradas con Fernet en la tabla tokens_oauth, de
+modo que el frontend ya no necesita enviarlas y el sincronizador de cuentas y la
+renovación anticipada de tokens pueden usarlas desde cualquier worker.
+
+La clave de cifrado se toma de TOKEN_ENCRYPTION_KEY (una clave Fernet) o, si no está
+definida, se deriva de SECRET_KEY. Si ninguna de las dos está configurada (o SECRET_KEY
+es el valor por defecto, que es público), no se guardan ni se leen credenciales: la
+aplicación arranca igual y solo quedan desactivadas las funciones que las necesitan
+(sincronizar desde la sesión, el sincronizador de cuentas y la renovación de tokens).
+"""
+import os
+import json
+import base64
+import hashlib
+import logging
+import threading
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy import func
+from src.models.database import db
+from src.models.user import User
+from src.models.token_oauth import TokenOAuth
+from src.services.gmail_service_real import expiracion_credenciales, descartar_pool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Valor por defecto de SECRET_KEY en src/main.py: está en el repositorio, no sirve como clave
+SECRET_KEY_POR_DEFECTO = 'clave-secreta-por-defecto'
+
+class ClaveCifradoError(Exception):
+    """No hay una clave de cifrado segura configurada para las credenciales."""
+    pass
+
+_fernet = None
+_fernet_lock = threading.Lock()
+
+def _cifrador():
+    global _fernet
+
+    with _fernet_lock:
+        if _fernet is None:
+            clave = os.getenv('TOKEN_ENCRYPTION_KEY')
+            if not clave:
+                secreto = os.getenv('SECRET_KEY')
+                if not secreto or secreto == SECRET_KEY_POR_DEFECTO:
+                    raise ClaveCifradoError(
+                        "Define TOKEN_ENCRYPTION_KEY (clave Fernet) o una SECRET_KEY propia para guardar credenciales"
+                    )
+                clave = base64.urlsafe_b64encode(hashlib.sha256(secreto.encode('utf-8')).digest())
+            try:
+                _fernet = Fernet(clave)
+            except ValueError as e:
+                raise ClaveCifradoError(f"TOKEN_ENCRYPTION_KEY no es una clave Fernet válida: {str(e)}")
+        return _fernet
+
+def disponible():
+    """
+    Indica si hay una clave de cifrado segura, es decir, si se pueden guardar y leer credenciales.
+    """
+    try:
+        _cifrador()
+        return True
+    except ClaveCifradoError:
+        return False
+
+def validar_clave():
+    """
+    Comprueba al arrancar que hay una clave de cifrado segura. Sin ella la aplicación
+    funciona, pero sin guardar credenciales en el servidor, por lo que se registra y se
+    devuelve False.
+    """
+    try:
+        _cifrador()
+        return True
+    except ClaveCifradoError as e:
+        logger.error(f"Credenciales guardadas desactivadas: {str(e)}")
+        return False
+
+def _buscar_usuario(cuenta):
+    return User.query.filter(func.lower(User.email) == cuenta.lower()).first()
+
+def registrar(cuenta, credentials):
+    """
+    Guarda (cifradas) las credenciales de una cuenta, reemplazando las anteriores y
+    creando el usuario si no existe. No hace commit: la transacción la controla quien llama.
+    Sin clave de cifrado no guarda nada y devuelve None.
+    """
+    if not cuenta or not credentials or not disponible():
+        return None
+
+    user = _buscar_usuario(cuenta)
+    if not user:
+        user = User(email=cuenta)
+        db.session.add(user)
+        db.session.flush()
+
+    token = user.token_oauth
+    if not token:
+        token = TokenOAuth(user_id=user.id)
+        db.session.add(token)
+    else:
+        # Con otro refresh_token las credenciales reemplazadas ya no se usan: liberar su
+        # pool de servicios (con el mismo, el pool es el mismo y adopta el token nuevo)
+        anteriores = descifrar(token)
+        if anteriores and anteriores.get('refresh_token') != credentials.get('refresh_token'):
+            descartar_pool(anteriores)
+    token.token_cifrado = _cifrador().encrypt(json.dumps(credentials).encode('utf-8')).decode('ascii')
+    token.expiracion = expiracion_credenciales(credentials)
+    return token
+
+def descifrar(token):
+    """
+    Returns:
+        dict: Credenciales guardadas en un TokenOAuth, o None si no se pueden descifrar
+    """
+    try:
+        return json.loads(_cifrador().decrypt(token.token_cifrado.encode('ascii')))
+    except (InvalidToken, ValueError, ClaveCifradoError) as e:
+        logger.error(f"No se pudieron descifrar las credenciales del usuario {token.user_id}: {str(e)}")
+        return None
+
+def obtener(cuenta):
+    """
+    Returns:
+        dict: Credenciales de la cuenta, o None si no hay credenciales guardadas (o no hay clave de cifrado)
+    """
+    if not cuenta or not disponible():
+        return None
+    user = _buscar_usuario(cuenta)
+    if not user or not user.token_oauth:
+        return None
+    return descifrar(user.token_oauth)
+
+def cuentas_registradas():
+    """
+    Returns:
+        set: Direcciones (en minúsculas) de las cuentas con credenciales guardadas
+            (ninguna si no hay clave de cifrado, porque no se podrían leer)
+    """
+    if not disponible():
+        return set()
+    filas = db.session.query(User.email).join(TokenOAuth, TokenOAuth.user_id == User.id).all()
+    return {email.lower() for (email,) in filas}
@@ -0,0 +1,106 @@
+"""
+Caché local en disco de los mensajes de Gmail, comprimidos con Brotli.
+Cada mensaje (respuesta de messages.get con format='full') se guarda en un archivo
+identificado por su id de Gmail; los mensajes de Gmail no cambian, por lo que una
+entrada nunca hay que invalidarla. Solo se guardan los correos del remitente del banco;
+el resto del buzón no se escribe en disco.
+"""
+import os
+import re
+import json
+import logging
+import tempfile
+import brotli
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Directorio por defecto de la caché. Si EMAIL_CACHE_DIR está definida pero vacía, la caché se desactiva.
+DIRECTORIO_POR_DEFECTO = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'email_cache')
+
+# Calidad de compresión: los niveles altos de Brotli son muy lentos para escribir
+CALIDAD_BROTLI = 5
+
+EXTENSION = '.json.br'
+
+# Los ids de Gmail son hexadecimales; se valida para no escribir fuera del directorio
+PATRON_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+class EmailCache:
+    def __init__(self, directorio=None):
+        if directorio is None:
+            directorio = os.getenv('EMAIL_CACHE_DIR', DIRECTORIO_POR_DEFECTO)
+        self.directorio = directorio
+
+    @property
+    def activa(self):
+        return bool(self.directorio)
+
+    def _ruta(self, message_id):
+        # Subdirectorios por los dos primeros caracteres para no acumular miles de archivos en uno
+        return os.path.join(self.directorio, message_id[:2], message_id + EXTENSION)
+
+    def obtener(self, message_id):
+        """
+        Lee un mensaje de la caché.
+
+        Returns:
+            dict: Mensaje de Gmail, o None si no está en caché
+        """
+        if not self.activa or not PATRON_ID.match(message_id):
+            return None
+        try:
+            with open(self._ruta(message_id), 'rb') as f:
+                return json.loads(brotli.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Entrada de caché ilegible para el mensaje {message_id}: {str(e)}")
+            return None
+
+    def obtener_varios(self, ids):
+        """
+        Lee varios mensajes de la caché.
+
+        Returns:
+            dict: Mensajes encontrados indexados por id
+        """
+        mensajes = {}
+        for message_id in ids:
+            mensaje = self.obtener(message_id)
+            if mensaje is not None:
+                mensajes[message_id] = mensaje
+        return mensajes
+
+    def guardar(self, message_id, mensaje):
+        """
+        Guarda un mensaje en la caché. La escritura es atómica (archivo temporal + rename),
+        así que un lector concurrente nunca ve un archivo a medio escribir.
+        """
+        if not self.activa or not PATRON_ID.match(message_id):
+            return
+        ruta = self._ruta(message_id)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            datos = brotli.compress(json.dumps(mensaje, separators=(',', ':')).encode('utf-8'), quality=CALIDAD_BROTLI)
+            fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        except Exception as e:
+            # La caché es opcional: un error al escribir no debe detener la sincronización
+            logger.warning(f"No se pudo guardar en caché el mensaje {message_id}: {str(e)}")
+
+    def iterar_ids(self):
+        """
+        Genera los ids de todos los mensajes en caché, en orden.
+        """
+        if not self.activa or not os.path.isdir(self.directorio):
+            return
+        for subdirectorio in sorted(os.listdir(self.directorio)):
+            ruta = os.path.join(self.directorio, subdirectorio)
+            if not os.path.isdir(ruta):
+                continue
+            for nombre in sorted(os.listdir(ruta)):
+                if nombre.endswith(EXTENSION):
+                    yield nombre[:-len(EXTENSION)]
@@ -6,16 +6,210 @@ Con corrección para el parseo de fechas.
 import re
 import base64
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import lxml.html
+from lxml import etree
 from bs4 import BeautifulSoup
 from datetime import datetime
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+PATRON_FECHA = re.compile(r'(\d{2}/\d{2}/\d{4})')
+PATRON_MONTO = re.compile(r'\$\s*([\d\.,]+)')
+PATRON_EMISOR = re.compile(r'cliente\s+<b>(.*?)</b>\s+ha efectuado')
+PATRON_EMISOR_ALTERNATIVO = re.compile(r'cliente\s+<b>(.*?)</b>')
+PATRON_NO_DIGITOS = re.compile(r'[^\d]')
+
+# Etiquetas de celdas cuyo valor está en la celda siguiente (búsqueda parcial, como string=re.compile(...))
+ETIQUETAS_ADICIONALES = (
+    ('rut_destinatario', 'Rut'),
+    ('email_destinatario', 'Email'),
+    ('comprobante', 'Número de comprobante'),
+)
+
+def _cadena_unica(elemento):
+    """
+    Equivalente en lxml de Tag.string de BeautifulSoup: el texto del elemento solo
+    si tiene un único hijo (recursivamente), o None en caso contrario.
+    """
+    hijos = []
+    if elemento.text:
+        hijos.append(elemento.text)
+    for hijo in elemento:
+        hijos.append(hijo)
+        if hijo.tail:
+            hijos.append(hijo.tail)
+    if len(hijos) != 1:
+        return None
+    unico = hijos[0]
+    return unico if isinstance(unico, str) else _cadena_unica(unico)
+
+def _entero(texto):
+    try:
+        return int(PATRON_NO_DIGITOS.sub('', texto))
+    except ValueError:
+        return None
+
+def _fecha(texto):
+    try:
+        return datetime.strptime(texto, '%d/%m/%Y')
+    except ValueError:
+        return None
+
+def _parsear_en_proceso(email):
+    """
+    Punto de entrada en los procesos del pool: cada proceso crea su propio EmailParser.
+    """
+    global _parser_proceso
+    if _parser_proceso is None:
+        _parser_proceso = EmailParser()
+    return _parser_proceso.parse_banco_chile_email(email)
+
+_parser_proceso = None
+
+class ParseoParalelo:
+    """
+    Pool de procesos para parsear correos en paralelo (backfills grandes).
+    Los resultados se devuelven en el mismo orden que los correos y son idénticos
+    a los de parse_banco_chile_email en serie.
+    
+    Uso:
+        with ParseoParalelo(procesos=4, tamano_chunk=8) as pool:
+            resultados = pool.parsear(emails)
+    """
+    def __init__(self, procesos, tamano_chunk=8):
+        self.procesos = procesos
+        self.tamano_chunk = max(1, tamano_chunk)
+        self.executor = None
+    
+    def __enter__(self):
+        # 'spawn' evita heredar hilos y locks del proceso web (fork no es seguro con hilos)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.procesos,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        logger.info(f"Pool de parseo iniciado con {self.procesos} procesos")
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+        return False
+    
+    def parsear(self, emails):
+        """
+        Parsea una lista de correos repartiéndolos entre los procesos.
+        
+        Returns:
+            list: Resultado de parse_banco_chile_email para cada correo, en el mismo orden
+        """
+        return list(self.executor.map(_parsear_en_proceso, emails, chunksize=self.tamano_chunk))
+
 class EmailParser:
     def __init__(self):
         pass
     
+    def _extraer_con_lxml(self, html_content):
+        """
+        Motor rápido de extracción: recorre las celdas <td> una sola vez con lxml y aplica
+        las mismas reglas (y el mismo orden de preferencia) que la extracción con BeautifulSoup.
+        
+        Args:
+            html_content (str): HTML decodificado del correo
+            
+        Returns:
+            dict: Datos de transferencia, o None si no se pudieron obtener emisor y fecha
+        """
+        try:
+            raiz = lxml.html.fromstring(html_content)
+        except (etree.ParserError, ValueError) as e:
+            logger.debug("lxml no pudo parsear el HTML, se usará BeautifulSoup: %s", str(e))
+            return None
+        
+        celdas = list(raiz.iter('td'))
+        textos = [td.text_content() for td in celdas]
+        
+        emisor = None
+        td_emisor_visto = False
+        fecha_etiqueta = fecha_patron = None
+        monto_etiqueta = monto_patron = None
+        adicionales = {}
+        
+        for i, (td, texto) in enumerate(zip(celdas, textos)):
+            texto_limpio = texto.strip()
+            siguiente = textos[i + 1].strip() if i + 1 < len(textos) else None
+            
+            # Emisor: primera celda con el texto de aviso de transferencia
+            if not td_emisor_visto and 'Te informamos que nuestro(a) cliente' in texto and 'ha efectuado una transferencia' in texto:
+                td_emisor_visto = True
+                for b_tag in td.iter('b'):
+                    nombre = b_tag.text_content()
+                    if 'Diego T' not in nombre:  # Ignorar el nombre del destinatario
+                        emisor = nombre.strip()
+                        break
+                if not emisor:
+                    match = PATRON_EMISOR.search(etree.tostring(td, encoding='unicode', with_tail=False))
+                    if match:
+                        emisor = match.group(1).strip()
+            
+            # Fecha y monto: la etiqueta exacta tiene preferencia sobre el patrón en cualquier celda
+            if fecha_etiqueta is None and texto_limpio == 'Fecha' and siguiente is not None:
+                fecha_etiqueta = _fecha(siguiente)
+            if fecha_patron is None:
+                match = PATRON_FECHA.search(texto_limpio)
+                if match:
+                    fecha_patron = _fecha(match.group(1))
+            
+            if monto_etiqueta is None and texto_limpio == 'Monto' and siguiente is not None:
+                monto_etiqueta = _entero(siguiente)
+            if monto_patron is None:
+                match = PATRON_MONTO.search(texto_limpio)
+                if match:
+                    monto_patron = _entero(match.group(1))
+            
+            # RUT, email y comprobante: celda cuyo único texto contiene la etiqueta
+            if len(adicionales) < len(ETIQUETAS_ADICIONALES) and siguiente is not None:
+                cadena = None
+                for clave, etiqueta in ETIQUETAS_ADICIONALES:
+                    if clave in adicionales:
+                        continue
+                    if cadena is None:
+                        cadena = _cadena_unica(td) or ''
+                    if etiqueta in cadena:
+                        adicionales[clave] = siguiente
+        
+        if not emisor:
+            match = PATRON_EMISOR_ALTERNATIVO.search(html_content)
+            if match:
+                emisor = match.group(1).strip()
+        
+        if not emisor:
+            for tr in raiz.iter('tr'):
+                cells = list(tr.iter('td'))
+                if len(cells) >= 2:
+                    header_cell = cells[0].text_content().strip().lower()
+                    if 'nombre' in header_cell and 'emisor' in header_cell:
+                        emisor = cells[1].text_content().strip()
+                        break
+        
+        fecha_obj = fecha_etiqueta or fecha_patron
+        if not emisor or not fecha_obj:
+            return None
+        
+        transfer_data = {
+            'emisor': emisor,
+            'fecha': fecha_obj,
+            'mes': fecha_obj.month,
+            'año': fecha_obj.year
+        }
+        monto = monto_etiqueta or monto_patron
+        if monto:
+            transfer_data['monto'] = monto
+        transfer_data.update(adicionales)
+        return transfer_data
+    
     def parse_banco_chile_email(self, email):
         """
         Analiza un correo electrónico del Banco de Chile y extrae la información relevante.
@@ -27,14 +221,14 @@ class EmailParser:
             dict: Información extraída del correo o None si no es un correo válido
         """
         try:
-            logger.info(f"Iniciando parseo de correo con ID: {email.get('id', 'sin ID')}")
+            logger.debug("Iniciando parseo de correo con ID: %s", email.get('id', 'sin ID'))
             
             # Verificar remitente
             from_header = email.get('from', '')
-            logger.info(f"Remitente del correo: {from_header}")
+            logger.debug("Remitente del correo: %s", from_header)
             
             if 'serviciodetransferencias@bancochile.cl' not in from_header:
-                logger.info("Remitente no coincide con servicio de transferencias, ignorando correo")
+                logger.debug("Remitente no coincide con servicio de transferencias, ignorando correo")
                 return None
             
             # Extraer el cuerpo del correo
@@ -73,13 +267,26 @@ class EmailParser:
                             logger.error(f"Error al decodificar HTML del campo body directo: {str(e)}")
             
             if not html_content:
-                logger.warning("No se encontró contenido HTML en el correo")
+                logger.debug("No se encontró contenido HTML en el correo")
                 return None
             
+            # Motor rápido (lxml, una sola pasada por las celdas)
+            try:
+                transfer_data = self._extraer_con_lxml(html_content)
+            except Exception as e:
+                logger.error(f"Error en la extracción con lxml: {str(e)}")
+                transfer_data = None
+            
+            if transfer_data:
+                logger.debug("Datos extraídos correctamente con lxml: %s", transfer_data)
+                return transfer_data
+            
+            logger.debug("La extracción rápida no obtuvo emisor y fecha, usando BeautifulSoup")
+            
             # Parsear el HTML
             try:
                 soup = BeautifulSoup(html_content, 'html.parser')
-                logger.info("HTML parseado correctamente, buscando elementos...")
+                logger.debug("HTML parseado correctamente, buscando elementos...")
             except Exception as e:
                 logger.error(f"Error al parsear HTML con BeautifulSoup: {str(e)}")
                 return None
@@ -98,7 +305,7 @@ class EmailParser:
                     for td in soup.find_all('td'):
                         text = td.get_text()
                         if 'Te informamos que nuestro(a) cliente' in text and 'ha efectuado una transferencia' in text:
-                            logger.info(f"Encontrado texto con información del cliente")
+                            logger.debug("Encontrado texto con información del cliente")
                             
                             # Buscar el tag <b> dentro del td que contiene el nombre del cliente
                             b_tags = td.find_all('b')
@@ -106,7 +313,7 @@ class EmailParser:
                                 # El segundo tag <b> suele contener el nombre del emisor
                                 if 'Diego T' not in b_tag.text:  # Ignorar el nombre del destinatario
                                     emisor = b_tag.text.strip()
-                                    logger.info(f"Emisor extraído del tag <b>: '{emisor}'")
+                                    logger.debug("Emisor extraído del tag <b>: '%s'", emisor)
                                     break
                             
                             if not emisor:
@@ -114,7 +321,7 @@ class EmailParser:
                                 match = re.search(r'cliente\s+<b>(.*?)</b>\s+ha efectuado', str(td))
                                 if match:
                                     emisor = match.group(1).strip()
-                                    logger.info(f"Emisor extraído con regex: '{emisor}'")
+                                    logger.debug("Emisor extraído con regex: '%s'", emisor)
                             break
                 except Exception as e:
                     logger.error(f"Error al buscar emisor en formato actual: {str(e)}")
@@ -127,7 +334,7 @@ class EmailParser:
                         match = re.search(pattern, html_content)
                         if match:
                             emisor = match.group(1).strip()
-                            logger.info(f"Emisor encontrado con patrón alternativo: '{emisor}'")
+                            logger.debug("Emisor encontrado con patrón alternativo: '%s'", emisor)
                     except Exception as e:
                         logger.error(f"Error al buscar emisor con patrón alternativo: {str(e)}")
                 
@@ -144,7 +351,7 @@ class EmailParser:
                                     header_cell = cells[0].get_text().strip().lower()
                                     if 'nombre' in header_cell and 'emisor' in header_cell:
                                         emisor = cells[1].get_text().strip()
-                                        logger.info(f"Emisor encontrado en tabla: '{emisor}'")
+                                        logger.debug("Emisor encontrado en tabla: '%s'", emisor)
                                         break
                             if emisor:
                                 break
@@ -156,7 +363,7 @@ class EmailParser:
             if emisor:
                 transfer_data['emisor'] = emisor
             else:
-                logger.warning("No se pudo extraer el emisor")
+                logger.debug("No se pudo extraer el emisor")
             
             # Extraer la fecha
             fecha_obj = None
@@ -171,7 +378,7 @@ class EmailParser:
                             fecha_td = td.find_next('td')
                             if fecha_td:
                                 fecha_text = fecha_td.get_text().strip()
-                                logger.info(f"Fecha encontrada en tabla: {fecha_text}")
+                                logger.debug("Fecha encontrada en tabla: %s", fecha_text)
                                 try:
                                     # CORRECCIÓN: Verificar y corregir el año si es necesario
                                     fecha_obj = datetime.strptime(fecha_text, '%d/%m/%Y')
@@ -182,10 +389,10 @@ class EmailParser:
                                         año_correcto = int(año_match.group(1))
                                         # Si el año parseado es diferente al año en el texto, corregirlo
                                         if fecha_obj.year != año_correcto:
-                                            logger.info(f"Corrigiendo año de {fecha_obj.year} a {año_correcto}")
+                                            logger.debug("Corrigiendo año de %s a %s", fecha_obj.year, año_correcto)
                                             fecha_obj = fecha_obj.replace(year=año_correcto)
                                     
-                                    logger.info(f"Fecha parseada: {fecha_obj}")
+                                    logger.debug("Fecha parseada: %s", fecha_obj)
                                     break
                                 except Exception as e:
                                     logger.error(f"Error al parsear fecha '{fecha_text}': {str(e)}")
@@ -201,7 +408,7 @@ class EmailParser:
                             match = re.search(r'(\d{2}/\d{2}/\d{4})', text)
                             if match:
                                 fecha_text = match.group(1)
-                                logger.info(f"Posible fecha encontrada: {fecha_text}")
+                                logger.debug("Posible fecha encontrada: %s", fecha_text)
                                 try:
                                     # CORRECCIÓN: Verificar y corregir el año si es necesario
                                     fecha_obj = datetime.strptime(fecha_text, '%d/%m/%Y')
@@ -212,10 +419,10 @@ class EmailParser:
                                         año_correcto = int(año_match.group(1))
                                         # Si el año parseado es diferente al año en el texto, corregirlo
                                         if fecha_obj.year != año_correcto:
-                                            logger.info(f"Corrigiendo año de {fecha_obj.year} a {año_correcto}")
+                                            logger.debug("Corrigiendo año de %s a %s", fecha_obj.year, año_correcto)
                                             fecha_obj = fecha_obj.replace(year=año_correcto)
                                     
-                                    logger.info(f"Fecha parseada: {fecha_obj}")
+                                    logger.debug("Fecha parseada: %s", fecha_obj)
                                     break
                                 except Exception as e:
                                     logger.error(f"Error al parsear fecha '{fecha_text}': {str(e)}")
@@ -228,9 +435,9 @@ class EmailParser:
                 transfer_data['fecha'] = fecha_obj
                 transfer_data['mes'] = fecha_obj.month
                 transfer_data['año'] = fecha_obj.year
-                logger.info(f"Fecha final: {fecha_obj}, Mes: {fecha_obj.month}, Año: {fecha_obj.year}")
+                logger.debug("Fecha final: %s, Mes: %s, Año: %s", fecha_obj, fecha_obj.month, fecha_obj.year)
             else:
-                logger.warning("No se pudo extraer la fecha")
+                logger.debug("No se pudo extraer la fecha")
             
             # Extraer el monto
             monto = None
@@ -245,12 +452,12 @@ class EmailParser:
                             monto_td = td.find_next('td')
                             if monto_td:
                                 monto_text = monto_td.get_text().strip()
-                                logger.info(f"Monto encontrado en tabla: {monto_text}")
+                                logger.debug("Monto encontrado en tabla: %s", monto_text)
                                 # Limpiar el monto (quitar $, puntos, comas y convertir a número)
                                 monto_limpio = re.sub(r'[^\d]', '', monto_text)
                                 try:
                                     monto = int(monto_limpio)
-                                    logger.info(f"Monto parseado: {monto}")
+                                    logger.debug("Monto parseado: %s", monto)
                                     break
                                 except Exception as e:
                                     logger.error(f"Error al parsear monto '{monto_text}': {str(e)}")
@@ -266,12 +473,12 @@ class EmailParser:
                             match = re.search(r'\$\s*([\d\.,]+)', text)
                             if match:
                                 monto_text = match.group(1)
-                                logger.info(f"Posible monto encontrado: {monto_text}")
+                                logger.debug("Posible monto encontrado: %s", monto_text)
                                 # Limpiar el monto (quitar puntos, comas y convertir a número)
                                 monto_limpio = re.sub(r'[^\d]', '', monto_text)
                                 try:
                                     monto = int(monto_limpio)
-                                    logger.info(f"Monto parseado: {monto}")
+                                    logger.debug("Monto parseado: %s", monto)
                                     break
                                 except Exception as e:
                                     logger.error(f"Error al parsear monto '{monto_text}': {str(e)}")
@@ -282,9 +489,9 @@ class EmailParser:
             
             if monto:
                 transfer_data['monto'] = monto
-                logger.info(f"Monto final: {monto}")
+                logger.debug("Monto final: %s", monto)
             else:
-                logger.warning("No se pudo extraer el monto")
+                logger.debug("No se pudo extraer el monto")
             
             # Extraer otros datos si están disponibles
             if soup is not None:
@@ -293,19 +500,19 @@ class EmailParser:
                     rut_element = soup.find('td', string=re.compile('Rut'))
                     if rut_element and rut_element.find_next('td'):
                         transfer_data['rut_destinatario'] = rut_element.find_next('td').text.strip()
-                        logger.info(f"RUT destinatario: {transfer_data['rut_destinatario']}")
+                        logger.debug("RUT destinatario: %s", transfer_data['rut_destinatario'])
                     
                     # Extraer el email del destinatario
                     email_element = soup.find('td', string=re.compile('Email'))
                     if email_element and email_element.find_next('td'):
                         transfer_data['email_destinatario'] = email_element.find_next('td').text.strip()
-                        logger.info(f"Email destinatario: {transfer_data['email_destinatario']}")
+                        logger.debug("Email destinatario: %s", transfer_data['email_destinatario'])
                     
                     # Extraer el número de comprobante
                     comprobante_element = soup.find('td', string=re.compile('Número de comprobante'))
                     if comprobante_element and comprobante_element.find_next('td'):
                         transfer_data['comprobante'] = comprobante_element.find_next('td').text.strip()
-                        logger.info(f"Número de comprobante: {transfer_data['comprobante']}")
+                        logger.debug("Número de comprobante: %s", transfer_data['comprobante'])
                 except Exception as e:
                     logger.error(f"Error al extraer datos adicionales: {str(e)}")
             
@@ -314,17 +521,17 @@ class EmailParser:
                 try:
                     # Si no podemos encontrar el emisor pero tenemos el RUT, usarlo como identificador
                     emisor = f"Cliente RUT {transfer_data['rut_destinatario']}"
-                    logger.info(f"Usando RUT como identificador de emisor: '{emisor}'")
+                    logger.debug("Usando RUT como identificador de emisor: '%s'", emisor)
                     transfer_data['emisor'] = emisor
                 except Exception as e:
                     logger.error(f"Error al usar RUT como identificador: {str(e)}")
             
             # Verificar si se extrajeron los datos mínimos necesarios
             if ('emisor' in transfer_data or 'rut_destinatario' in transfer_data) and 'fecha' in transfer_data:
-                logger.info(f"Datos extraídos correctamente: {transfer_data}")
+                logger.debug("Datos extraídos correctamente: %s", transfer_data)
                 return transfer_data
             else:
-                logger.warning(f"No se pudieron extraer todos los datos necesarios. Datos parciales: {transfer_data}")
+                logger.debug("No se pudieron extraer todos los datos necesarios. Datos parciales: %s", transfer_data)
                 return None
                 
         except Exception as e:
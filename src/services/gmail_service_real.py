@@ -4,27 +4,165 @@ Servicio para la autenticación real con Gmail utilizando OAuth2.
 import os
 import json
 import logging
-from flask import session, url_for, redirect, request
-from google_auth_oauthlib.flow import Flow
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from src.services.email_cache import EmailCache
+from src.services import config_oauth
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Mensajes por petición batch (Gmail admite hasta 100 y recomienda no pasar de 50)
+TAMANO_BATCH = int(os.getenv('GMAIL_BATCH_SIZE', '50'))
+
+# Peticiones batch simultáneas al descargar mensajes
+CONCURRENCIA_BATCH = int(os.getenv('GMAIL_BATCH_CONCURRENCY', '2'))
+
+# Mensajes pedidos por página a messages.list al recorrer el buzón (máximo 500)
+TAMANO_PAGINA = int(os.getenv('GMAIL_PAGE_SIZE', '100'))
+
+# Reintentos de los mensajes que fallan dentro de una petición batch (429, 5xx...), con
+# espera exponencial a partir de GMAIL_BATCH_BACKOFF segundos
+REINTENTOS_BATCH = int(os.getenv('GMAIL_BATCH_RETRIES', '3'))
+ESPERA_REINTENTO_BATCH = float(os.getenv('GMAIL_BATCH_BACKOFF', '1'))
+
+# Remitente de las notificaciones de transferencias: solo estos correos se descargan
+# completos desde el historial y se guardan en la caché local
+REMITENTE_BANCO = 'serviciodetransferencias@bancochile.cl'
+
+# Pools de servicios que se mantienen por proceso (los menos usados recientemente se
+# descartan primero) y segundos sin uso tras los que se descarta un pool
+MAX_POOLS = int(os.getenv('GMAIL_MAX_POOLS', '20'))
+SEGUNDOS_POOL_INACTIVO = int(os.getenv('GMAIL_POOL_IDLE_SECONDS', '900'))
+
+class HistorialExpiradoError(Exception):
+    """El historyId guardado ya no está disponible en Gmail (hay que hacer un recorrido completo)."""
+    pass
+
+def expiracion_credenciales(credentials):
+    """
+    Fecha de expiración (UTC, sin zona horaria) del campo 'expiry' de las credenciales, o None.
+    """
+    expiry = credentials.get('expiry')
+    if not expiry:
+        return None
+    try:
+        fecha = datetime.fromisoformat(expiry.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+# Documento de descubrimiento de Gmail incluido en googleapiclient (sin petición HTTP),
+# interpretado una sola vez por proceso
+_documento_gmail = None
+_documento_lock = threading.Lock()
+
+def documento_gmail():
+    global _documento_gmail
+
+    with _documento_lock:
+        if _documento_gmail is None:
+            _documento_gmail = json.loads(get_static_doc('gmail', 'v1'))
+        return _documento_gmail
+
+class PoolCuenta:
+    """
+    Servicios de Gmail ya construidos para una cuenta, cada uno con su propio transporte
+    autorizado (httplib2 no es thread-safe). Un servicio se usa por un solo hilo a la vez
+    y al devolverlo queda disponible, con su conexión TLS abierta, para la siguiente llamada.
+    Las credenciales se comparten, así que un token renovado sirve para todos.
+    """
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.ultimo_uso = time.monotonic()
+        self._libres = []
+        self._cerrado = False
+        self._lock = threading.Lock()
+    
+    def _crear_servicio(self):
+        http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return build_from_document(documento_gmail(), http=http)
+    
+    @contextmanager
+    def servicio(self):
+        with self._lock:
+            service = self._libres.pop() if self._libres else None
+        if service is None:
+            service = self._crear_servicio()
+        try:
+            yield service
+        finally:
+            with self._lock:
+                cerrado = self._cerrado
+                if not cerrado:
+                    self._libres.append(service)
+            if cerrado:
+                self._cerrar_servicio(service)
+    
+    def _cerrar_servicio(self, service):
+        try:
+            service._http.close()
+        except Exception as e:
+            logger.warning(f"No se pudo cerrar la conexión de un servicio de Gmail: {str(e)}")
+    
+    def cerrar(self):
+        """
+        Cierra las conexiones de los servicios libres. Los que estén en uso se cierran al
+        devolverlos.
+        """
+        with self._lock:
+            self._cerrado = True
+            libres, self._libres = self._libres, []
+        for service in libres:
+            self._cerrar_servicio(service)
+
+# Pools de servicios por cuenta (client_id + refresh_token), del menos al más usado recientemente
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+def _clave_pool(credentials_dict):
+    return (credentials_dict.get('client_id'), credentials_dict.get('refresh_token') or credentials_dict.get('token'))
+
+def _purgar_pools(ahora):
+    """Saca del caché los pools inactivos y los que sobran de MAX_POOLS. Requiere _pools_lock."""
+    descartados = [clave for clave, pool in _pools.items() if ahora - pool.ultimo_uso > SEGUNDOS_POOL_INACTIVO]
+    descartados = [_pools.pop(clave) for clave in descartados]
+    while len(_pools) > MAX_POOLS:
+        descartados.append(_pools.popitem(last=False)[1])
+    return descartados
+
+def descartar_pool(credentials_dict):
+    """
+    Descarta el pool de servicios de unas credenciales (p. ej. al renovarlas o reemplazarlas),
+    cerrando sus conexiones. La próxima llamada con esas credenciales crea un pool nuevo.
+    """
+    with _pools_lock:
+        pool = _pools.pop(_clave_pool(credentials_dict), None)
+    if pool is not None:
+        pool.cerrar()
+
 class GmailServiceReal:
     def __init__(self):
-        # Ruta al archivo client_secret.json
-        self.client_secrets_file = "client_secret.json"
-        self.redirect_uri = "https://gestion-pagos-alquileres.onrender.com/callback"
-        self.scopes = ['https://www.googleapis.com/auth/gmail.readonly']
+        # El archivo client_secret.json se carga y valida una vez por proceso (ver config_oauth.py)
+        self.redirect_uri = config_oauth.REDIRECT_URI
+        self.scopes = config_oauth.SCOPES
         
-        # Verificar si tenemos el archivo
-        if os.path.exists(self.client_secrets_file):
-            logger.info(f"Archivo {self.client_secrets_file} encontrado")
-        else:
-            logger.warning(f"No se encontró el archivo {self.client_secrets_file}. Asegúrate de que esté en la raíz del proyecto.")
+        # Caché local de los mensajes descargados (ver email_cache.py)
+        self.cache = EmailCache()
     
     def get_auth_url(self):
         """
@@ -32,12 +170,8 @@ class GmailServiceReal:
         """
         logger.info("Iniciando get_auth_url()")
         try:
-            # Usar el enfoque que funcionaba antes con Flow
-            flow = Flow.from_client_secrets_file(
-                self.client_secrets_file,
-                scopes=self.scopes,
-                redirect_uri=self.redirect_uri
-            )
+            # Flow construido desde la configuración en memoria
+            flow = config_oauth.obtener_config().crear_flow()
             
             auth_url, _ = flow.authorization_url(
                 access_type='offline',
@@ -61,12 +195,8 @@ class GmailServiceReal:
         """
         logger.info(f"Iniciando get_token con código: {code[:10]}...")
         try:
-            # Usar el enfoque que funcionaba antes
-            flow = Flow.from_client_secrets_file(
-                self.client_secrets_file,
-                scopes=self.scopes,
-                redirect_uri=self.redirect_uri
-            )
+            # Flow construido desde la configuración en memoria
+            flow = config_oauth.obtener_config().crear_flow()
             
             # Intercambiar el código por un token
             flow.fetch_token(code=code)
@@ -74,76 +204,458 @@ class GmailServiceReal:
             # Guardar las credenciales
             credentials = flow.credentials
             logger.info("Token obtenido correctamente")
-            return {
-                'token': credentials.token,
-                'refresh_token': credentials.refresh_token,
-                'token_uri': credentials.token_uri,
-                'client_id': credentials.client_id,
-                'client_secret': credentials.client_secret,
-                'scopes': credentials.scopes
-            }
+            return self._credenciales_a_dict(credentials)
         except Exception as e:
             logger.error(f"Error al obtener token: {str(e)}")
             raise
     
-    def get_emails(self, credentials_dict, query="from:serviciodetransferencias@bancochile.cl", max_results=10):
+    def _credenciales_a_dict(self, credentials):
         """
-        Obtiene los correos electrónicos que coinciden con la consulta.
+        Convierte un objeto Credentials en el diccionario que usa el resto de la aplicación.
+        La expiración se guarda en ISO 8601 (UTC) para poder renovar el token antes de que venza.
         """
-        logger.info(f"Iniciando get_emails con query: {query}")
-        try:
-            credentials = Credentials(
-                token=credentials_dict['token'],
-                refresh_token=credentials_dict['refresh_token'],
-                token_uri=credentials_dict['token_uri'],
-                client_id=credentials_dict['client_id'],
-                client_secret=credentials_dict['client_secret'],
-                scopes=credentials_dict['scopes']
-            )
+        return {
+            'token': credentials.token,
+            'refresh_token': credentials.refresh_token,
+            'token_uri': credentials.token_uri,
+            'client_id': credentials.client_id,
+            'client_secret': credentials.client_secret,
+            'scopes': list(credentials.scopes) if credentials.scopes else credentials.scopes,
+            'expiry': credentials.expiry.isoformat() + 'Z' if credentials.expiry else None
+        }
+    
+    def renovar_credenciales(self, credentials_dict):
+        """
+        Renueva el token de acceso con el refresh_token y descarta el pool de las credenciales
+        anteriores, de modo que las siguientes llamadas crean uno con el token nuevo.
+        
+        Returns:
+            dict: Credenciales con el token y la expiración nuevos
+        """
+        credentials = self._crear_credenciales(credentials_dict)
+        credentials.refresh(Request())
+        descartar_pool(credentials_dict)
+        return self._credenciales_a_dict(credentials)
+    
+    def _crear_credenciales(self, credentials_dict):
+        """
+        Construye el objeto Credentials a partir del diccionario de credenciales.
+        """
+        return Credentials(
+            token=credentials_dict['token'],
+            refresh_token=credentials_dict['refresh_token'],
+            token_uri=credentials_dict['token_uri'],
+            client_id=credentials_dict['client_id'],
+            client_secret=credentials_dict['client_secret'],
+            scopes=credentials_dict['scopes'],
+            expiry=expiracion_credenciales(credentials_dict)
+        )
+    
+    def _build_service(self, credentials, http=None):
+        """
+        Construye el servicio de Gmail. Si se entrega un objeto http (por ejemplo
+        HttpMock/HttpMockSequence en pruebas), se usa en lugar de las credenciales.
+        """
+        if http is not None:
+            return build('gmail', 'v1', http=http, static_discovery=True)
+        return build('gmail', 'v1', credentials=credentials, static_discovery=True)
+    
+    def _pool_cuenta(self, credentials_dict):
+        """
+        Devuelve el pool de servicios de la cuenta, creándolo la primera vez. Si las
+        credenciales traen un token distinto (renovado por el almacén de tokens), el pool
+        pasa a usarlo, para no tener que renovarlo otra vez durante la sincronización.
+        El caché de pools está acotado por MAX_POOLS y SEGUNDOS_POOL_INACTIVO.
+        """
+        clave = _clave_pool(credentials_dict)
+        ahora = time.monotonic()
+        with _pools_lock:
+            pool = _pools.get(clave)
+            if pool is None:
+                pool = _pools[clave] = PoolCuenta(self._crear_credenciales(credentials_dict))
+            else:
+                _pools.move_to_end(clave)
+                if credentials_dict.get('token') and credentials_dict['token'] != pool.credentials.token:
+                    expiracion = expiracion_credenciales(credentials_dict)
+                    if pool.credentials.expiry is None or (expiracion and expiracion > pool.credentials.expiry):
+                        pool.credentials.token = credentials_dict['token']
+                        pool.credentials.expiry = expiracion
+            pool.ultimo_uso = ahora
+            descartados = _purgar_pools(ahora)
+        for descartado in descartados:
+            descartado.cerrar()
+        return pool
+    
+    @contextmanager
+    def _servicio(self, credentials_dict, http=None):
+        """
+        Entrega (servicio, pool) para una llamada: un servicio del pool de la cuenta o,
+        si se inyecta un transporte http (pruebas), un servicio construido sobre él y pool None.
+        """
+        if http is not None:
+            yield self._build_service(None, http), None
+            return
+        pool = self._pool_cuenta(credentials_dict)
+        with pool.servicio() as service:
+            yield service, pool
+    
+    def _remitente(self, msg):
+        """
+        Valor de la cabecera From de un mensaje de la API de Gmail (format='full' o 'metadata').
+        """
+        headers = msg.get('payload', {}).get('headers', [])
+        return next((header['value'] for header in headers if header['name'] == 'From'), '')
+    
+    def _extraer_email(self, msg):
+        """
+        Extrae asunto, remitente, fecha y cuerpo de un mensaje de la API de Gmail (format='full').
+        """
+        headers = msg['payload']['headers']
+        subject = next((header['value'] for header in headers if header['name'] == 'Subject'), '')
+        from_email = next((header['value'] for header in headers if header['name'] == 'From'), '')
+        date = next((header['value'] for header in headers if header['name'] == 'Date'), '')
+        
+        # Extraer el cuerpo del mensaje
+        body = ''
+        if 'parts' in msg['payload']:
+            for part in msg['payload']['parts']:
+                if part['mimeType'] == 'text/html':
+                    body = part['body']['data']
+                    break
+                elif part['mimeType'] == 'text/plain':
+                    body = part['body']['data']
+        elif 'body' in msg['payload'] and 'data' in msg['payload']['body']:
+            body = msg['payload']['body']['data']
+        
+        return {
+            'id': msg['id'],
+            'subject': subject,
+            'from': from_email,
+            'date': date,
+            'internalDate': msg.get('internalDate'),
+            'body': body
+        }
+    
+    def _obtener_mensajes(self, service, ids, pool=None, tamano_batch=TAMANO_BATCH, concurrencia=1, formato='full',
+                          fallidos=None):
+        """
+        Descarga mensajes usando el endpoint batch de Gmail. Los mensajes que ya están en
+        la caché local se leen del disco; los del banco descargados completos se guardan en ella.
+        
+        Los mensajes que fallan dentro de un batch se vuelven a pedir hasta REINTENTOS_BATCH
+        veces, con espera exponencial. Un 404 (mensaje borrado) no se reintenta.
+        
+        Args:
+            service: Servicio de Gmail
+            ids (list): Ids de los mensajes a descargar
+            pool (PoolCuenta, optional): Pool de la cuenta, del que cada hilo toma su propio
+                servicio cuando concurrencia > 1
+            tamano_batch (int): Mensajes por petición batch (máximo 100)
+            concurrencia (int): Peticiones batch simultáneas
+            formato (str): 'full', o 'metadata' para pedir solo la cabecera From
+            fallidos (list, optional): Recibe los ids que siguen fallando tras los reintentos
             
-            # Construir el servicio de Gmail
-            service = build('gmail', 'v1', credentials=credentials)
+        Returns:
+            dict: Mensajes descargados indexados por id. Los mensajes que fallan se omiten.
+        """
+        mensajes = self.cache.obtener_varios(ids)
+        if mensajes:
+            logger.info(f"{len(mensajes)} de {len(ids)} mensajes leídos de la caché local")
+            ids = [message_id for message_id in ids if message_id not in mensajes]
+        
+        tamano_batch = max(1, min(tamano_batch, 100))
+        
+        def ejecutar_lote(lote, service):
+            # Ids del lote a reintentar (cada lote tiene su propia lista: puede correr en otro hilo)
+            reintentar = []
+            
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    if isinstance(exception, HttpError) and exception.resp.status == 404:
+                        logger.warning(f"El mensaje {request_id} ya no existe en Gmail, se omite")
+                    else:
+                        logger.warning(f"Error al obtener el mensaje {request_id}: {str(exception)}")
+                        reintentar.append(request_id)
+                    return
+                mensajes[request_id] = response
+                if formato == 'full':
+                    self._guardar_en_cache(request_id, response)
             
-            # Buscar mensajes que coincidan con la consulta
-            results = service.users().messages().list(userId='me', q=query, maxResults=max_results).execute()
-            messages = results.get('messages', [])
+            batch = service.new_batch_http_request(callback=callback)
+            for message_id in lote:
+                if formato == 'metadata':
+                    peticion = service.users().messages().get(
+                        userId='me', id=message_id, format='metadata', metadataHeaders=['From']
+                    )
+                else:
+                    peticion = service.users().messages().get(userId='me', id=message_id, format=formato)
+                batch.add(peticion, request_id=message_id)
+            batch.execute()
+            return reintentar
+        
+        def ejecutar_en_hilo(lote):
+            # httplib2 no es thread-safe: cada hilo usa su propio servicio (y transporte) del pool
+            with pool.servicio() as service_hilo:
+                return ejecutar_lote(lote, service_hilo)
+        
+        pendientes = ids
+        for intento in range(REINTENTOS_BATCH + 1):
+            if not pendientes:
+                break
+            if intento:
+                espera = ESPERA_REINTENTO_BATCH * 2 ** (intento - 1)
+                logger.warning(f"Reintentando {len(pendientes)} mensajes en {espera:.1f} s (intento {intento} de {REINTENTOS_BATCH})")
+                time.sleep(espera)
             
-            if not messages:
-                logger.info("No se encontraron mensajes")
-                return []
+            lotes = [pendientes[i:i + tamano_batch] for i in range(0, len(pendientes), tamano_batch)]
+            if concurrencia <= 1 or pool is None or len(lotes) <= 1:
+                resultados = [ejecutar_lote(lote, service) for lote in lotes]
+            else:
+                with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+                    resultados = list(executor.map(ejecutar_en_hilo, lotes))
+            pendientes = [message_id for reintentar in resultados for message_id in reintentar]
+        
+        if pendientes:
+            logger.error(f"No se pudieron obtener {len(pendientes)} mensajes tras {REINTENTOS_BATCH} reintentos")
+            if fallidos is not None:
+                fallidos.extend(pendientes)
+        
+        return mensajes
+    
+    def _guardar_en_cache(self, message_id, mensaje):
+        """
+        Guarda en la caché local solo los correos del banco: el resto del buzón (correo
+        personal) no se escribe en disco.
+        """
+        if REMITENTE_BANCO in self._remitente(mensaje).lower():
+            self.cache.guardar(message_id, mensaje)
+    
+    def _filtrar_remitente(self, service, ids, pool, tamano_batch, concurrencia, remitente, fallidos=None):
+        """
+        Pide solo la cabecera From (format='metadata') de los mensajes y devuelve, en el
+        mismo orden, los ids de los enviados por el remitente indicado.
+        """
+        cabeceras = self._obtener_mensajes(service, ids, pool, tamano_batch, concurrencia, 'metadata', fallidos)
+        return [
+            message_id for message_id in ids
+            if message_id in cabeceras and remitente in self._remitente(cabeceras[message_id]).lower()
+        ]
+    
+    def _descargar_pagina(self, service, ids, pool, tamano_batch, concurrencia, excluir=None, remitente=None,
+                          fallidos=None):
+        """
+        Descarga una página de mensajes (omitiendo los que indique excluir y, si se indica
+        remitente, los de otros remitentes) y los genera en el mismo orden de ids.
+        """
+        if ids and excluir is not None:
+            omitidos = excluir(ids)
+            if omitidos:
+                logger.info(f"Omitiendo {len(omitidos)} mensajes ya procesados")
+                ids = [message_id for message_id in ids if message_id not in omitidos]
+        
+        if ids and remitente:
+            del_remitente = self._filtrar_remitente(service, ids, pool, tamano_batch, concurrencia, remitente, fallidos)
+            if len(del_remitente) < len(ids):
+                logger.info(f"Omitiendo {len(ids) - len(del_remitente)} mensajes de otros remitentes")
+            ids = del_remitente
+        
+        if not ids:
+            return
+        
+        mensajes = self._obtener_mensajes(service, ids, pool, tamano_batch, concurrencia, fallidos=fallidos)
+        # Mantener el orden devuelto por la búsqueda
+        for message_id in ids:
+            if message_id in mensajes:
+                yield self._extraer_email(mensajes.pop(message_id))
+    
+    def iter_emails(self, credentials_dict, query=f"from:{REMITENTE_BANCO}", limite=None,
+                    tamano_pagina=TAMANO_PAGINA, tamano_batch=TAMANO_BATCH, concurrencia=CONCURRENCIA_BATCH,
+                    excluir=None, http=None, fallidos=None):
+        """
+        Recorre todos los correos que coinciden con la consulta, siguiendo nextPageToken.
+        
+        Es un generador: cada página de resultados se descarga (mediante peticiones batch)
+        solo cuando se consume, por lo que la memoria usada no depende del tamaño del buzón.
+        
+        Args:
+            credentials_dict (dict): Credenciales de acceso a Gmail
+            query (str): Consulta de búsqueda de Gmail
+            limite (int, optional): Número máximo de mensajes a recorrer
+            tamano_pagina (int): Mensajes pedidos por página a messages.list (máximo 500)
+            tamano_batch (int): Mensajes por petición batch
+            concurrencia (int): Peticiones batch simultáneas
+            excluir (callable, optional): Recibe la lista de ids de una página y devuelve
+                el conjunto de ids que no hay que descargar
+            http (optional): Transporte HTTP a usar en lugar de las credenciales (pruebas)
+            fallidos (list, optional): Recibe los ids que no se pudieron descargar
+            
+        Yields:
+            dict: Correo con id, subject, from, date, internalDate y body
+        """
+        logger.info(f"Iniciando iter_emails con query: {query}")
+        with self._servicio(credentials_dict, http) as (service, pool):
+            page_token = None
+            recorridos = 0
+            pagina = 0
+            while True:
+                max_results = min(tamano_pagina, 500)
+                if limite is not None:
+                    max_results = min(max_results, limite - recorridos)
+                
+                results = service.users().messages().list(
+                    userId='me', q=query, maxResults=max_results, pageToken=page_token
+                ).execute()
+                ids = [message['id'] for message in results.get('messages', [])]
+                pagina += 1
+                logger.info(f"Página {pagina}: {len(ids)} mensajes")
+                recorridos += len(ids)
+                
+                yield from self._descargar_pagina(
+                    service, ids, pool, tamano_batch, concurrencia, excluir, fallidos=fallidos
+                )
+                
+                page_token = results.get('nextPageToken')
+                if not page_token or (limite is not None and recorridos >= limite):
+                    break
+        
+        logger.info(f"Recorridos {recorridos} mensajes en {pagina} páginas")
+    
+    def get_perfil(self, credentials_dict, http=None):
+        """
+        Obtiene la dirección y el historyId actual del buzón (users.getProfile).
+        
+        Returns:
+            dict: email y history_id del buzón
+        """
+        with self._servicio(credentials_dict, http) as (service, pool):
+            perfil = service.users().getProfile(userId='me').execute()
+        return {'email': perfil.get('emailAddress'), 'history_id': perfil.get('historyId')}
+    
+    def get_history_id(self, credentials_dict, http=None):
+        """
+        Obtiene el historyId actual del buzón (users.getProfile).
+        
+        Returns:
+            str: historyId del buzón
+        """
+        return self.get_perfil(credentials_dict, http)['history_id']
+    
+    def iter_emails_desde_historial(self, credentials_dict, start_history_id, limite=None,
+                                    tamano_batch=TAMANO_BATCH, concurrencia=CONCURRENCIA_BATCH, excluir=None, http=None,
+                                    remitente=REMITENTE_BANCO, fallidos=None):
+        """
+        Recorre solo los correos añadidos al buzón desde start_history_id (users.history.list).
+        
+        El historial incluye todo el correo nuevo, así que primero se pide solo la cabecera
+        From de cada mensaje y únicamente los del remitente se descargan completos.
+        
+        Args:
+            credentials_dict (dict): Credenciales de acceso a Gmail
+            start_history_id (str): historyId guardado en la sincronización anterior
+            limite (int, optional): Número máximo de mensajes a recorrer
+            tamano_batch (int): Mensajes por petición batch
+            concurrencia (int): Peticiones batch simultáneas
+            excluir (callable, optional): Igual que en iter_emails()
+            http (optional): Transporte HTTP a usar en lugar de las credenciales (pruebas)
+            remitente (str, optional): Remitente de los correos a descargar (None descarga todos)
+            fallidos (list, optional): Recibe los ids que no se pudieron descargar
             
-            logger.info(f"Se encontraron {len(messages)} mensajes")
+        Yields:
+            dict: Correo con id, subject, from, date, internalDate y body
             
-            emails = []
-            for message in messages:
-                msg = service.users().messages().get(userId='me', id=message['id'], format='full').execute()
+        Raises:
+            HistorialExpiradoError: Si Gmail ya no conserva el historial desde ese historyId
+        """
+        logger.info(f"Iniciando iter_emails_desde_historial desde historyId: {start_history_id}")
+        with self._servicio(credentials_dict, http) as (service, pool):
+            page_token = None
+            vistos = set()
+            recorridos = 0
+            while True:
+                try:
+                    results = service.users().history().list(
+                        userId='me', startHistoryId=start_history_id, historyTypes='messageAdded', pageToken=page_token
+                    ).execute()
+                except HttpError as e:
+                    if e.resp.status == 404:
+                        raise HistorialExpiradoError(f"historyId {start_history_id} expirado") from e
+                    raise
+                
+                ids = []
+                for registro in results.get('history', []):
+                    for agregado in registro.get('messagesAdded', []):
+                        message_id = agregado['message']['id']
+                        if message_id not in vistos:
+                            vistos.add(message_id)
+                            ids.append(message_id)
                 
-                # Extraer información del correo
-                headers = msg['payload']['headers']
-                subject = next((header['value'] for header in headers if header['name'] == 'Subject'), '')
-                from_email = next((header['value'] for header in headers if header['name'] == 'From'), '')
-                date = next((header['value'] for header in headers if header['name'] == 'Date'), '')
+                if limite is not None:
+                    ids = ids[:max(0, limite - recorridos)]
                 
-                # Extraer el cuerpo del mensaje
-                body = ''
-                if 'parts' in msg['payload']:
-                    for part in msg['payload']['parts']:
-                        if part['mimeType'] == 'text/html':
-                            body = part['body']['data']
-                            break
-                        elif part['mimeType'] == 'text/plain':
-                            body = part['body']['data']
-                elif 'body' in msg['payload'] and 'data' in msg['payload']['body']:
-                    body = msg['payload']['body']['data']
+                recorridos += len(ids)
                 
-                emails.append({
-                    'id': message['id'],
-                    'subject': subject,
-                    'from': from_email,
-                    'date': date,
-                    'body': body
-                })
+                yield from self._descargar_pagina(
+                    service, ids, pool, tamano_batch, concurrencia, excluir, remitente.lower() if remitente else None,
+                    fallidos
+                )
+                
+                page_token = results.get('nextPageToken')
+                if not page_token or (limite is not None and recorridos >= limite):
+                    break
+        
+        logger.info(f"Recorridos {recorridos} mensajes nuevos desde el historial")
+    
+    def iter_emails_cache(self, limite=None, tamano_pagina=TAMANO_PAGINA, excluir=None):
+        """
+        Recorre los correos guardados en la caché local, sin conectarse a Gmail.
+        Permite reprocesar el historial (por ejemplo tras cambiar el parser) solo desde disco.
+        
+        Args:
+            limite (int, optional): Número máximo de mensajes a recorrer
+            tamano_pagina (int): Ids que se entregan juntos a excluir
+            excluir (callable, optional): Igual que en iter_emails()
             
+        Yields:
+            dict: Correo con id, subject, from, date, internalDate y body
+        """
+        logger.info(f"Iniciando iter_emails_cache desde: {self.cache.directorio}")
+        pagina = []
+        recorridos = 0
+        for message_id in self.cache.iterar_ids():
+            if limite is not None and recorridos >= limite:
+                break
+            pagina.append(message_id)
+            recorridos += 1
+            if len(pagina) >= tamano_pagina:
+                yield from self._leer_pagina_cache(pagina, excluir)
+                pagina = []
+        
+        if pagina:
+            yield from self._leer_pagina_cache(pagina, excluir)
+        
+        logger.info(f"Recorridos {recorridos} mensajes de la caché local")
+    
+    def _leer_pagina_cache(self, ids, excluir):
+        if excluir is not None:
+            omitidos = excluir(ids)
+            ids = [message_id for message_id in ids if message_id not in omitidos]
+        for message_id in ids:
+            mensaje = self.cache.obtener(message_id)
+            if mensaje is not None:
+                yield self._extraer_email(mensaje)
+    
+    def get_emails(self, credentials_dict, query="from:serviciodetransferencias@bancochile.cl", max_results=10,
+                   tamano_batch=TAMANO_BATCH, concurrencia=CONCURRENCIA_BATCH, http=None):
+        """
+        Obtiene los correos electrónicos que coinciden con la consulta, como lista.
+        Para recorrer buzones grandes sin cargarlos en memoria usar iter_emails().
+        """
+        logger.info(f"Iniciando get_emails con query: {query}")
+        try:
+            emails = list(self.iter_emails(
+                credentials_dict, query=query, limite=max_results,
+                tamano_batch=tamano_batch, concurrencia=concurrencia, http=http
+            ))
             logger.info(f"Procesados {len(emails)} correos electrónicos")
             return emails
             
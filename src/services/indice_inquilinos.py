@@ -0,0 +1,246 @@
+"""
+Índice en memoria de los inquilinos para el matching de transferencias.
+Los nombres se normalizan una sola vez y se agrupan por monto, de modo que cada
+transferencia solo se compara con los inquilinos que pagan ese mismo monto.
+Dentro de cada monto, un índice invertido de trigramas de caracteres (por palabra)
+encuentra los candidatos sin recorrer todos los nombres y les asigna un puntaje,
+lo que tolera nombres en otro orden o abreviados. Un nombre abreviado con iniciales
+("J Perez" frente a "Juan Perez") tiene pocos trigramas en común con el completo, así que
+además se comparan las palabras una a una, aceptando una inicial en lugar de la palabra.
+El índice se reconstruye únicamente cuando cambia la tabla inquilinos.
+"""
+import os
+import re
+import logging
+import threading
+import unicodedata
+from collections import namedtuple
+from sqlalchemy import func
+from src.models.database import db
+from src.models.inquilino import Inquilino
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+PATRON_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]')
+PATRON_SEPARADOR = re.compile(r'[^a-z0-9]+')
+
+# Puntaje mínimo (0 a 1) para aceptar una coincidencia de nombre
+UMBRAL_COINCIDENCIA = float(os.getenv('MATCH_THRESHOLD', '0.7'))
+
+# Puntaje de un nombre que coincide con otro salvo por palabras abreviadas a su inicial
+PUNTAJE_INICIALES = 0.9
+
+# Inquilino tal como se guarda en el índice
+EntradaIndice = namedtuple('EntradaIndice', ['id', 'propietario', 'monto', 'nombre_norm', 'ngramas', 'palabras'])
+
+def normalizar_texto(texto):
+    """
+    Normalización de texto para comparación flexible: minúsculas, sin acentos
+    y solo letras y números.
+
+    Args:
+        texto (str): Texto a normalizar
+
+    Returns:
+        str: Texto normalizado
+    """
+    if not texto:
+        return ""
+
+    return PATRON_NO_ALFANUMERICO.sub('', _sin_acentos(texto))
+
+def _sin_acentos(texto):
+    return unicodedata.normalize('NFKD', texto.lower()).encode('ASCII', 'ignore').decode('ASCII')
+
+def palabras_nombre(texto):
+    """
+    Palabras del nombre en minúsculas y sin acentos.
+
+    Returns:
+        tuple: Palabras del nombre, en orden
+    """
+    if not texto:
+        return ()
+    return tuple(palabra for palabra in PATRON_SEPARADOR.split(_sin_acentos(texto)) if palabra)
+
+def ngramas_nombre(texto):
+    """
+    Trigramas de caracteres de cada palabra del nombre (con un espacio de relleno a
+    cada lado), de modo que el orden de las palabras no afecta al resultado.
+
+    Returns:
+        frozenset: Trigramas del nombre
+    """
+    if not texto:
+        return frozenset()
+
+    ngramas = set()
+    for palabra in palabras_nombre(texto):
+        relleno = f" {palabra} "
+        ngramas.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return frozenset(ngramas)
+
+def coincide_con_iniciales(palabras_a, palabras_b):
+    """
+    Indica si el nombre con menos palabras es el otro con alguna palabra abreviada a su
+    inicial, en cualquier orden: cada una de sus palabras completas está en el otro
+    nombre, cada inicial corresponde a una palabra distinta que empieza por ella, y hay
+    al menos una inicial y una palabra completa ("J Perez" y "Juan Perez", "Perez J" y
+    "Juan Perez", pero no "J P" ni "M Perez").
+    """
+    corto, largo = sorted((palabras_a, palabras_b), key=len)
+    completas = [palabra for palabra in corto if len(palabra) > 1]
+    iniciales = [palabra for palabra in corto if len(palabra) == 1]
+    if not completas or not iniciales:
+        return False
+
+    restantes = list(largo)
+    for palabra in completas:
+        if palabra not in restantes:
+            return False
+        restantes.remove(palabra)
+    for inicial in iniciales:
+        palabra = next((palabra for palabra in restantes if palabra[0] == inicial), None)
+        if palabra is None:
+            return False
+        restantes.remove(palabra)
+    return True
+
+def puntaje_similitud(emisor_norm, ngramas_emisor, entrada, palabras_emisor=None):
+    """
+    Similitud entre el emisor y un inquilino: 1.0 si un nombre normalizado contiene
+    al otro (el criterio original) y, si no, el coeficiente de Dice de sus trigramas,
+    elevado a PUNTAJE_INICIALES si un nombre es el otro abreviado con iniciales.
+    """
+    if entrada.nombre_norm and emisor_norm and (entrada.nombre_norm in emisor_norm or emisor_norm in entrada.nombre_norm):
+        return 1.0
+    total = len(ngramas_emisor) + len(entrada.ngramas)
+    if not total:
+        return 0.0
+    puntaje = 2.0 * len(ngramas_emisor & entrada.ngramas) / total
+    if puntaje < PUNTAJE_INICIALES and palabras_emisor and coincide_con_iniciales(palabras_emisor, entrada.palabras):
+        return PUNTAJE_INICIALES
+    return puntaje
+
+class _GrupoMonto:
+    """Inquilinos con un mismo monto y su índice invertido trigrama -> posiciones."""
+    def __init__(self):
+        self.entradas = []
+        self.indice = {}
+
+    def agregar(self, entrada):
+        posicion = len(self.entradas)
+        self.entradas.append(entrada)
+        for ngrama in entrada.ngramas:
+            self.indice.setdefault(ngrama, []).append(posicion)
+
+    def candidatos(self, ngramas_emisor):
+        # Solo los inquilinos que comparten al menos un trigrama con el emisor
+        posiciones = set()
+        for ngrama in ngramas_emisor:
+            posiciones.update(self.indice.get(ngrama, ()))
+        return [self.entradas[posicion] for posicion in posiciones]
+
+def _clave_monto(monto):
+    try:
+        return float(monto)
+    except (TypeError, ValueError):
+        return None
+
+class IndiceInquilinos:
+    def __init__(self, filas, version=None, umbral=None):
+        """
+        Args:
+            filas (iterable): Tuplas (id, propietario, monto) de los inquilinos
+            version (tuple, optional): Versión de la tabla con la que se construyó el índice
+            umbral (float, optional): Puntaje mínimo para aceptar una coincidencia
+                (por defecto MATCH_THRESHOLD)
+        """
+        self.version = version
+        self.umbral = UMBRAL_COINCIDENCIA if umbral is None else umbral
+        self.total = 0
+        self.por_monto = {}
+        for id_inquilino, propietario, monto in filas:
+            entrada = EntradaIndice(
+                id_inquilino, propietario, monto, normalizar_texto(propietario), ngramas_nombre(propietario),
+                palabras_nombre(propietario)
+            )
+            clave = _clave_monto(monto)
+            if clave not in self.por_monto:
+                self.por_monto[clave] = _GrupoMonto()
+            self.por_monto[clave].agregar(entrada)
+            self.total += 1
+
+    def candidatos(self, emisor, monto, limite=5):
+        """
+        Inquilinos con el mismo monto que la transferencia, ordenados por similitud
+        del nombre con el emisor (y por id en caso de empate).
+
+        Args:
+            emisor (str): Nombre del emisor tal como viene en el correo
+            monto: Monto de la transferencia (la coincidencia de monto es obligatoria)
+            limite (int, optional): Número máximo de candidatos a devolver
+
+        Returns:
+            list: Tuplas (puntaje, EntradaIndice) de mayor a menor puntaje
+        """
+        grupo = self.por_monto.get(_clave_monto(monto))
+        if grupo is None:
+            return []
+
+        emisor_norm = normalizar_texto(emisor)
+        ngramas_emisor = ngramas_nombre(emisor)
+        palabras_emisor = palabras_nombre(emisor)
+        puntuados = [
+            (puntaje_similitud(emisor_norm, ngramas_emisor, entrada, palabras_emisor), entrada)
+            for entrada in grupo.candidatos(ngramas_emisor)
+        ]
+        puntuados.sort(key=lambda candidato: (-candidato[0], candidato[1].id))
+        return puntuados[:limite] if limite else puntuados
+
+    def buscar(self, emisor, monto):
+        """
+        Busca el inquilino que mejor coincide con el emisor entre los que tienen el mismo monto.
+
+        Returns:
+            tuple: (EntradaIndice o None si ningún candidato alcanza el umbral, puntaje del mejor candidato)
+        """
+        candidatos = self.candidatos(emisor, monto, limite=1)
+        if not candidatos:
+            return None, 0.0
+        puntaje, entrada = candidatos[0]
+        if puntaje < self.umbral:
+            return None, puntaje
+        return entrada, puntaje
+
+def version_inquilinos():
+    """
+    Versión barata de la tabla inquilinos: cambia al crear, modificar o eliminar inquilinos.
+    """
+    return tuple(db.session.query(
+        func.count(Inquilino.id), func.max(Inquilino.id), func.max(Inquilino.ultima_actualizacion)
+    ).one())
+
+# Caché (por proceso) del índice
+_indice_cache = None
+_indice_lock = threading.Lock()
+
+def obtener_indice():
+    """
+    Devuelve el índice de inquilinos, reconstruyéndolo solo si la tabla cambió
+    desde la última vez. Cuesta una consulta de agregados cuando no hay cambios.
+    """
+    global _indice_cache
+
+    version = version_inquilinos()
+    indice = _indice_cache
+    if indice is not None and indice.version == version:
+        return indice
+
+    with _indice_lock:
+        if _indice_cache is None or _indice_cache.version != version:
+            filas = db.session.query(Inquilino.id, Inquilino.propietario, Inquilino.monto).order_by(Inquilino.id).all()
+            _indice_cache = IndiceInquilinos(filas, version)
+            logger.info(f"Índice de matching construido con {_indice_cache.total} inquilinos")
+        return _indice_cache
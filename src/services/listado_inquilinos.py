@@ -0,0 +1,219 @@
+"""
+Serialización masiva del listado de inquilinos sin hidratar objetos del ORM.
+Una sola consulta (inquilinos LEFT JOIN pagos) leída por lotes y convertida a JSON fila a fila,
+de modo que la memoria usada no crece con el número de inquilinos.
+Soporta filtros en SQL y paginación por cursor (keyset) sobre el id.
+"""
+import json
+import logging
+from sqlalchemy import select, literal_column, exists, and_, or_, not_
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from src.models.database import db
+from src.models.inquilino import Inquilino, obtener_columnas_pago, invalidar_columnas_pago
+from src.models.pago import Pago
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Filas que se leen del cursor en cada viaje a la base de datos
+TAMANO_LOTE = 500
+
+# Estados de pago por los que se puede filtrar
+ESTADOS_PAGO = ('Pagado', 'No pagado')
+
+def _formatear_fecha(fecha):
+    # Equivalente a strftime('%Y-%m-%d %H:%M:%S') pero sin pasar por el parser de formato
+    return fecha.isoformat(' ', 'seconds') if fecha else None
+
+def _escapar_like(valor):
+    return valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def condiciones_filtro(filtros):
+    """
+    Traduce los filtros del listado a predicados SQL sobre la tabla inquilinos.
+
+    Args:
+        filtros (dict): Claves opcionales propietario (prefijo), propiedad, monto_min,
+            monto_max y estado junto con mes y año del período a consultar
+
+    Returns:
+        list: Condiciones SQLAlchemy a combinar con AND
+    """
+    inquilinos = Inquilino.__table__
+    pagos = Pago.__table__
+    condiciones = []
+
+    if filtros.get('propietario'):
+        condiciones.append(inquilinos.c.propietario.like(_escapar_like(filtros['propietario']) + '%', escape='\\'))
+    if filtros.get('propiedad'):
+        condiciones.append(inquilinos.c.propiedad == filtros['propiedad'])
+    if filtros.get('monto_min') is not None:
+        condiciones.append(inquilinos.c.monto >= filtros['monto_min'])
+    if filtros.get('monto_max') is not None:
+        condiciones.append(inquilinos.c.monto <= filtros['monto_max'])
+
+    if filtros.get('estado'):
+        año, mes = filtros['año'], filtros['mes']
+        # Usa el índice único (inquilino_id, anio, mes) de la tabla pagos
+        pagado = exists().where(and_(
+            pagos.c.inquilino_id == inquilinos.c.id,
+            pagos.c.anio == año,
+            pagos.c.mes == mes,
+            pagos.c.estado == 'Pagado'
+        ))
+
+        # Bases de datos sin migrar: el período puede estar todavía en una columna legada
+        columna = f"pago_{mes:02d}_{año}"
+        if columna in obtener_columnas_pago():
+            pagado = or_(pagado, literal_column(f'inquilinos."{columna}"') == 'Pagado')
+
+        condiciones.append(pagado if filtros['estado'] == 'Pagado' else not_(pagado))
+
+    return condiciones
+
+def iterar_inquilinos(filtros=None, cursor=None, limite=None, tamano_lote=TAMANO_LOTE):
+    """
+    Ejecuta la consulta del listado y devuelve un generador de los inquilinos como
+    diccionarios con el mismo formato que Inquilino.to_dict().
+
+    La consulta se ejecuta al llamar a esta función y no al recorrer el generador, de modo
+    que un error se produce antes de empezar a enviar una respuesta por fragmentos. Si la
+    consulta falla porque las columnas pago_* cambiaron en otro proceso, se vuelve a
+    reflejar el esquema y se reintenta una vez.
+
+    Args:
+        filtros (dict, optional): Filtros aceptados por condiciones_filtro()
+        cursor (int, optional): Devolver solo inquilinos con id mayor que este valor
+        limite (int, optional): Número máximo de inquilinos a devolver
+        tamano_lote (int): Número de filas leídas por viaje a la base de datos
+
+    Returns:
+        generator: Diccionarios con los datos de cada inquilino y sus pagos como claves pago_MM_YYYY
+    """
+    try:
+        columnas_legacy, resultado = _ejecutar_listado(filtros, cursor, limite, tamano_lote)
+    except (OperationalError, ProgrammingError) as e:
+        logger.warning(f"Error en el listado de inquilinos, se vuelve a reflejar el esquema: {str(e)}")
+        db.session.rollback()
+        invalidar_columnas_pago()
+        columnas_legacy, resultado = _ejecutar_listado(filtros, cursor, limite, tamano_lote)
+    return _agrupar_filas(resultado, columnas_legacy)
+
+def obtener_inquilino(inquilino_id):
+    """
+    Devuelve un inquilino con el formato del listado, leído con la misma consulta que
+    iterar_inquilinos (columnas pago_* legadas incluidas, sin una consulta extra por fila).
+
+    Returns:
+        dict: Datos del inquilino, o None si no existe
+    """
+    filas = list(iterar_inquilinos(cursor=inquilino_id - 1, limite=1))
+    if filas and filas[0]['id'] == inquilino_id:
+        return filas[0]
+    return None
+
+def _ejecutar_listado(filtros, cursor, limite, tamano_lote):
+    inquilinos = Inquilino.__table__
+    pagos = Pago.__table__
+    columnas_legacy = obtener_columnas_pago()
+
+    condiciones = condiciones_filtro(filtros or {})
+    if cursor is not None:
+        condiciones.append(inquilinos.c.id > cursor)
+
+    # Página de inquilinos (filtrada y limitada) antes del JOIN con pagos,
+    # para que el límite cuente inquilinos y no filas de pagos
+    pagina = select(
+        inquilinos.c.id,
+        inquilinos.c.propietario,
+        inquilinos.c.propiedad,
+        inquilinos.c.telefono,
+        inquilinos.c.monto,
+        inquilinos.c.fecha_creacion,
+        inquilinos.c.ultima_actualizacion,
+        *[literal_column(f'inquilinos."{col}"').label(col) for col in columnas_legacy]
+    ).where(*condiciones).order_by(inquilinos.c.id)
+    if limite is not None:
+        pagina = pagina.limit(limite)
+    pagina = pagina.subquery('pagina')
+
+    query = select(
+        pagina.c.id,
+        pagina.c.propietario,
+        pagina.c.propiedad,
+        pagina.c.telefono,
+        pagina.c.monto,
+        pagina.c.fecha_creacion,
+        pagina.c.ultima_actualizacion,
+        pagos.c.anio,
+        pagos.c.mes,
+        pagos.c.estado,
+        *[pagina.c[col] for col in columnas_legacy]
+    ).select_from(
+        pagina.outerjoin(pagos, pagos.c.inquilino_id == pagina.c.id)
+    ).order_by(pagina.c.id)
+
+    resultado = db.session.execute(query.execution_options(yield_per=tamano_lote))
+    return columnas_legacy, resultado
+
+def _agrupar_filas(resultado, columnas_legacy):
+    # Una fila por (inquilino, pago): se agrupan las filas consecutivas del mismo inquilino
+    actual = None
+    for fila in resultado:
+        if actual is None or fila[0] != actual['id']:
+            if actual is not None:
+                yield actual
+
+            actual = {
+                'id': fila[0],
+                'propietario': fila[1],
+                'propiedad': fila[2],
+                'telefono': fila[3],
+                'monto': fila[4],
+                'fecha_creacion': _formatear_fecha(fila[5]),
+                'ultima_actualizacion': _formatear_fecha(fila[6])
+            }
+            # Columnas legadas primero: los registros de la tabla pagos tienen prioridad
+            for col, valor in zip(columnas_legacy, fila[10:]):
+                actual[col] = valor
+
+        año, mes, estado = fila[7], fila[8], fila[9]
+        if año is not None:
+            actual[f"pago_{mes:02d}_{año}"] = estado
+
+    if actual is not None:
+        yield actual
+
+def generar_json(filas):
+    """
+    Serializa un iterable de diccionarios como un array JSON, por fragmentos.
+
+    Yields:
+        str: Fragmentos del documento JSON
+    """
+    yield '['
+    separador = ''
+    for fila in filas:
+        yield separador + json.dumps(fila, separators=(',', ':'))
+        separador = ','
+    yield ']'
+
+def generar_json_pagina(filas, limite):
+    """
+    Serializa una página del listado como {"inquilinos": [...], "next_cursor": id | null}.
+    next_cursor es el id del último inquilino cuando la página está completa.
+
+    Yields:
+        str: Fragmentos del documento JSON
+    """
+    yield '{"inquilinos":['
+    separador = ''
+    total = 0
+    ultimo_id = None
+    for fila in filas:
+        yield separador + json.dumps(fila, separators=(',', ':'))
+        separador = ','
+        total += 1
+        ultimo_id = fila['id']
+    siguiente = ultimo_id if total == limite else None
+    yield '],"next_cursor":' + json.dumps(siguiente) + '}'
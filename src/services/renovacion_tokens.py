@@ -0,0 +1,134 @@
+"""
+Renovación anticipada de los tokens OAuth guardados en el servidor.
+Un hilo por worker del servidor renueva, cada cierto tiempo, los tokens que vencen dentro
+del margen configurado, de modo que las sincronizaciones siempre encuentran un token
+vigente y nunca tienen que renovarlo en medio de una petición. Cada token se reclama con
+un UPDATE condicional antes de renovarlo, así que solo un worker lo renueva.
+
+El hilo no se inicia al importar la aplicación (los scripts no lo necesitan): lo inicia
+gunicorn.conf.py en cada worker, o src/main.py al ejecutarse directamente.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from src.models.database import db
+from src.models.token_oauth import TokenOAuth
+from src.services import credenciales_cuentas
+from src.services.gmail_service_real import GmailServiceReal
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+ACTIVADA = os.getenv('TOKEN_REFRESH', '1').lower() not in ('0', 'false', 'no')
+
+# Se renuevan los tokens que vencen dentro de este margen
+SEGUNDOS_MARGEN = int(os.getenv('TOKEN_REFRESH_MARGIN_SECONDS', '900'))
+
+# Cada cuánto se buscan tokens por vencer
+SEGUNDOS_REVISION = int(os.getenv('TOKEN_REFRESH_TICK_SECONDS', '300'))
+
+# Una renovación reclamada hace más de este tiempo se considera abandonada (el worker murió)
+SEGUNDOS_ABANDONO = 120
+
+_gmail_service = GmailServiceReal()
+_hilo = None
+_hilo_lock = threading.Lock()
+
+def reclamar(token_id, limite, ahora):
+    """
+    Marca el token como en renovación si sigue por vencer y ningún otro worker lo está
+    renovando (o el que lo reclamó lo abandonó). El UPDATE es atómico: solo un worker lo obtiene.
+
+    Returns:
+        bool: True si esta llamada reclamó la renovación
+    """
+    tabla = TokenOAuth.__table__
+    abandono = ahora - timedelta(seconds=SEGUNDOS_ABANDONO)
+    resultado = db.session.execute(
+        update(tabla).where(
+            tabla.c.id == token_id,
+            or_(tabla.c.expiracion.is_(None), tabla.c.expiracion <= limite),
+            or_(tabla.c.inicio_renovacion.is_(None), tabla.c.inicio_renovacion < abandono)
+        ).values(inicio_renovacion=ahora)
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+def _liberar(token_id):
+    db.session.execute(
+        update(TokenOAuth.__table__).where(TokenOAuth.__table__.c.id == token_id).values(inicio_renovacion=None)
+    )
+    db.session.commit()
+
+def renovar_proximos(margen=SEGUNDOS_MARGEN):
+    """
+    Renueva los tokens que vencen dentro del margen (o cuya expiración se desconoce) y que
+    este worker logra reclamar. Requiere un contexto de aplicación.
+
+    Returns:
+        int: Número de tokens renovados
+    """
+    if not credenciales_cuentas.disponible():
+        return 0
+
+    ahora = datetime.utcnow()
+    limite = ahora + timedelta(seconds=margen)
+    tokens = TokenOAuth.query.filter(or_(TokenOAuth.expiracion.is_(None), TokenOAuth.expiracion <= limite)).all()
+
+    renovados = 0
+    for token in tokens:
+        cuenta = token.user.email
+        token_id = token.id
+        if not reclamar(token_id, limite, ahora):
+            continue
+        try:
+            credentials = credenciales_cuentas.descifrar(token)
+            if credentials and credentials.get('refresh_token'):
+                credenciales_cuentas.registrar(cuenta, _gmail_service.renovar_credenciales(credentials))
+                renovados += 1
+            token.inicio_renovacion = None
+            db.session.commit()
+        except Exception as e:
+            # Un token revocado no debe impedir renovar los demás
+            logger.error(f"No se pudo renovar el token de {cuenta}: {str(e)}")
+            db.session.rollback()
+            try:
+                _liberar(token_id)
+            except Exception as e:
+                logger.error(f"No se pudo liberar el token de {cuenta}: {str(e)}")
+                db.session.rollback()
+
+    if renovados:
+        logger.info(f"Tokens OAuth renovados: {renovados}")
+    return renovados
+
+def _bucle(app):
+    while True:
+        try:
+            with app.app_context():
+                try:
+                    renovar_proximos()
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            logger.error(f"Error en la renovación de tokens: {str(e)}")
+        time.sleep(SEGUNDOS_REVISION)
+
+def iniciar(app):
+    """
+    Inicia (una vez por proceso) el hilo de renovación de tokens, salvo con TOKEN_REFRESH=0.
+    Solo debe llamarse desde el punto de entrada del servidor.
+    """
+    global _hilo
+
+    if not ACTIVADA:
+        return False
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, args=(app,), name='renovacion-tokens', daemon=True)
+            _hilo.start()
+            logger.info(f"Renovación anticipada de tokens activada (revisión cada {SEGUNDOS_REVISION} s)")
+    return True
@@ -0,0 +1,254 @@
+"""
+Sincronización de todos los buzones registrados (tabla users).
+Las cuentas se sincronizan en un pool de hilos de tamaño acotado, empezando por las que
+llevan más tiempo sin sincronizar, y cada cuenta respeta un intervalo mínimo entre dos
+sincronizaciones. Cada sincronización registra el last_sync de su cuenta.
+
+Toda sincronización de una cuenta (manual, de todas las cuentas o automática) la reclama
+antes con un UPDATE condicional sobre su fila de programaciones_sync (en_curso), de modo
+que una cuenta no se sincroniza dos veces a la vez aunque haya varios workers, y las
+demás cuentas no esperan a que termine.
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import update, select, func, or_
+from sqlalchemy.exc import IntegrityError
+from src.models.database import db
+from src.models.user import User
+from src.models.programacion_sync import ProgramacionSync
+from src.services import credenciales_cuentas
+from src.services.sync_service import SyncService
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Cuentas que se sincronizan a la vez
+CONCURRENCIA_CUENTAS = int(os.getenv('SYNC_ACCOUNTS_CONCURRENCY', '2'))
+
+# Segundos mínimos entre dos sincronizaciones de una misma cuenta
+INTERVALO_MINIMO_CUENTA = int(os.getenv('SYNC_ACCOUNT_MIN_INTERVAL', '300'))
+
+# Una reclamación sin latido durante este tiempo se considera abandonada (p. ej. el worker se reinició)
+MINUTOS_ABANDONO = int(os.getenv('SYNC_JOB_TIMEOUT_MINUTES', '30'))
+
+# Cada cuánto se renueva una sincronización en curso (muy por debajo de MINUTOS_ABANDONO)
+SEGUNDOS_LATIDO = int(os.getenv('SYNC_HEARTBEAT_SECONDS', '60'))
+
+def programacion_cuenta(cuenta):
+    """
+    Id de la programación de la cuenta, creando el usuario y la programación si no existen.
+    Requiere un contexto de aplicación.
+    """
+    for _ in range(2):
+        user = User.query.filter(func.lower(User.email) == cuenta.lower()).first()
+        try:
+            if not user:
+                user = User(email=cuenta)
+                db.session.add(user)
+                db.session.flush()
+            if not user.programacion_sync:
+                db.session.add(ProgramacionSync(user_id=user.id))
+            db.session.commit()
+            return user.programacion_sync.id
+        except IntegrityError:
+            # Otro worker la creó a la vez
+            db.session.rollback()
+    raise RuntimeError(f"No se pudo crear la programación de la cuenta {cuenta}")
+
+def reclamar(programacion_id, ahora=None, solo_vencida=False):
+    """
+    Marca la cuenta como en sincronización si no hay otra en marcha (o la anterior quedó
+    abandonada). Con solo_vencida=True, además solo si la programación está activa y
+    vencida. El UPDATE es atómico: solo un worker la obtiene.
+
+    Returns:
+        bool: True si esta llamada reclamó la cuenta
+    """
+    ahora = ahora or datetime.utcnow()
+    tabla = ProgramacionSync.__table__
+    abandono = ahora - timedelta(minutes=MINUTOS_ABANDONO)
+    condiciones = [
+        tabla.c.id == programacion_id,
+        or_(tabla.c.en_curso.is_(False), tabla.c.inicio_ejecucion < abandono)
+    ]
+    if solo_vencida:
+        condiciones += [tabla.c.activa.is_(True), tabla.c.proxima_ejecucion <= ahora]
+    resultado = db.session.execute(update(tabla).where(*condiciones).values(en_curso=True, inicio_ejecucion=ahora))
+    db.session.commit()
+    return resultado.rowcount == 1
+
+def latido(programacion_id):
+    """
+    Renueva la reclamación de una sincronización larga para que no se considere abandonada.
+    """
+    tabla = ProgramacionSync.__table__
+    db.session.execute(
+        update(tabla).where(tabla.c.id == programacion_id, tabla.c.en_curso.is_(True)).values(inicio_ejecucion=datetime.utcnow())
+    )
+    db.session.commit()
+
+@contextmanager
+def latidos(app, renovar):
+    """
+    Mientras dura el bloque, llama a renovar() cada SEGUNDOS_LATIDO desde un hilo aparte.
+    Las fases largas sin progreso (listar o descargar un historial grande) no renuevan nada
+    por sí mismas y, sin esto, la sincronización se daría por abandonada.
+    """
+    detener = threading.Event()
+
+    def bucle():
+        with app.app_context():
+            try:
+                while not detener.wait(SEGUNDOS_LATIDO):
+                    try:
+                        renovar()
+                    except Exception as e:
+                        logger.warning(f"No se pudo renovar la sincronización en curso: {str(e)}")
+                        db.session.rollback()
+            finally:
+                db.session.remove()
+
+    hilo = threading.Thread(target=bucle, name='sync-latido', daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        detener.set()
+        hilo.join()
+
+def liberar(programacion_id, resultado=None):
+    """
+    Libera la cuenta y, si se entrega el resultado de la sincronización, programa la
+    próxima sincronización automática a un intervalo de esta.
+    """
+    tabla = ProgramacionSync.__table__
+    if resultado is None:
+        db.session.execute(update(tabla).where(tabla.c.id == programacion_id).values(en_curso=False))
+        db.session.commit()
+        return
+    intervalo_minutos = db.session.execute(select(tabla.c.intervalo_minutos).where(tabla.c.id == programacion_id)).scalar()
+    ahora = datetime.utcnow()
+    db.session.execute(
+        update(tabla).where(tabla.c.id == programacion_id).values(
+            en_curso=False,
+            ultima_ejecucion=ahora,
+            proxima_ejecucion=ahora + timedelta(minutes=intervalo_minutos or 0),
+            ultimo_resultado=resultado.get('mensaje')
+        )
+    )
+    db.session.commit()
+
+class SincronizadorCuentas:
+    def __init__(self, sync_service=None, concurrencia=CONCURRENCIA_CUENTAS, intervalo_minimo=INTERVALO_MINIMO_CUENTA):
+        self.sync_service = sync_service or SyncService()
+        self.concurrencia = max(1, concurrencia)
+        self.intervalo_minimo = intervalo_minimo
+
+    def cuentas_pendientes(self):
+        """
+        Cuentas a sincronizar, de la menos a la más recientemente sincronizada: las que
+        tienen credenciales registradas y no se sincronizaron dentro del intervalo mínimo.
+        Requiere un contexto de aplicación.
+
+        Returns:
+            list: Direcciones de correo de las cuentas
+        """
+        registradas = credenciales_cuentas.cuentas_registradas()
+        limite = datetime.utcnow() - timedelta(seconds=self.intervalo_minimo)
+        usuarios = User.query.order_by(User.last_sync.is_(None).desc(), User.last_sync.asc(), User.id).all()
+        return [
+            user.email for user in usuarios
+            if user.email.lower() in registradas and (user.last_sync is None or user.last_sync <= limite)
+        ]
+
+    def sincronizar_cuenta(self, app, cuenta, parametros=None, programacion_id=None):
+        """
+        Sincroniza una cuenta en su propio contexto de aplicación, reclamándola antes
+        (ver reclamar) y liberándola al terminar.
+
+        Args:
+            programacion_id (int, optional): Programación ya reclamada por quien llama
+                (la sincronización automática), que también se encarga de liberarla
+
+        Returns:
+            dict: Resultado de SyncService.sync_emails, o success=False con omitida=True
+                si la cuenta ya se está sincronizando
+        """
+        with app.app_context():
+            try:
+                reclamada = programacion_id is None
+                if reclamada:
+                    programacion_id = programacion_cuenta(cuenta)
+                    if not reclamar(programacion_id):
+                        logger.info(f"Cuenta {cuenta} omitida: ya hay una sincronización en curso")
+                        return {"success": False, "omitida": True, "mensaje": "Cuenta en sincronización"}
+
+                resultado = {"success": False, "mensaje": "Error en sincronización"}
+                try:
+                    credentials = credenciales_cuentas.obtener(cuenta)
+                    if not credentials:
+                        resultado = {"success": False, "mensaje": "No hay credenciales registradas para la cuenta"}
+                        return resultado
+                    logger.info(f"Sincronizando cuenta {cuenta}")
+                    with latidos(app, lambda: latido(programacion_id)):
+                        resultado = self.sync_service.sync_emails(credentials, **(parametros or {}))
+                    return resultado
+                finally:
+                    if reclamada:
+                        db.session.rollback()
+                        liberar(programacion_id, resultado)
+            finally:
+                db.session.remove()
+
+    def sincronizar_todas(self, app, parametros=None, progreso=None):
+        """
+        Sincroniza todas las cuentas pendientes con concurrencia acotada.
+
+        Args:
+            app (Flask): Aplicación, para abrir un contexto en cada hilo
+            parametros (dict, optional): Argumentos de sync_emails (por defecto, sincronización incremental)
+            progreso (callable, optional): Se llama al terminar cada cuenta con
+                (emails_procesados, pagos_actualizados, emails_omitidos) acumulados
+
+        Returns:
+            dict: Resultado combinado con el formato de sync_emails y el detalle por cuenta
+        """
+        with app.app_context():
+            cuentas = self.cuentas_pendientes()
+        logger.info(f"Sincronizando {len(cuentas)} cuentas con concurrencia {self.concurrencia}")
+
+        resultados = {}
+        totales = {'emails': 0, 'pagos_actualizados': 0, 'emails_omitidos': 0, 'emails_fallidos': 0}
+        with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix='sync-cuenta') as executor:
+            futuros = {executor.submit(self.sincronizar_cuenta, app, cuenta, parametros): cuenta for cuenta in cuentas}
+            for futuro in as_completed(futuros):
+                cuenta = futuros[futuro]
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    logger.error(f"Error al sincronizar la cuenta {cuenta}: {str(e)}")
+                    resultado = {"success": False, "mensaje": f"Error en sincronización: {str(e)}"}
+                resultados[cuenta] = resultado
+                for clave in totales:
+                    totales[clave] += resultado.get(clave) or 0
+                if progreso:
+                    progreso(totales['emails'], totales['pagos_actualizados'], totales['emails_omitidos'])
+
+        fallidas = [cuenta for cuenta, resultado in resultados.items() if not resultado.get('success') and not resultado.get('omitida')]
+        return {
+            "success": not fallidas,
+            "mensaje": (f"Se sincronizaron {len(resultados) - len(fallidas)} de {len(resultados)} cuentas. "
+                        f"Se actualizaron {totales['pagos_actualizados']} pagos."
+                        + (f" Fallaron: {', '.join(fallidas)}" if fallidas else "")),
+            **totales,
+            "modo": "cuentas",
+            "cuentas": resultados,
+            "fecha_sincronizacion": datetime.utcnow().isoformat() + "+00:00"
+        }
+
+# Instancia compartida por los trabajos en segundo plano y la sincronización automática
+sincronizador_cuentas = SincronizadorCuentas()
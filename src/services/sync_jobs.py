@@ -0,0 +1,257 @@
+"""
+Ejecución de sincronizaciones en segundo plano.
+POST /api/sync/emails encola la sincronización en un pool de hilos del proceso y responde
+de inmediato con el id del trabajo; el estado y el progreso se guardan en la tabla
+sync_jobs, de modo que cualquier worker puede responder a GET /api/sync/jobs/<id>.
+POST /api/sync/cuentas encola del mismo modo la sincronización de todas las cuentas.
+
+Un trabajo de una cuenta la reclama antes de registrarse, con la misma reclamación por
+cuenta que la sincronización automática (ver sync_cuentas.reclamar): cada cuenta tiene a
+lo sumo una sincronización en curso y las demás cuentas no esperan. Del trabajo de todas
+las cuentas solo puede haber uno activo: la comprobación y el alta se hacen en una misma
+transacción, serializada con un bloqueo de fila (ver _bloquear); dentro, cada cuenta se
+reclama por separado.
+"""
+import os
+import json
+import time
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from src.models.database import db
+from src.models.sync_job import SyncJob
+from src.models.configuracion import Configuracion
+from src.services.sync_service import SyncService
+from src.services import sync_cuentas
+from src.services.sync_cuentas import sincronizador_cuentas, MINUTOS_ABANDONO
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Sincronizaciones simultáneas por proceso
+HILOS_SYNC = int(os.getenv('SYNC_JOB_WORKERS', '1'))
+
+# Cada cuánto se guarda el progreso de un trabajo en curso
+SEGUNDOS_PROGRESO = 2
+
+# Fila de configuraciones que serializa el alta de trabajos entre workers
+CLAVE_BLOQUEO = "sync_job_bloqueo"
+
+class TrabajoEnCursoError(Exception):
+    """
+    Ya hay una sincronización pendiente o en curso. job_id es None si no es un trabajo
+    (por ejemplo una sincronización automática de la cuenta).
+    """
+    def __init__(self, job=None):
+        super().__init__(f"Ya hay una sincronización en curso ({job.id if job else 'automática'})")
+        self.job_id = job.id if job else None
+
+_executor = ThreadPoolExecutor(max_workers=HILOS_SYNC, thread_name_prefix='sync-job')
+_sync_service = SyncService()
+
+def trabajo_activo(cuenta=None):
+    """
+    Devuelve el trabajo pendiente o en curso más reciente de la cuenta (o, con cuenta=None,
+    de todas las cuentas), si hay uno que no esté abandonado.
+    """
+    limite = datetime.utcnow() - timedelta(minutes=MINUTOS_ABANDONO)
+    return SyncJob.query.filter(
+        SyncJob.estado.in_((SyncJob.PENDIENTE, SyncJob.EN_CURSO)),
+        SyncJob.fecha_actualizacion >= limite,
+        SyncJob.cuenta == cuenta if cuenta else SyncJob.cuenta.is_(None)
+    ).order_by(SyncJob.fecha_creacion.desc()).first()
+
+def _bloquear():
+    """
+    Toma el bloqueo de la fila CLAVE_BLOQUEO con un UPDATE, que se mantiene hasta el
+    commit o rollback: otro worker que intente registrar un trabajo espera a que esta
+    transacción termine (en SQLite, el UPDATE toma el bloqueo de escritura de la base).
+    La fila se crea la primera vez.
+    """
+    tabla = Configuracion.__table__
+    for _ in range(2):
+        resultado = db.session.execute(
+            update(tabla).where(tabla.c.clave == CLAVE_BLOQUEO).values(fecha_actualizacion=datetime.utcnow())
+        )
+        if resultado.rowcount:
+            return
+        try:
+            db.session.add(Configuracion(
+                clave=CLAVE_BLOQUEO, valor='-',
+                descripcion="Bloqueo para registrar un único trabajo de sincronización a la vez"
+            ))
+            db.session.commit()
+        except IntegrityError:
+            # Otro worker la creó a la vez
+            db.session.rollback()
+    raise RuntimeError("No se pudo tomar el bloqueo de los trabajos de sincronización")
+
+def _registrar_cuenta(cuenta, parametros):
+    """
+    Reclama la cuenta y registra su trabajo pendiente.
+
+    Returns:
+        tuple: (SyncJob creado, id de la programación reclamada)
+
+    Raises:
+        TrabajoEnCursoError: Si la cuenta ya se está sincronizando
+    """
+    programacion_id = sync_cuentas.programacion_cuenta(cuenta)
+    if not sync_cuentas.reclamar(programacion_id):
+        raise TrabajoEnCursoError(trabajo_activo(cuenta))
+    try:
+        job = SyncJob(estado=SyncJob.PENDIENTE, cuenta=cuenta, parametros=json.dumps(parametros))
+        db.session.add(job)
+        db.session.commit()
+        return job, programacion_id
+    except Exception:
+        db.session.rollback()
+        sync_cuentas.liberar(programacion_id)
+        raise
+
+def _registrar_todas(parametros):
+    """
+    Registra un trabajo pendiente de todas las cuentas si no hay otro activo, de forma atómica.
+
+    Raises:
+        TrabajoEnCursoError: Si ya hay un trabajo de todas las cuentas pendiente o en curso
+    """
+    try:
+        _bloquear()
+        activo = trabajo_activo()
+        if activo:
+            raise TrabajoEnCursoError(activo)
+        job = SyncJob(estado=SyncJob.PENDIENTE, parametros=json.dumps(parametros))
+        db.session.add(job)
+        db.session.commit()
+        return job
+    except Exception:
+        db.session.rollback()
+        raise
+
+def encolar(app, cuenta, credentials, parametros):
+    """
+    Reclama la cuenta, registra un trabajo de sincronización y lo envía al pool de hilos.
+
+    Args:
+        app (Flask): Aplicación, para abrir un contexto en el hilo del trabajo
+        cuenta (str): Cuenta que se sincroniza (la autorizada en la sesión)
+        credentials (dict): Credenciales de Gmail (no se guardan en la base de datos)
+        parametros (dict): Argumentos de SyncService.sync_emails (mes, año, completo, ...)
+
+    Returns:
+        SyncJob: Trabajo creado
+
+    Raises:
+        TrabajoEnCursoError: Si la cuenta ya se está sincronizando
+    """
+    job, programacion_id = _registrar_cuenta(cuenta, parametros)
+
+    def tarea(progreso):
+        resultado = {"success": False, "mensaje": "Error en sincronización"}
+        try:
+            resultado = _sync_service.sync_emails(credentials, progreso=progreso, **parametros)
+            return resultado
+        finally:
+            db.session.rollback()
+            sync_cuentas.liberar(programacion_id, resultado)
+
+    _executor.submit(_ejecutar, app, job.id, tarea, programacion_id)
+    logger.info(f"Sincronización encolada con id {job.id}")
+    return job
+
+def encolar_cuentas(app, parametros=None):
+    """
+    Registra un trabajo que sincroniza todas las cuentas de la tabla users
+    (ver SincronizadorCuentas) y lo envía al pool de hilos.
+
+    Returns:
+        SyncJob: Trabajo creado
+
+    Raises:
+        TrabajoEnCursoError: Si ya hay un trabajo de todas las cuentas pendiente o en curso
+    """
+    parametros = parametros or {}
+    job = _registrar_todas(dict(parametros, cuentas='todas'))
+
+    def tarea(progreso):
+        return sincronizador_cuentas.sincronizar_todas(app, parametros, progreso=progreso)
+
+    _executor.submit(_ejecutar, app, job.id, tarea)
+    logger.info(f"Sincronización de todas las cuentas encolada con id {job.id}")
+    return job
+
+def _actualizar(job_id, **valores):
+    db.session.execute(
+        update(SyncJob.__table__).where(SyncJob.__table__.c.id == job_id).values(fecha_actualizacion=datetime.utcnow(), **valores)
+    )
+    db.session.commit()
+
+def _ejecutar(app, job_id, tarea, programacion_id=None):
+    """
+    Ejecuta la sincronización en el hilo del pool y guarda su progreso y resultado.
+    Mientras corre, un latido renueva fecha_actualizacion (y la reclamación de la cuenta)
+    aunque la sincronización no informe progreso.
+
+    Args:
+        tarea (callable): Recibe la función de progreso y devuelve el resultado de la sincronización
+        programacion_id (int, optional): Programación de la cuenta reclamada para el trabajo
+    """
+    with app.app_context():
+        try:
+            _actualizar(job_id, estado=SyncJob.EN_CURSO, fecha_inicio=datetime.utcnow())
+
+            ultimo_guardado = 0.0
+
+            def progreso(emails_procesados, pagos_actualizados, emails_omitidos):
+                # No escribir en la base de datos por cada correo
+                nonlocal ultimo_guardado
+                ahora = time.monotonic()
+                if ahora - ultimo_guardado < SEGUNDOS_PROGRESO:
+                    return
+                ultimo_guardado = ahora
+                try:
+                    _actualizar(
+                        job_id, emails_procesados=emails_procesados,
+                        pagos_actualizados=pagos_actualizados, emails_omitidos=emails_omitidos
+                    )
+                except Exception as e:
+                    logger.warning(f"No se pudo guardar el progreso del trabajo {job_id}: {str(e)}")
+                    db.session.rollback()
+
+            def renovar():
+                _actualizar(job_id)
+                if programacion_id is not None:
+                    sync_cuentas.latido(programacion_id)
+
+            with sync_cuentas.latidos(app, renovar):
+                resultado = tarea(progreso)
+
+            _actualizar(
+                job_id,
+                estado=SyncJob.COMPLETADO if resultado.get('success') else SyncJob.ERROR,
+                modo=resultado.get('modo'),
+                emails_procesados=resultado.get('emails', 0),
+                pagos_actualizados=resultado.get('pagos_actualizados', 0),
+                emails_omitidos=resultado.get('emails_omitidos', 0),
+                mensaje=resultado.get('mensaje'),
+                error=None if resultado.get('success') else resultado.get('mensaje'),
+                fecha_sincronizacion=resultado.get('fecha_sincronizacion'),
+                fecha_fin=datetime.utcnow()
+            )
+            logger.info(f"Trabajo de sincronización {job_id} terminado: {resultado.get('mensaje')}")
+        except Exception as e:
+            logger.error(f"Error en el trabajo de sincronización {job_id}: {str(e)}")
+            db.session.rollback()
+            try:
+                _actualizar(
+                    job_id, estado=SyncJob.ERROR, error=str(e),
+                    mensaje=f"Error en sincronización: {str(e)}", fecha_fin=datetime.utcnow()
+                )
+            except Exception as e2:
+                logger.error(f"No se pudo registrar el error del trabajo {job_id}: {str(e2)}")
+                db.session.rollback()
+        finally:
+            db.session.remove()
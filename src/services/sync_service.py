@@ -2,40 +2,108 @@
 Servicio para la sincronización de correos electrónicos y actualización de pagos mensuales.
 Versión final con filtrado por fecha de recepción, matching flexible por nombre y monto, y logs detallados.
 """
+import os
 import logging
-import re
-import unicodedata
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 import pytz
-from src.services.gmail_service_real import GmailServiceReal
-from src.services.email_parser import EmailParser
+from src.services.gmail_service_real import GmailServiceReal, HistorialExpiradoError
+from src.services.email_parser import EmailParser, ParseoParalelo
+from src.services.indice_inquilinos import obtener_indice, normalizar_texto
+from src.services.traza_sync import TrazaSync, instalar_filtro
+from src.services import credenciales_cuentas
 from src.models.configuracion import Configuracion
-from src.models.inquilino import Inquilino
+from src.models.pago import Pago
+from src.models.mensaje_procesado import MensajeProcesado
+from src.models.user import User
+from src.models.token_oauth import TokenOAuth
 from src.models.database import db
-from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Remitente de los correos de transferencias del Banco de Chile
+REMITENTE_TRANSFERENCIAS = "serviciodetransferencias@bancochile.cl"
+
+# Clave en Configuracion del historyId de Gmail de la última sincronización
+# (seguida de ":<cuenta>", porque cada buzón tiene su propio historial)
+CLAVE_HISTORY_ID = "gmail_history_id"
+
+# Días de margen a cada lado del mes en los filtros after:/before: de Gmail, que usan
+# la medianoche en la zona horaria del Pacífico y no la de Chile ni la del servidor
+MARGEN_DIAS_QUERY = 1
+
+# Parseo en paralelo (opcional): número de procesos (0 o 1 = en serie) y correos por tarea
+PROCESOS_PARSEO = int(os.getenv('SYNC_PARSE_WORKERS', '0'))
+TAMANO_CHUNK_PARSEO = int(os.getenv('SYNC_PARSE_CHUNKSIZE', '8'))
+
+# El detalle en DEBUG del parser y del matching sigue el muestreo de la traza (ver traza_sync.py)
+instalar_filtro(__name__, 'src.services.email_parser')
+
+# Tablas que escribe la sincronización. Se comprueban (y se crean si faltan) una sola
+# vez por proceso, antes de recorrer los correos; después no se refleja el esquema.
+TABLAS_SINCRONIZACION = (
+    Pago.__table__, MensajeProcesado.__table__, Configuracion.__table__, User.__table__, TokenOAuth.__table__
+)
+_esquema_preparado = False
+_esquema_lock = threading.Lock()
+
+def preparar_esquema():
+    """
+    Crea en un solo paso las tablas que necesita la sincronización y que falten
+    (por ejemplo si el create_all del arranque falló en carrera con otro worker).
+    """
+    global _esquema_preparado
+
+    if _esquema_preparado:
+        return
+    with _esquema_lock:
+        if not _esquema_preparado:
+            for tabla in TABLAS_SINCRONIZACION:
+                tabla.create(bind=db.engine, checkfirst=True)
+            _esquema_preparado = True
+            logger.info("Esquema de sincronización verificado")
+
 class SyncService:
     def __init__(self):
         self.gmail_service = GmailServiceReal()
         self.email_parser = EmailParser()
 
-    def sync_emails(self, credentials, mes=None, año=None):
+    def sync_emails(self, credentials, mes=None, año=None, limite=None, completo=False, reprocesar=False, desde_cache=False,
+                    procesos_parseo=None, tamano_chunk_parseo=None, progreso=None, muestreo_traza=None):
         """
         Sincroniza los correos electrónicos con Gmail y actualiza el estado de pago.
         
+        Si hay un historyId guardado de una sincronización anterior, solo se procesan los
+        correos añadidos desde entonces (users.history.list), sin filtrar por mes para no
+        perder correos de otros períodos. Si el historial expiró, o si se pide completo=True,
+        se recorre el buzón completo.
+        
+        Los correos ya registrados en mensajes_procesados se omiten antes de descargarlos,
+        salvo que se pida reprocesar=True. Con desde_cache=True se procesan los correos de la
+        caché local en disco, sin conectarse a Gmail.
+        
         Args:
             credentials (dict): Credenciales de acceso a Gmail
             mes (str, optional): Mes para filtrar correos (formato: 01-12)
             año (str, optional): Año para filtrar correos (formato: YYYY)
+            limite (int, optional): Número máximo de correos a recorrer (por defecto, todos)
+            completo (bool): Ignorar el historyId guardado y recorrer todo el buzón
+            reprocesar (bool): Volver a procesar también los correos ya procesados
+            desde_cache (bool): Procesar solo los correos de la caché local
+            procesos_parseo (int, optional): Procesos para parsear en paralelo (por defecto SYNC_PARSE_WORKERS)
+            tamano_chunk_parseo (int, optional): Correos por tarea del pool (por defecto SYNC_PARSE_CHUNKSIZE)
+            progreso (callable, optional): Se llama tras cada correo procesado con
+                (emails_procesados, pagos_actualizados, emails_omitidos)
+            muestreo_traza (float, optional): Fracción (0 a 1) de correos con registro de traza
+                y detalle en DEBUG (por defecto SYNC_TRACE_SAMPLE)
             
         Returns:
             dict: Resultado de la sincronización
         """
+        traza = TrazaSync(muestreo=muestreo_traza)
         try:
             # Log de inicio de sincronización
             logger.info("==================== INICIO DE SINCRONIZACIÓN ====================")
@@ -50,85 +118,159 @@ class SyncService:
                     logger.warning(f"Formato de mes inválido: {mes}, se usará sin normalizar")
             
             # Modificar la consulta para buscar por remitente en lugar de asunto
-            query = "from:serviciodetransferencias@bancochile.cl"
-            
-            logger.info(f"Ejecutando búsqueda con query: {query}")
-            
-            # Obtener correos
-            emails = self.gmail_service.get_emails(credentials, query=query)
-            
-            logger.info(f"Se encontraron {len(emails)} correos del servicio de transferencias.")
-            
-            # Si se especificó un mes, filtrar los correos por la fecha de RECEPCIÓN
-            emails_filtrados = []
-            if mes and mes != 'todos':
-                logger.info(f"Filtrando correos por mes seleccionado: {mes}")
-                for email in emails:
-                    # Extraer la fecha de recepción del correo
-                    fecha_recepcion = None
-                    if 'internalDate' in email:
-                        try:
-                            # internalDate es un timestamp en milisegundos
-                            timestamp_ms = int(email['internalDate'])
-                            fecha_recepcion = datetime.fromtimestamp(timestamp_ms/1000.0)
-                            mes_recepcion = f"{fecha_recepcion.month:02d}"
-                            
-                            logger.info(f"Correo recibido en fecha: {fecha_recepcion}, mes: {mes_recepcion}")
-                            
-                            # CORRECCIÓN: Mostrar detalles de la comparación para depuración
-                            logger.info(f"Comparando mes de recepción '{mes_recepcion}' con mes seleccionado '{mes}'")
-                            
-                            # Filtrar por mes de recepción
-                            if mes_recepcion == mes:
-                                logger.info(f"Correo coincide con el mes seleccionado: {mes}")
-                                emails_filtrados.append(email)
-                                continue
-                        except Exception as e:
-                            logger.error(f"Error al procesar fecha de recepción: {str(e)}")
-                    
-                    # Si no se pudo extraer la fecha de recepción, intentar con la fecha de la transferencia
-                    transfer_data = self.email_parser.parse_banco_chile_email(email)
-                    if transfer_data and 'mes' in transfer_data:
-                        mes_correo = f"{transfer_data['mes']:02d}"
-                        logger.info(f"Usando fecha de transferencia, mes: {mes_correo}")
-                        
-                        # CORRECCIÓN: Mostrar detalles de la comparación para depuración
-                        logger.info(f"Comparando mes del correo '{mes_correo}' con mes seleccionado '{mes}' (tipos: {type(mes_correo)}, {type(mes)})")
-                        
-                        if mes_correo == mes:
-                            logger.info(f"Correo coincide con el mes seleccionado por fecha de transferencia: {mes}")
-                            emails_filtrados.append(email)
-                
-                logger.info(f"Después de filtrar por mes {mes}, quedan {len(emails_filtrados)} correos")
-                emails = emails_filtrados
-            
-            # Procesar cada correo para actualizar pagos
+            query = f"from:{REMITENTE_TRANSFERENCIAS}"
+            
+            # Con mes y año, acotar la búsqueda en Gmail a ese mes (el filtro local
+            # por fecha de recepción sigue descartando los días de margen)
+            rango = self._rango_fechas_query(mes, año)
+            if rango:
+                query = f"{query} {rango}"
+            
+            # DDL y reflexión antes del bucle: el procesamiento de cada correo no toca el esquema
+            preparar_esquema()
+            
+            # historyId actual, tomado ANTES de recorrer el buzón para no perder
+            # correos que lleguen durante la sincronización
+            if desde_cache:
+                history_id_actual = history_id_guardado = cuenta = None
+                estado = {'modo': 'cache'}
+            else:
+                perfil = self.gmail_service.get_perfil(credentials)
+                history_id_actual, cuenta = perfil['history_id'], perfil.get('email')
+                history_id_guardado = None if completo else self._obtener_history_id(cuenta)
+                estado = {'modo': 'incremental' if history_id_guardado else 'completo'}
+                # Guardar las credenciales en el servidor si son nuevas, para que el
+                # sincronizador de cuentas y la renovación de tokens puedan usarlas
+                if cuenta and credenciales_cuentas.obtener(cuenta) != credentials:
+                    credenciales_cuentas.registrar(cuenta, credentials)
+                    db.session.commit()
+            logger.info(f"Modo de sincronización: {estado['modo']}, cuenta: {cuenta}, query: {query}")
+            
+            # Recorrer los correos página a página: cada correo se filtra y procesa
+            # a medida que llega, sin cargar el buzón completo en memoria
+            emails_encontrados = 0
+            emails_procesados = 0
             pagos_actualizados = 0
-            for i, email in enumerate(emails):
-                logger.info(f"==================== PROCESANDO CORREO {i+1}/{len(emails)} ====================")
-                
-                # Parsear el correo para extraer información
-                transfer_data = self.email_parser.parse_banco_chile_email(email)
+            emails_omitidos = 0
+            
+            # Resultados de parseo de esta sincronización, por id de mensaje: el filtro
+            # por mes y el procesamiento comparten el mismo resultado. Cada entrada se
+            # descarta en cuanto se termina de procesar su correo
+            resultados_parseo = {}
+            
+            # Índice de matching: se carga una vez por sincronización (y solo se
+            # reconstruye si la tabla inquilinos cambió desde la anterior)
+            indice = obtener_indice()
+            
+            # Pagos y registros de mensajes procesados pendientes: se escriben todos
+            # juntos al final, en una sola transacción
+            pagos_pendientes = []
+            registros_pendientes = []
+            
+            def excluir_procesados(ids):
+                # Una consulta por página de resultados, antes de cualquier messages.get
+                nonlocal emails_omitidos
+                omitidos = MensajeProcesado.ids_procesados(ids)
+                emails_omitidos += len(omitidos)
+                return omitidos
+            
+            # Ids que Gmail no entregó ni tras los reintentos del batch
+            fallidos = []
+            
+            excluir = None if reprocesar else excluir_procesados
+            correos = self._iterar_correos(credentials, query, limite, history_id_guardado, estado, excluir, fallidos)
+            
+            procesos = PROCESOS_PARSEO if procesos_parseo is None else procesos_parseo
+            if procesos > 1:
+                tamano_chunk = tamano_chunk_parseo or TAMANO_CHUNK_PARSEO
+                correos = self._preparsear_en_paralelo(correos, resultados_parseo, procesos, tamano_chunk)
+            
+            for email in traza.medir_descarga(correos):
+                # El historial incluye todos los correos nuevos, no solo los del banco
+                if estado['modo'] == 'incremental' and REMITENTE_TRANSFERENCIAS not in email.get('from', ''):
+                    continue
+                emails_encontrados += 1
                 
-                if transfer_data:
-                    logger.info(f"Datos extraídos del correo: {transfer_data}")
+                # Un registro de traza por correo, con los tiempos de cada etapa y el resultado
+                correo = traza.correo(email.get('id'))
+                try:
+                    # Si se especificó un mes, filtrar los correos por la fecha de RECEPCIÓN
+                    # (en modo incremental se procesan todos los correos nuevos)
+                    if estado['modo'] != 'incremental' and mes and mes != 'todos':
+                        with correo.etapa('filtro_mes'):
+                            coincide = self._coincide_mes(email, mes, resultados_parseo)
+                        if not coincide:
+                            correo.anotar(resultado='otro_mes')
+                            continue
+                    
+                    emails_procesados += 1
+                    logger.debug("Procesando correo %s (ID: %s)", emails_procesados, email.get('id'))
+                    
+                    # Parsear el correo para extraer información (o reutilizar el resultado del filtro)
+                    with correo.etapa('parseo'):
+                        transfer_data = self._parsear(email, resultados_parseo)
                     
-                    # Actualizar el estado de pago del inquilino correspondiente
-                    actualizado = self._actualizar_pago_inquilino(transfer_data, mes, año)
-                    if actualizado:
-                        pagos_actualizados += 1
-                        logger.info(f"Pago actualizado correctamente para este correo")
+                    if transfer_data:
+                        # Actualizar el estado de pago del inquilino correspondiente
+                        detalle = {}
+                        with correo.etapa('matching'):
+                            actualizado = self._actualizar_pago_inquilino(transfer_data, mes, año, detalle, indice, pagos_pendientes)
+                        correo.anotar(emisor=transfer_data.get('emisor'), monto=transfer_data.get('monto'), puntaje=detalle.get('puntaje'))
+                        if actualizado:
+                            pagos_actualizados += 1
+                            correo.anotar(
+                                resultado=MensajeProcesado.PAGADO, inquilino_id=detalle['inquilino_id'],
+                                periodo=f"{detalle['mes']:02d}/{detalle['año']}"
+                            )
+                            registros_pendientes.append({
+                                'id': email['id'], 'resultado': MensajeProcesado.PAGADO,
+                                'inquilino_id': detalle['inquilino_id'], 'año': detalle['año'], 'mes': detalle['mes']
+                            })
+                        elif detalle.get('error'):
+                            # Los errores no se registran, para reintentarlos en la próxima sincronización
+                            correo.anotar(resultado='error', motivo=detalle.get('motivo') or "Error en el matching, se reintentará")
+                        else:
+                            correo.anotar(resultado=MensajeProcesado.SIN_MATCH, motivo=detalle.get('motivo'))
+                            registros_pendientes.append({
+                                'id': email['id'], 'resultado': MensajeProcesado.SIN_MATCH, 'motivo': detalle.get('motivo')
+                            })
                     else:
-                        logger.warning(f"No se pudo actualizar el pago para este correo")
-                else:
-                    logger.warning(f"No se pudieron extraer datos de este correo")
+                        motivo = "No se pudieron extraer los datos de la transferencia"
+                        correo.anotar(resultado=MensajeProcesado.SIN_DATOS, motivo=motivo)
+                        registros_pendientes.append({
+                            'id': email['id'], 'resultado': MensajeProcesado.SIN_DATOS, 'motivo': motivo
+                        })
+                finally:
+                    correo.cerrar()
+                    # El resultado ya no se usa: no acumular uno por correo durante toda la sincronización
+                    resultados_parseo.pop(email.get('id'), None)
+                
+                if progreso:
+                    progreso(emails_procesados, pagos_actualizados, emails_omitidos)
+            
+            # El historyId solo es un punto de control válido si se revisó todo lo anterior:
+            # tras una sincronización incremental o un recorrido completo sin filtros, y sin
+            # correos que no se pudieron descargar (se pedirán otra vez en la próxima)
+            guardar_history_id = history_id_actual and limite is None and not fallidos and (
+                estado['modo'] == 'incremental' or not mes or mes == 'todos'
+            )
+            if fallidos:
+                logger.error(f"{len(fallidos)} correos no se pudieron descargar; el historyId no avanza")
             
             # Actualizar fecha de última sincronización - USAR UTC EXPLÍCITAMENTE
             now = datetime.now(pytz.UTC)
             logger.info(f"Actualizando fecha de última sincronización a: {now}")
             
-            # Usar una nueva sesión para evitar bloqueos
+            # Pagos, mensajes procesados, fecha de sincronización e historyId en una sola
+            # transacción: si algo falla no se guarda nada y la próxima sincronización
+            # vuelve a procesar los mismos correos
             try:
+                with traza.etapa('escritura'):
+                    insertados, actualizados = Pago.registrar_lote(pagos_pendientes)
+                    MensajeProcesado.registrar_lote(registros_pendientes)
+                logger.info(f"Pagos escritos en lote: {insertados} nuevos, {actualizados} actualizados; "
+                            f"{len(registros_pendientes)} correos registrados como procesados")
+                
                 # Buscar configuración existente o crear una nueva
                 config = Configuracion.query.filter_by(clave="ultima_sincronizacion").first()
                 
@@ -147,20 +289,50 @@ class SyncService:
                 
                 # Guardar en la base de datos
                 db.session.add(config)
-                db.session.commit()
+                if guardar_history_id:
+                    self._guardar_history_id(history_id_actual, cuenta)
+                if cuenta:
+                    User.registrar_sync(cuenta, now.replace(tzinfo=None))
+                with traza.etapa('escritura'):
+                    db.session.commit()
                 
                 logger.info(f"Fecha de última sincronización guardada: {config.valor}")
             except SQLAlchemyError as e:
-                logger.error(f"Error al guardar fecha de sincronización: {str(e)}")
+                logger.error(f"Error al guardar los resultados de la sincronización, no se guardó ningún pago: {str(e)}")
                 db.session.rollback()
+                traza.resumen(
+                    cuenta=cuenta, modo=estado['modo'], encontrados=emails_encontrados, procesados=emails_procesados,
+                    omitidos=emails_omitidos, pagos=0, error=str(e)
+                )
+                return {
+                    "success": False,
+                    "mensaje": (f"Se encontraron {emails_procesados} transferencias, pero falló la escritura de los "
+                                f"{len(pagos_pendientes)} pagos y no se guardó ninguno: {str(e)}"),
+                    "emails": emails_procesados,
+                    "pagos_actualizados": 0,
+                    "emails_omitidos": emails_omitidos,
+                    "modo": estado['modo']
+                }
             
+            traza.resumen(
+                cuenta=cuenta, modo=estado['modo'], mes=mes, año=año, encontrados=emails_encontrados,
+                procesados=emails_procesados, omitidos=emails_omitidos, pagos=pagos_actualizados, fallidos=len(fallidos)
+            )
             logger.info("==================== FIN DE SINCRONIZACIÓN ====================")
             
+            mensaje = f"Se encontraron {emails_procesados} transferencias. Se actualizaron {pagos_actualizados} pagos."
+            if fallidos:
+                mensaje += f" No se pudieron descargar {len(fallidos)} correos; se reintentarán en la próxima sincronización."
+            
             return {
                 "success": True,
-                "mensaje": f"Se encontraron {len(emails)} transferencias. Se actualizaron {pagos_actualizados} pagos.",
-                "emails": len(emails),
+                "mensaje": mensaje,
+                "emails": emails_procesados,
                 "pagos_actualizados": pagos_actualizados,
+                "emails_omitidos": emails_omitidos,
+                "emails_fallidos": len(fallidos),
+                "modo": estado['modo'],
+                "cuenta": cuenta,
                 "fecha_sincronizacion": now.isoformat()  # Incluir la fecha en la respuesta
             }
         except Exception as e:
@@ -178,31 +350,186 @@ class SyncService:
                 "pagos_actualizados": 0
             }
     
-    def normalizar_texto(self, texto):
+    def _iterar_correos(self, credentials, query, limite, history_id_guardado, estado, excluir=None, fallidos=None):
         """
-        Normalización de texto para comparación flexible.
+        Genera los correos a procesar: los de la caché local en modo 'cache', los añadidos
+        desde history_id_guardado si existe, o todos los que coinciden con la consulta. Si el historial expiró, cambia
+        estado['modo'] a 'completo' y recorre el buzón completo. Los ids que no se pudieron
+        descargar se añaden a fallidos.
+        """
+        if estado['modo'] == 'cache':
+            yield from self.gmail_service.iter_emails_cache(limite=limite, excluir=excluir)
+            return
+        
+        if history_id_guardado:
+            try:
+                yield from self.gmail_service.iter_emails_desde_historial(
+                    credentials, history_id_guardado, limite=limite, excluir=excluir, fallidos=fallidos
+                )
+                return
+            except HistorialExpiradoError as e:
+                logger.warning(f"{str(e)}, se hará un recorrido completo del buzón")
+                estado['modo'] = 'completo'
+        
+        yield from self.gmail_service.iter_emails(credentials, query=query, limite=limite, excluir=excluir, fallidos=fallidos)
+    
+    def _clave_history_id(self, cuenta):
+        return f"{CLAVE_HISTORY_ID}:{cuenta.lower()}" if cuenta else CLAVE_HISTORY_ID
+    
+    def _obtener_history_id(self, cuenta=None):
+        """
+        Obtiene el historyId guardado en la última sincronización de la cuenta, si existe.
+        """
+        config = Configuracion.query.filter_by(clave=self._clave_history_id(cuenta)).first()
+        return config.valor if config and config.valor else None
+    
+    def _guardar_history_id(self, history_id, cuenta=None):
+        """
+        Guarda el historyId de la cuenta en Configuracion. No hace commit.
+        """
+        clave = self._clave_history_id(cuenta)
+        config = Configuracion.query.filter_by(clave=clave).first()
+        if not config:
+            config = Configuracion(
+                clave=clave,
+                valor=str(history_id),
+                descripcion="historyId de Gmail de la última sincronización (para sincronización incremental)"
+            )
+            db.session.add(config)
+        else:
+            config.valor = str(history_id)
+        logger.info(f"historyId guardado para la próxima sincronización: {history_id}")
+    
+    def _rango_fechas_query(self, mes, año):
+        """
+        Convierte el mes y año seleccionados en filtros after:/before: de Gmail,
+        con MARGEN_DIAS_QUERY días de margen a cada lado.
+        
+        Returns:
+            str: Filtros de fecha para la consulta, o None si no hay mes y año válidos
+        """
+        if not mes or mes == 'todos' or not año:
+            return None
+        try:
+            inicio = datetime(int(año), int(mes), 1)
+        except (TypeError, ValueError):
+            logger.warning(f"Mes/año inválidos para acotar la búsqueda: {mes}/{año}")
+            return None
+        
+        fin = datetime(inicio.year + 1, 1, 1) if inicio.month == 12 else datetime(inicio.year, inicio.month + 1, 1)
+        desde = inicio - timedelta(days=MARGEN_DIAS_QUERY)
+        hasta = fin + timedelta(days=MARGEN_DIAS_QUERY)
+        return f"after:{desde.strftime('%Y/%m/%d')} before:{hasta.strftime('%Y/%m/%d')}"
+    
+    def _preparsear_en_paralelo(self, correos, resultados_parseo, procesos, tamano_chunk):
+        """
+        Agrupa los correos en bloques, los parsea en un pool de procesos y guarda los
+        resultados en resultados_parseo antes de entregarlos, en el mismo orden, al
+        resto de la sincronización (que así no vuelve a parsearlos).
+        """
+        tamano_bloque = procesos * tamano_chunk * 4
+        
+        def parsear_bloque(pool, bloque):
+            pendientes = [
+                email for email in bloque
+                if email.get('id') is not None and email['id'] not in resultados_parseo
+                and REMITENTE_TRANSFERENCIAS in email.get('from', '')
+            ]
+            if pendientes:
+                for email, resultado in zip(pendientes, pool.parsear(pendientes)):
+                    resultados_parseo[email['id']] = resultado
+            return bloque
+        
+        with ParseoParalelo(procesos, tamano_chunk) as pool:
+            bloque = []
+            for email in correos:
+                bloque.append(email)
+                if len(bloque) >= tamano_bloque:
+                    yield from parsear_bloque(pool, bloque)
+                    bloque = []
+            if bloque:
+                yield from parsear_bloque(pool, bloque)
+    
+    def _parsear(self, email, resultados_parseo):
+        """
+        Parsea un correo una sola vez por sincronización.
         
         Args:
-            texto (str): Texto a normalizar
+            email (dict): Correo obtenido de Gmail
+            resultados_parseo (dict): Resultados ya calculados en esta sincronización, por id
             
         Returns:
-            str: Texto normalizado
+            dict: Datos de la transferencia, o None si no se pudieron extraer
         """
-        if not texto:
-            return ""
+        message_id = email.get('id')
+        if message_id is None:
+            return self.email_parser.parse_banco_chile_email(email)
         
-        # Paso 1: Convertir a minúsculas
-        texto = texto.lower()
+        if message_id not in resultados_parseo:
+            resultados_parseo[message_id] = self.email_parser.parse_banco_chile_email(email)
+        return resultados_parseo[message_id]
+    
+    def _coincide_mes(self, email, mes, resultados_parseo=None):
+        """
+        Indica si un correo corresponde al mes seleccionado, según su fecha de recepción
+        o, si no está disponible, según la fecha de la transferencia.
         
-        # Paso 2: Eliminar acentos y convertir a ASCII
-        texto = unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('ASCII')
+        Args:
+            email (dict): Correo obtenido de Gmail
+            mes (str): Mes seleccionado (formato: 01-12)
+            resultados_parseo (dict, optional): Resultados de parseo de la sincronización en curso
+            
+        Returns:
+            bool: True si el correo corresponde al mes
+        """
+        # Extraer la fecha de recepción del correo
+        if 'internalDate' in email:
+            try:
+                # internalDate es un timestamp en milisegundos
+                timestamp_ms = int(email['internalDate'])
+                fecha_recepcion = datetime.fromtimestamp(timestamp_ms/1000.0)
+                mes_recepcion = f"{fecha_recepcion.month:02d}"
+                
+                logger.debug("Correo recibido en fecha: %s, mes: %s", fecha_recepcion, mes_recepcion)
+                
+                # CORRECCIÓN: Mostrar detalles de la comparación para depuración
+                logger.debug("Comparando mes de recepción '%s' con mes seleccionado '%s'", mes_recepcion, mes)
+                
+                # Filtrar por mes de recepción
+                if mes_recepcion == mes:
+                    logger.debug("Correo coincide con el mes seleccionado: %s", mes)
+                    return True
+            except Exception as e:
+                logger.error(f"Error al procesar fecha de recepción: {str(e)}")
         
-        # Paso 3: Eliminar todos los caracteres que no sean letras o números
-        texto = re.sub(r'[^a-z0-9]', '', texto)
+        # Si no se pudo extraer la fecha de recepción, intentar con la fecha de la transferencia
+        transfer_data = self._parsear(email, resultados_parseo if resultados_parseo is not None else {})
+        if transfer_data and 'mes' in transfer_data:
+            mes_correo = f"{transfer_data['mes']:02d}"
+            logger.debug("Usando fecha de transferencia, mes: %s", mes_correo)
+            
+            # CORRECCIÓN: Mostrar detalles de la comparación para depuración
+            logger.debug("Comparando mes del correo '%s' con mes seleccionado '%s' (tipos: %s, %s)", mes_correo, mes, type(mes_correo), type(mes))
+            
+            if mes_correo == mes:
+                logger.debug("Correo coincide con el mes seleccionado por fecha de transferencia: %s", mes)
+                return True
+        
+        return False
+    
+    def normalizar_texto(self, texto):
+        """
+        Normalización de texto para comparación flexible.
         
-        return texto
+        Args:
+            texto (str): Texto a normalizar
+            
+        Returns:
+            str: Texto normalizado
+        """
+        return normalizar_texto(texto)
     
-    def _actualizar_pago_inquilino(self, transfer_data, mes_seleccionado=None, año_seleccionado=None):
+    def _actualizar_pago_inquilino(self, transfer_data, mes_seleccionado=None, año_seleccionado=None, detalle=None, indice=None, lote=None):
         """
         Actualiza el estado de pago de un inquilino basado en los datos de transferencia.
         
@@ -210,86 +537,74 @@ class SyncService:
             transfer_data (dict): Datos extraídos del correo de transferencia
             mes_seleccionado (str, optional): Mes seleccionado por el usuario (formato: 01-12)
             año_seleccionado (str, optional): Año seleccionado por el usuario (formato: YYYY)
+            detalle (dict, optional): Se completa con el resultado del matching: inquilino_id,
+                año y mes si hubo match, motivo si no lo hubo, y error=True si falló por un error
+            indice (IndiceInquilinos, optional): Índice de matching; si no se indica se usa obtener_indice()
+            lote (list, optional): Si se indica, el pago se añade a esta lista para escribirlo
+                después con Pago.registrar_lote(); si no, se registra y se hace commit aquí
             
         Returns:
             bool: True si se actualizó algún pago, False en caso contrario
         """
-        # Crear una nueva sesión para esta operación
-        session_created = False
+        if detalle is None:
+            detalle = {}
         
         try:
-            logger.info("==================== INICIANDO MATCHING DE INQUILINO ====================")
+            logger.debug("==================== INICIANDO MATCHING DE INQUILINO ====================")
             
             # Verificar que tenemos los datos necesarios
             if not transfer_data:
-                logger.warning("Datos de transferencia incompletos, no se puede actualizar pago")
+                logger.debug("Datos de transferencia incompletos, no se puede actualizar pago")
+                detalle['motivo'] = "Datos de transferencia incompletos"
                 return False
             
             # Obtener el nombre del emisor (quien hizo la transferencia)
             emisor = transfer_data.get('emisor', '').strip()
-            logger.info(f"Emisor original: '{emisor}'")
+            logger.debug("Emisor original: '%s'", emisor)
             
             if not emisor:
-                logger.warning("Emisor no encontrado en los datos de transferencia")
-                return False
-            
-            # Buscar inquilino por nombre con comparación más robusta
-            logger.info("Cargando todos los inquilinos de la base de datos para matching")
-            try:
-                inquilinos = Inquilino.query.all()
-                logger.info(f"Total de socios en base de datos: {len(inquilinos)}")
-            except SQLAlchemyError as e:
-                logger.error(f"Error al cargar inquilinos: {str(e)}")
+                logger.debug("Emisor no encontrado en los datos de transferencia")
+                detalle['motivo'] = "Emisor no encontrado en el correo"
                 return False
             
-            # Log de todos los inquilinos disponibles para matching
-            inquilinos_nombres = [i.propietario for i in inquilinos]
-            logger.info(f"Inquilinos disponibles para matching: {inquilinos_nombres}")
-            
-            inquilino_encontrado = None
+            # Índice con los nombres ya normalizados y agrupados por monto
+            if indice is None:
+                try:
+                    indice = obtener_indice()
+                except SQLAlchemyError as e:
+                    logger.error(f"Error al cargar inquilinos: {str(e)}")
+                    detalle['error'] = True
+                    return False
             
             # Normalizar el emisor
             emisor_norm = self.normalizar_texto(emisor)
-            logger.info(f"Emisor normalizado: '{emisor_norm}'")
+            logger.debug("Emisor normalizado: '%s'", emisor_norm)
             
             # Obtener el monto de la transferencia
             monto_transferencia = transfer_data.get('monto', 0)
-            logger.info(f"Monto de la transferencia: {monto_transferencia}")
+            logger.debug("Monto de la transferencia: %s", monto_transferencia)
             
-            logger.info("Iniciando proceso de comparación para matching")
-            # Intentar coincidencia por nombre normalizado (flexible)
-            for inquilino in inquilinos:
-                nombre_inquilino = inquilino.propietario
-                logger.info(f"Comparando con socio: '{nombre_inquilino}' (ID: {inquilino.id})")
-                
-                nombre_norm = self.normalizar_texto(nombre_inquilino)
-                logger.info(f"Nombre socio normalizado: '{nombre_norm}'")
-                
-                # Comparación flexible: verificar si una cadena está contenida en la otra
-                if nombre_norm in emisor_norm or emisor_norm in nombre_norm:
-                    logger.info(f"¡COINCIDENCIA DE NOMBRE! Socio encontrado: {inquilino.propietario}")
-                    
-                    # Verificar si el monto coincide (obligatorio)
-                    if float(inquilino.monto) == float(monto_transferencia):
-                        logger.info(f"¡COINCIDENCIA DE MONTO! Monto del socio: {inquilino.monto}, Monto de transferencia: {monto_transferencia}")
-                        inquilino_encontrado = inquilino
-                        break
-                    else:
-                        logger.warning(f"El monto de la transferencia ({monto_transferencia}) no coincide con el monto del socio ({inquilino.monto})")
+            # Coincidencia por similitud del nombre solo entre los inquilinos con el
+            # mismo monto: la coincidencia de monto es obligatoria
+            inquilino_encontrado, puntaje = indice.buscar(emisor, monto_transferencia)
+            detalle['puntaje'] = round(puntaje, 2)
+            if inquilino_encontrado:
+                logger.debug("¡COINCIDENCIA DE NOMBRE Y MONTO! Socio encontrado: %s, monto: %s, puntaje: %.2f", inquilino_encontrado.propietario, inquilino_encontrado.monto, puntaje)
             
             if not inquilino_encontrado:
-                logger.warning(f"NO SE ENCONTRÓ MATCH para el emisor: '{emisor}' con monto: {monto_transferencia}")
-                logger.info("==================== FIN DE MATCHING (SIN ÉXITO) ====================")
+                logger.debug("NO SE ENCONTRÓ MATCH para el emisor: '%s' con monto: %s", emisor, monto_transferencia)
+                logger.debug("==================== FIN DE MATCHING (SIN ÉXITO) ====================")
+                detalle['motivo'] = f"Sin inquilino para el emisor '{emisor}' con monto {monto_transferencia} (mejor puntaje {puntaje:.2f})"
                 return False
             
-            logger.info(f"MATCH EXITOSO: Emisor '{emisor}' coincide con inquilino '{inquilino_encontrado.propietario}' (ID: {inquilino_encontrado.id})")
+            logger.debug("MATCH EXITOSO: Emisor '%s' coincide con inquilino '%s' (ID: %s)", emisor, inquilino_encontrado.propietario, inquilino_encontrado.id)
             
             # Determinar el mes y año para la columna a actualizar
             if 'fecha' in transfer_data and isinstance(transfer_data['fecha'], datetime):
                 # Usar el mes y año de la transferencia
                 mes = transfer_data['fecha'].month
                 año = transfer_data['fecha'].year
-                logger.info(f"Usando fecha de transferencia: {mes}/{año}")
+                logger.debug("Usando fecha de transferencia: %s/%s", mes, año)
             else:
                 # Si no hay fecha en la transferencia, usar el mes y año seleccionados
                 # o el mes y año actuales como respaldo
@@ -304,56 +619,51 @@ class SyncService:
                     mes = datetime.now().month
                 
                 año = int(año_seleccionado) if año_seleccionado else datetime.now().year
-                logger.info(f"Usando fecha seleccionada/actual: {mes}/{año}")
+                logger.debug("Usando fecha seleccionada/actual: %s/%s", mes, año)
             
             # Formatear el mes con dos dígitos
             mes_str = f"{mes:02d}"
             
-            # Nombre de la columna a actualizar
+            # Nombre de la columna legada equivalente (clave que ve el frontend)
             columna = f"pago_{mes_str}_{año}"
-            logger.info(f"Columna a actualizar: '{columna}'")
+            logger.debug("Período a actualizar: '%s'", columna)
+            
+            pago = {
+                'inquilino_id': inquilino_encontrado.id,
+                'año': año,
+                'mes': mes,
+                'monto': monto_transferencia or None,
+                'comprobante': transfer_data.get('comprobante')
+            }
+            if lote is not None:
+                lote.append(pago)
+                logger.debug("Pago %s/%s de %s añadido al lote de la sincronización", mes_str, año, inquilino_encontrado.propietario)
+                logger.debug("==================== FIN DE MATCHING (EXITOSO) ====================")
+                detalle.update({'inquilino_id': inquilino_encontrado.id, 'año': año, 'mes': mes})
+                return True
             
-            # Verificar si la columna existe
+            # Registrar el pago en la tabla pagos (una fila por período, sin ALTER TABLE)
             try:
-                # Usar SQLAlchemy para actualizar la columna dinámicamente
-                # Primero verificar si la columna existe
-                inspector = db.inspect(db.engine)
-                columnas_existentes = [col['name'] for col in inspector.get_columns('inquilinos')]
-                
-                logger.info(f"Columnas existentes en la tabla: {columnas_existentes}")
-                
-                if columna not in columnas_existentes:
-                    logger.warning(f"La columna '{columna}' no existe en la tabla inquilinos")
-                    # Intentar crear la columna si no existe
-                    try:
-                        logger.info(f"Intentando crear la columna '{columna}'")
-                        query = text(f"ALTER TABLE inquilinos ADD COLUMN {columna} VARCHAR(20) NOT NULL DEFAULT 'No pagado'")
-                        db.session.execute(query)
-                        db.session.commit()
-                        logger.info(f"Columna '{columna}' creada correctamente")
-                    except Exception as e:
-                        logger.error(f"Error al crear la columna '{columna}': {str(e)}")
-                        return False
-                
-                # Actualizar el estado de pago en la columna correspondiente
-                logger.info(f"Actualizando columna '{columna}' a 'Pagado' para inquilino ID: {inquilino_encontrado.id}")
-                query = text(f"UPDATE inquilinos SET {columna} = 'Pagado' WHERE id = :id")
-                db.session.execute(query, {"id": inquilino_encontrado.id})
+                logger.debug("Registrando pago %s/%s como 'Pagado' para inquilino ID: %s", mes_str, año, inquilino_encontrado.id)
+                Pago.registrar(**pago)
                 db.session.commit()
                 
-                logger.info(f"ACTUALIZACIÓN EXITOSA: Estado de pago actualizado para {inquilino_encontrado.propietario} en columna {columna}")
-                logger.info("==================== FIN DE MATCHING (EXITOSO) ====================")
+                logger.debug("ACTUALIZACIÓN EXITOSA: Estado de pago actualizado para %s en columna %s", inquilino_encontrado.propietario, columna)
+                logger.debug("==================== FIN DE MATCHING (EXITOSO) ====================")
+                detalle.update({'inquilino_id': inquilino_encontrado.id, 'año': año, 'mes': mes})
                 return True
                 
             except Exception as e:
                 logger.error(f"Error al actualizar estado de pago: {str(e)}")
                 db.session.rollback()
-                logger.info("==================== FIN DE MATCHING (ERROR) ====================")
+                logger.debug("==================== FIN DE MATCHING (ERROR) ====================")
+                detalle['error'] = True
                 return False
                 
         except Exception as e:
             logger.error(f"Error en _actualizar_pago_inquilino: {str(e)}")
-            logger.info("==================== FIN DE MATCHING (ERROR) ====================")
+            logger.debug("==================== FIN DE MATCHING (ERROR) ====================")
+            detalle['error'] = True
             return False
     
     def get_last_sync(self):
@@ -387,14 +697,23 @@ class SyncService:
         """
         Procesa el callback de autorización de OAuth2 con Gmail.
         
+        Las credenciales se guardan cifradas en el servidor, asociadas a la dirección del
+        buzón; el frontend solo recibe la dirección.
+        
         Args:
             code (str): Código de autorización
             
         Returns:
-            dict: Credenciales de acceso
+            str: Dirección de correo de la cuenta autorizada
         """
         try:
-            return self.gmail_service.get_token(code)
+            credentials = self.gmail_service.get_token(code)
+            cuenta = self.gmail_service.get_perfil(credentials)['email']
+            credenciales_cuentas.registrar(cuenta, credentials)
+            db.session.commit()
+            logger.info(f"Credenciales guardadas para la cuenta {cuenta}")
+            return cuenta
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error en callback de autorización: {str(e)}")
             raise
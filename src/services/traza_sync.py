@@ -0,0 +1,170 @@
+"""
+Traza estructurada de las sincronizaciones.
+Por cada correo procesado se emite un único registro con los tiempos de cada etapa
+(descarga, parseo, matching), el resultado y el motivo, y al final un registro de
+resumen de la sincronización. Los registros se emiten en el logger de este módulo, en
+JSON, y también como atributo 'traza' del LogRecord para los handlers estructurados.
+
+El detalle por celda y por inquilino del parser y del matching queda en DEBUG. Con un
+muestreo menor que 1 solo una fracción de los correos (elegida de forma estable según
+su id) emite su registro y su detalle en DEBUG; el resumen de la sincronización se
+emite siempre.
+"""
+import os
+import json
+import zlib
+import logging
+import contextvars
+from time import perf_counter
+from contextlib import contextmanager
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Traza activada (SYNC_TRACE=0 la desactiva) y fracción de correos trazados (0 a 1)
+ACTIVADA = os.getenv('SYNC_TRACE', '1').lower() not in ('0', 'false', 'no')
+MUESTREO = float(os.getenv('SYNC_TRACE_SAMPLE', '1'))
+
+# Indica si el correo en curso está en la muestra (para el detalle en DEBUG)
+_correo_muestreado = contextvars.ContextVar('correo_muestreado', default=True)
+
+class FiltroMuestreo(logging.Filter):
+    """Descarta los registros DEBUG de los correos que no están en la muestra."""
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or _correo_muestreado.get()
+
+def instalar_filtro(*nombres):
+    """
+    Aplica el muestreo al detalle en DEBUG de los loggers indicados.
+    """
+    for nombre in nombres:
+        registro = logging.getLogger(nombre)
+        if not any(isinstance(filtro, FiltroMuestreo) for filtro in registro.filters):
+            registro.addFilter(FiltroMuestreo())
+
+def _en_muestra(message_id, muestreo):
+    if muestreo >= 1:
+        return True
+    if muestreo <= 0 or not message_id:
+        return False
+    # Estable: un mismo correo queda (o no) en la muestra en todas las sincronizaciones
+    return zlib.crc32(str(message_id).encode('utf-8')) % 10000 < muestreo * 10000
+
+def _ms(segundos):
+    return round(segundos * 1000, 2)
+
+def _emitir(registro):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("%s", json.dumps(registro, ensure_ascii=False, default=str), extra={'traza': registro})
+
+class TrazaCorreo:
+    """Registro de un correo: tiempos por etapa y resultado del procesamiento."""
+    def __init__(self, traza, message_id, descarga):
+        self.traza = traza
+        self.muestreado = _en_muestra(message_id, traza.muestreo)
+        self.tiempos = {'descarga': descarga}
+        self.campos = {'id': message_id}
+        self._token = _correo_muestreado.set(self.muestreado)
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = perf_counter()
+        try:
+            yield
+        finally:
+            self.tiempos[nombre] = self.tiempos.get(nombre, 0.0) + perf_counter() - inicio
+
+    def anotar(self, **campos):
+        self.campos.update(campos)
+
+    def cerrar(self):
+        _correo_muestreado.reset(self._token)
+        self.traza._acumular(self)
+        if self.traza.activa and self.muestreado:
+            _emitir(dict(
+                self.campos, traza='correo',
+                tiempos_ms={etapa: _ms(segundos) for etapa, segundos in self.tiempos.items()}
+            ))
+
+class TrazaSync:
+    """
+    Traza de una sincronización.
+
+    Uso:
+        traza = TrazaSync(muestreo=0.1)
+        for email in traza.medir_descarga(correos):
+            correo = traza.correo(email['id'])
+            with correo.etapa('parseo'):
+                ...
+            correo.anotar(resultado='pagado')
+            correo.cerrar()
+        traza.resumen(modo='completo')
+    """
+    def __init__(self, muestreo=None, activa=None):
+        self.activa = ACTIVADA if activa is None else activa
+        self.muestreo = MUESTREO if muestreo is None else muestreo
+        self.inicio = perf_counter()
+        self.tiempos = {}
+        self.resultados = {}
+        self._descarga_pendiente = 0.0
+
+    def medir_descarga(self, correos):
+        """
+        Recorre los correos midiendo el tiempo de espera de cada uno (descarga o lectura
+        de la caché); el tiempo se asigna al siguiente correo que se abra con correo().
+        """
+        iterador = iter(correos)
+        while True:
+            inicio = perf_counter()
+            try:
+                email = next(iterador)
+            except StopIteration:
+                self._sumar('descarga', perf_counter() - inicio)
+                return
+            espera = perf_counter() - inicio
+            self._sumar('descarga', espera)
+            self._descarga_pendiente += espera
+            yield email
+
+    def correo(self, message_id):
+        """
+        Abre el registro de un correo. Hay que cerrarlo con cerrar().
+        """
+        correo = TrazaCorreo(self, message_id, self._descarga_pendiente)
+        self._descarga_pendiente = 0.0
+        return correo
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = perf_counter()
+        try:
+            yield
+        finally:
+            self._sumar(nombre, perf_counter() - inicio)
+
+    def _sumar(self, etapa, segundos):
+        self.tiempos[etapa] = self.tiempos.get(etapa, 0.0) + segundos
+
+    def _acumular(self, correo):
+        for etapa, segundos in correo.tiempos.items():
+            if etapa != 'descarga':  # ya sumada en medir_descarga
+                self._sumar(etapa, segundos)
+        resultado = correo.campos.get('resultado')
+        if resultado:
+            self.resultados[resultado] = self.resultados.get(resultado, 0) + 1
+
+    def resumen(self, **campos):
+        """
+        Emite el registro de resumen de la sincronización.
+
+        Returns:
+            dict: Registro emitido (o que se habría emitido si la traza está desactivada)
+        """
+        tiempos = dict(self.tiempos, total=perf_counter() - self.inicio)
+        registro = dict(
+            campos, traza='sync', muestreo=self.muestreo, resultados=self.resultados,
+            tiempos_ms={etapa: _ms(segundos) for etapa, segundos in tiempos.items()}
+        )
+        if self.activa:
+            _emitir(registro)
+        return registro
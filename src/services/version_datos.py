@@ -0,0 +1,58 @@
+"""
+Versión barata de los datos de inquilinos y pagos, usada para ETag / If-None-Match.
+Se calcula con agregados (max/count) en lugar de serializar el contenido.
+"""
+import hashlib
+from flask import request, make_response
+from sqlalchemy import func
+from src.models.database import db
+from src.models.inquilino import Inquilino, obtener_columnas_pago
+from src.models.pago import Pago
+from src.models.configuracion import Configuracion
+
+def calcular_version():
+    """
+    Calcula la versión actual de los datos.
+
+    Combina max(ultima_actualizacion) y el número de inquilinos, el equivalente para la
+    tabla pagos (registrar un pago no modifica la fila del inquilino), la fecha de
+    la última sincronización y las columnas pago_* legadas.
+
+    Returns:
+        str: Cadena que cambia cada vez que cambian los datos
+    """
+    max_inquilinos, total_inquilinos = db.session.query(
+        func.max(Inquilino.ultima_actualizacion), func.count(Inquilino.id)
+    ).one()
+    max_pagos, total_pagos = db.session.query(
+        func.max(Pago.fecha_actualizacion), func.count(Pago.id)
+    ).one()
+    ultima_sync = db.session.query(Configuracion.valor).filter_by(clave="ultima_sincronizacion").scalar()
+
+    return '|'.join(str(parte) for parte in (
+        max_inquilinos, total_inquilinos, max_pagos, total_pagos, ultima_sync, len(obtener_columnas_pago())
+    ))
+
+def calcular_etag(*partes):
+    """
+    Genera un ETag a partir de la versión de los datos y de partes adicionales
+    (por ejemplo la ruta y los filtros de la consulta).
+
+    Returns:
+        str: Valor del ETag (sin comillas)
+    """
+    contenido = '|'.join([calcular_version()] + [str(parte) for parte in partes])
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+def respuesta_no_modificada(etag):
+    """
+    Devuelve una respuesta 304 si el cliente ya tiene la versión indicada por el ETag.
+
+    Returns:
+        Response | None: Respuesta 304, o None si hay que generar el cuerpo completo
+    """
+    if etag in request.if_none_match:
+        respuesta = make_response('', 304)
+        respuesta.set_etag(etag)
+        return respuesta
+    return None
@@ -30,10 +30,11 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('mes').value = mesGuardado;
     }
 
-    // Verificar si hay credenciales en la URL (después de la autenticación de Google)
+    // Verificar si volvemos de la autenticación de Google: las credenciales quedan en el
+    // servidor y la URL solo trae la cuenta autorizada
     const urlParams = new URLSearchParams(window.location.search);
-    const credentials = urlParams.get('credentials');
-    if (credentials) {
+    const cuenta = urlParams.get('cuenta');
+    if (cuenta) {
         // Limpiar la URL
         window.history.replaceState({}, document.title, window.location.pathname);
 
@@ -44,18 +45,13 @@ document.addEventListener('DOMContentLoaded', function() {
             document.getElementById('mes').value = mesGuardado;
         }
 
-        // Sincronizar correos con las credenciales obtenidas
-        try {
-            const credentialsObj = JSON.parse(decodeURIComponent(credentials));
-            sincronizarCorreosAutenticado(credentialsObj);
-        } catch (error) {
-            console.error('Error al procesar credenciales:', error);
-            alert('Error al procesar la autenticación. Por favor, intenta de nuevo.');
-        }
+        // Recordar la cuenta para no volver a pedir autorización y sincronizar
+        localStorage.setItem('cuentaGmail', cuenta);
+        sincronizarCorreosAutenticado(cuenta);
     }
 
     // Cargar la fecha de última sincronización desde el servidor
-    fetch('/api/sync/last')
+    fetch('/api/sync/last', { cache: 'no-cache' })
         .then(response => response.json())
         .then(data => {
             if (data.last_sync && data.last_sync.fecha_sincronizacion) {
@@ -113,16 +109,15 @@ function toggleMenu() {
 
 // Cargar inquilinos desde la API
 function cargarInquilinos() {
-    // Añadir timestamp para evitar caché
-    const timestamp = new Date().getTime();
-    
+    // 'no-cache' obliga a revalidar con el servidor (If-None-Match): si los datos
+    // no cambiaron, el servidor responde 304 y se reutiliza la copia en caché
     // Mostrar indicador de carga pero mantener la tabla visible
     const tbody = document.getElementById('inquilinos-body');
     if (tbody && tbody.innerHTML === '') {
         tbody.innerHTML = '<tr><td colspan="6" style="text-align: center;">Cargando datos...</td></tr>';
     }
     
-    fetch(`/api/inquilinos/?t=${timestamp}`)
+    fetch('/api/inquilinos/', { cache: 'no-cache' })
         .then(response => response.json())
         .then(data => {
             inquilinos = data;
@@ -267,7 +262,19 @@ function sincronizarCorreos() {
     // Guardar el mes seleccionado antes de sincronizar
     mesSeleccionadoAntesDeSincronizar = document.getElementById('mes').value;
     localStorage.setItem('mesSeleccionado', mesSeleccionadoAntesDeSincronizar);
-    
+
+    // Si ya se autorizó una cuenta, el servidor tiene sus credenciales
+    const cuenta = localStorage.getItem('cuentaGmail');
+    if (cuenta) {
+        sincronizarCorreosAutenticado(cuenta);
+        return;
+    }
+
+    autorizarGmail();
+}
+
+// Función para autorizar el acceso a Gmail (redirige a Google y vuelve con la cuenta)
+function autorizarGmail() {
     // Mostrar modal de autenticación de Google
     const modal = document.getElementById('modal-google-auth');
     modal.style.display = 'block';
@@ -286,8 +293,8 @@ function sincronizarCorreos() {
         });
 }
 
-// Función para sincronizar correos después de la autenticación
-function sincronizarCorreosAutenticado(credentials) {
+// Función para sincronizar correos de una cuenta ya autorizada
+function sincronizarCorreosAutenticado(cuenta) {
     // Mostrar indicador de carga
     document.getElementById('sincronizar-correos-btn').textContent = 'Sincronizando...';
     document.getElementById('sincronizar-correos-btn').disabled = true;
@@ -319,13 +326,35 @@ function sincronizarCorreosAutenticado(credentials) {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify({
-            credentials: credentials,
+            cuenta: cuenta,
             mes: mesSeleccionado !== 'todos' ? mesSeleccionado : null,
             año: añoActual.toString() // Incluir el año actual
         })
     })
     .then(response => response.json())
     .then(data => {
+        // El servidor no tiene credenciales válidas para la cuenta: volver a autorizar
+        if (data.requiere_autorizacion) {
+            localStorage.removeItem('cuentaGmail');
+            document.getElementById('sincronizar-correos-btn').textContent = 'Sincronizar Correos';
+            document.getElementById('sincronizar-correos-btn').disabled = false;
+            cargarInquilinos();
+            autorizarGmail();
+            return null;
+        }
+
+        // La sincronización se ejecuta en segundo plano: esperar a que termine el trabajo
+        // (si ya había una en curso, el servidor devuelve su id y se espera esa)
+        if (data.job_id) {
+            return esperarTrabajoSync(data.job_id);
+        }
+        return data;
+    })
+    .then(data => {
+        if (!data) {
+            return;
+        }
+
         // Actualizar la fecha de sincronización con la fecha real de la API
         if (data.fecha_sincronizacion) {
             // Usar la función de formateo para hora chilena
@@ -341,8 +370,7 @@ function sincronizarCorreosAutenticado(credentials) {
         document.getElementById('sincronizar-correos-btn').disabled = false;
         
         // Recargar inmediatamente los datos actualizados
-        const timestamp = new Date().getTime();
-        fetch(`/api/inquilinos/?t=${timestamp}`)
+        fetch('/api/inquilinos/', { cache: 'no-cache' })
             .then(response => response.json())
             .then(data => {
                 inquilinos = data;
@@ -376,6 +404,32 @@ function sincronizarCorreosAutenticado(credentials) {
     });
 }
 
+// Consulta periódicamente el estado de una sincronización en segundo plano hasta que termine
+function esperarTrabajoSync(jobId) {
+    return new Promise((resolve, reject) => {
+        const consultar = () => {
+            fetch(`/api/sync/jobs/${jobId}`, { cache: 'no-cache' })
+                .then(response => response.json())
+                .then(job => {
+                    if (job.estado === 'completado' || job.estado === 'error') {
+                        resolve(job);
+                        return;
+                    }
+                    if (!job.estado) {
+                        reject(new Error(job.mensaje || 'Sincronización no encontrada'));
+                        return;
+                    }
+                    // Mostrar el progreso en el botón mientras tanto
+                    document.getElementById('sincronizar-correos-btn').textContent =
+                        `Sincronizando... (${job.emails_procesados} correos)`;
+                    setTimeout(consultar, 2000);
+                })
+                .catch(reject);
+        };
+        consultar();
+    });
+}
+
 // Función para cambiar el mes seleccionado
 function cambiarMes() {
     const mesSeleccionado = document.getElementById('mes').value;
@@ -439,10 +493,9 @@ function cambiarMes() {
         }
     }
     
-    // Añadir timestamp para evitar caché
-    const timestamp = new Date().getTime();
-    
-    fetch(`/api/inquilinos/?t=${timestamp}`)
+    // 'no-cache' obliga a revalidar con el servidor (If-None-Match): si los datos
+    // no cambiaron, el servidor responde 304 y se reutiliza la copia en caché
+    fetch('/api/inquilinos/', { cache: 'no-cache' })
         .then(response => response.json())
         .then(data => {
             inquilinos = data;
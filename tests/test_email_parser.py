@@ -0,0 +1,54 @@
+"""
+Pruebas del parseo de correos: ParseoParalelo debe dar los mismos resultados que el parseo en serie.
+"""
+import base64
+import pytest
+from src.services.email_parser import EmailParser, ParseoParalelo
+
+REMITENTE = 'Banco <serviciodetransferencias@bancochile.cl>'
+
+# lxml no acepta cadenas con declaración de codificación: fuerza el respaldo con BeautifulSoup
+DECLARACION_XML = '<?xml version="1.0" encoding="utf-8"?>'
+
+def _html(nombre, fecha, monto, comprobante):
+    return f"""<html><body><table><tr><td>Estimado(a): <b>Diego T</b></td></tr>
+<tr><td>Te informamos que nuestro(a) cliente <b>{nombre}</b> ha efectuado una transferencia de fondos a tu cuenta</td></tr>
+<tr><td><table><tr><td>Fecha</td><td>{fecha}</td></tr><tr><td>Monto</td><td>${monto}</td></tr>
+<tr><td>Rut</td><td>1-9</td></tr><tr><td>Email</td><td>a@b.cl</td></tr>
+<tr><td>Número de comprobante</td><td>{comprobante}</td></tr></table></td></tr></table></body></html>"""
+
+def _correo(message_id, html, remitente=REMITENTE):
+    return {
+        'id': message_id,
+        'from': remitente,
+        'body': base64.urlsafe_b64encode(html.encode('utf-8')).decode('ascii')
+    }
+
+def _correos():
+    correos = [
+        _correo(f'm{i}', _html(f'CLIENTE {i}', f'{(i % 28) + 1:02d}/03/2026', f'{(i + 1) * 1000:,}'.replace(',', '.'), f'TEF{i}'))
+        for i in range(20)
+    ]
+    correos[3] = _correo('otro', _html('X', '01/03/2026', '1.000', 'TEF'), remitente='otro@ejemplo.cl')
+    correos[7] = _correo('vacio', '<html><body>sin datos</body></html>')
+    correos[11] = _correo('respaldo', DECLARACION_XML + _html('MARIA SOTO', '15/03/2026', '250.000', 'TEF11'))
+    return correos
+
+def test_correo_de_respaldo_no_lo_resuelve_lxml():
+    html = DECLARACION_XML + _html('MARIA SOTO', '15/03/2026', '250.000', 'TEF11')
+    assert EmailParser()._extraer_con_lxml(html) is None
+    assert EmailParser().parse_banco_chile_email(_correo('respaldo', html))['emisor'] == 'MARIA SOTO'
+
+@pytest.mark.parametrize('tamano_chunk', [1, 8])
+def test_paralelo_igual_que_en_serie(tamano_chunk):
+    correos = _correos()
+    parser = EmailParser()
+    en_serie = [parser.parse_banco_chile_email(correo) for correo in correos]
+
+    with ParseoParalelo(procesos=2, tamano_chunk=tamano_chunk) as pool:
+        en_paralelo = pool.parsear(correos)
+
+    assert en_paralelo == en_serie
+    assert [r['comprobante'] if r else None for r in en_paralelo][:4] == ['TEF0', 'TEF1', 'TEF2', None]
+    assert en_paralelo[7] is None
+    assert en_paralelo[11]['emisor'] == 'MARIA SOTO' and en_paralelo[11]['monto'] == 250000
@@ -0,0 +1,116 @@
+"""
+Pruebas sin conexión de la descarga de mensajes por batch (HttpMockSequence).
+"""
+import json
+import pytest
+from googleapiclient.http import HttpMockSequence
+from src.services import gmail_service_real
+from src.services.email_cache import EmailCache
+from src.services.gmail_service_real import GmailServiceReal
+
+REMITENTE = 'Banco <serviciodetransferencias@bancochile.cl>'
+
+def _mensaje(message_id):
+    return {
+        'id': message_id,
+        'internalDate': '1780000000000',
+        'payload': {
+            'headers': [{'name': 'From', 'value': REMITENTE}, {'name': 'Subject', 'value': 'Transferencia'}],
+            'body': {'data': 'PGh0bWw+PC9odG1sPg=='}
+        }
+    }
+
+def _respuesta_lista(*ids):
+    return ({'status': '200'}, json.dumps({'messages': [{'id': message_id} for message_id in ids]}))
+
+def _respuesta_batch(*partes):
+    """
+    Respuesta multipart de un batch. Cada parte es (id, estado HTTP).
+    """
+    cuerpo = ''
+    for message_id, estado in partes:
+        contenido = json.dumps(_mensaje(message_id) if estado == 200 else {'error': {'code': estado, 'message': 'error'}})
+        cuerpo += '\r\n'.join([
+            '--lote',
+            'Content-Type: application/http',
+            'Content-Transfer-Encoding: binary',
+            f'Content-ID: <response-x + {message_id}>',
+            '',
+            f'HTTP/1.1 {estado} Estado',
+            'Content-Type: application/json',
+            f'Content-Length: {len(contenido)}',
+            '',
+            contenido,
+            ''
+        ])
+    cuerpo += '--lote--'
+    return ({'status': '200', 'content-type': 'multipart/mixed; boundary=lote'}, cuerpo)
+
+class HttpRegistrado(HttpMockSequence):
+    """HttpMockSequence que guarda la URI y el cuerpo de cada petición."""
+    def __init__(self, respuestas):
+        super().__init__(respuestas)
+        self.peticiones = []
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        self.peticiones.append((uri, body))
+        return super().request(uri, method, body, headers, *args, **kwargs)
+
+    def batches(self):
+        """Cuerpos de las peticiones batch, en orden."""
+        return [body for uri, body in self.peticiones if uri.endswith('/batch')]
+
+@pytest.fixture
+def gmail(monkeypatch):
+    monkeypatch.setattr(gmail_service_real, 'ESPERA_REINTENTO_BATCH', 0)
+    servicio = GmailServiceReal()
+    servicio.cache = EmailCache(directorio='')
+    return servicio
+
+def test_batch_descarga_todos_los_mensajes(gmail):
+    http = HttpMockSequence([
+        _respuesta_lista('m1', 'm2'),
+        _respuesta_batch(('m1', 200), ('m2', 200)),
+    ])
+    fallidos = []
+
+    correos = list(gmail.iter_emails({}, http=http, concurrencia=1, fallidos=fallidos))
+
+    assert [correo['id'] for correo in correos] == ['m1', 'm2']
+    assert correos[0]['from'] == REMITENTE
+    assert fallidos == []
+
+def test_batch_reintenta_los_mensajes_que_fallan(gmail):
+    http = HttpRegistrado([
+        _respuesta_lista('m1', 'm2', 'm3'),
+        _respuesta_batch(('m1', 200), ('m2', 429), ('m3', 503)),
+        _respuesta_batch(('m2', 200), ('m3', 200)),
+    ])
+    fallidos = []
+
+    correos = list(gmail.iter_emails({}, http=http, concurrencia=1, fallidos=fallidos))
+
+    assert [correo['id'] for correo in correos] == ['m1', 'm2', 'm3']
+    assert fallidos == []
+    # El segundo batch pide solo los mensajes que fallaron
+    batches = http.batches()
+    assert len(batches) == 2
+    assert 'm2' in batches[1] and 'm3' in batches[1] and 'm1' not in batches[1]
+
+def test_batch_informa_los_mensajes_que_siguen_fallando(gmail, monkeypatch):
+    monkeypatch.setattr(gmail_service_real, 'REINTENTOS_BATCH', 1)
+    http = HttpRegistrado([
+        _respuesta_lista('m1', 'm2', 'm3'),
+        _respuesta_batch(('m1', 200), ('m2', 500), ('m3', 404)),
+        _respuesta_batch(('m2', 500)),
+    ])
+    fallidos = []
+
+    correos = list(gmail.iter_emails({}, http=http, concurrencia=1, fallidos=fallidos))
+
+    # Un mensaje borrado (404) se omite sin reintentar ni contarlo como fallido
+    assert [correo['id'] for correo in correos] == ['m1']
+    assert fallidos == ['m2']
+    batches = http.batches()
+    assert len(batches) == 2
+    assert 'm2' in batches[1] and 'm3' not in batches[1]
@@ -0,0 +1,54 @@
+"""
+Pruebas del matching de nombres del índice de inquilinos.
+"""
+import pytest
+from src.services.indice_inquilinos import IndiceInquilinos, coincide_con_iniciales, palabras_nombre
+
+INQUILINOS = [
+    (1, 'Juan Pérez', 100000),
+    (2, 'María José Soto', 250000),
+    (3, 'Pablo Soto', 50000),
+]
+
+@pytest.fixture
+def indice():
+    return IndiceInquilinos(INQUILINOS, umbral=0.7)
+
+@pytest.mark.parametrize('emisor, monto, esperado', [
+    ('J Perez', 100000, 1),
+    ('JUAN P.', 100000, 1),
+    ('Perez J', 100000, 1),
+    ('M J Soto', 250000, 2),
+    ('M. Jose Soto', 250000, 2),
+])
+def test_acepta_nombres_abreviados(indice, emisor, monto, esperado):
+    entrada, puntaje = indice.buscar(emisor, monto)
+    assert entrada is not None and entrada.id == esperado
+    assert puntaje >= 0.7
+
+@pytest.mark.parametrize('emisor, monto, esperado', [
+    ('PEREZ JUAN', 100000, 1),
+    ('Soto María José', 250000, 2),
+])
+def test_acepta_nombres_en_otro_orden(indice, emisor, monto, esperado):
+    entrada, puntaje = indice.buscar(emisor, monto)
+    assert entrada is not None and entrada.id == esperado
+    assert puntaje == 1.0
+
+@pytest.mark.parametrize('emisor, monto', [
+    ('M Perez', 100000),     # la inicial no corresponde
+    ('J Pereira', 100000),   # el apellido no coincide
+    ('Pedro Soto', 50000),   # otro nombre con el mismo apellido
+    ('J P', 100000),         # solo iniciales
+])
+def test_rechaza_casi_coincidencias(indice, emisor, monto):
+    entrada, puntaje = indice.buscar(emisor, monto)
+    assert entrada is None
+    assert puntaje < 0.7
+
+def test_el_monto_debe_coincidir(indice):
+    assert indice.buscar('Juan Perez', 99999) == (None, 0.0)
+
+def test_cada_inicial_usa_una_palabra_distinta():
+    assert coincide_con_iniciales(palabras_nombre('J J Perez'), palabras_nombre('Juan Jose Perez'))
+    assert not coincide_con_iniciales(palabras_nombre('J J Perez'), palabras_nombre('Juan Perez'))